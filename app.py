@@ -2,61 +2,63 @@
 Gradio App for Car Brand Detection System
 """
 
-import gradio as gr
-import os
-import torch
-from scripts.scrapper import scrape_flickr_simple
-from app.predictor import predict_brands
-from visualize.plot import create_brand_chart
-from PIL import Image
+from app.startup import get_startup_profile, start_warmup
 
-# Create necessary directories
-os.makedirs('static/raw_images', exist_ok=True)
+# torch, the scraper and matplotlib are imported lazily (or by the
+# background warm-up) so the UI comes up without waiting for them
+with get_startup_profile().phase('import gradio'):
+    import gradio as gr
 
 def scrape_and_analyze(num_images):
     """
-    Scrape images and analyze brands
+    Scrape images and analyze brands, streaming live counts
+    as each micro-batch is classified
     """
     try:
+        import io
+        from PIL import Image
+        from scripts.scrapper import iter_flickr_images
+        from app.pipeline import stream_predictions, format_brand_counts
+        from app.scheduler import get_scheduler
+        from visualize.plot import render_chart
+        
         # Validate input
         if num_images < 10 or num_images > 50:
-            return "❌ Please enter a number between 10 and 50", None
+            yield "❌ Please enter a number between 10 and 50", None
+            return
         
-        # Step 1: Scrape images
-        status = f"🔄 Scraping {num_images} images..."
+        # Scrape and classify images as they arrive
+        status = f"🔄 Scraping and analyzing {num_images} images..."
         yield status, None
         
-        images_scraped = scrape_flickr_simple(
+        images = ((result.url, result.content) for result in iter_flickr_images(
             url="https://www.flickr.com/groups/carexpressions/pool/",
-            save_dir="static/raw_images",
             limit=num_images
-        )
-        
-        if images_scraped == 0:
-            return "❌ No images could be scraped. Please try again.", None
-        
-        # Step 2: Predict brands
-        status = f"✓ Scraped {images_scraped} images\n🔄 Analyzing brands..."
-        yield status, None
+        ))
         
-        brand_counts = predict_brands('static/raw_images')
+        brand_counts = {}
+        analyzed = 0
+        for brand_counts, batch_results in stream_predictions(images, scheduler=get_scheduler()):
+            analyzed += len(batch_results)
+            status = (f"🔄 Analyzed {analyzed}/{num_images} images...\n\n"
+                      f"📊 Brand Distribution so far:\n{format_brand_counts(brand_counts)}")
+            yield status, None
         
         if not brand_counts:
-            return "❌ Could not detect any brands.", None
+            yield "❌ No images could be scraped or classified. Please try again.", None
+            return
         
-        # Step 3: Create chart
-        chart_path = "static/brand_chart.png"
-        create_brand_chart(brand_counts, chart_path)
+        # Rendered in memory, so concurrent users never share a chart file
+        chart = Image.open(io.BytesIO(render_chart(brand_counts)))
         
         # Prepare results text
         results = f"✅ Analysis Complete!\n\n📊 Brand Distribution:\n"
-        for brand, count in sorted(brand_counts.items(), key=lambda x: x[1], reverse=True):
-            results += f"  • {brand.capitalize()}: {count}\n"
+        results += format_brand_counts(brand_counts) + "\n"
         
-        return results, chart_path
+        yield results, chart
         
     except Exception as e:
-        return f"❌ Error: {str(e)}", None
+        yield f"❌ Error: {str(e)}", None
 
 # Create Gradio Interface
 with gr.Blocks(theme=gr.themes.Soft(), title="🚗 Car Brand Detection") as demo:
@@ -94,7 +96,7 @@ with gr.Blocks(theme=gr.themes.Soft(), title="🚗 Car Brand Detection") as demo
     
     chart_output = gr.Image(
         label="📊 Brand Distribution Chart",
-        type="filepath"
+        type="pil"
     )
     
     # Connect button to function
@@ -114,4 +116,6 @@ with gr.Blocks(theme=gr.themes.Soft(), title="🚗 Car Brand Detection") as demo
 
 # Launch the app
 if __name__ == "__main__":
+    # Import torch and load the model in the background while the UI starts
+    start_warmup()
     demo.launch()
@@ -0,0 +1,317 @@
+"""
+Inference backends for CPU serving
+Wraps the eager MobileNetV2 as TorchScript, int8 quantized or ONNX Runtime
+variants behind one callable interface: backend(batch) -> logits
+"""
+
+import copy
+import io
+import os
+import time
+
+import torch
+import torch.nn as nn
+
+try:
+    import onnxruntime
+except ImportError:  # optional dependency
+    onnxruntime = None
+
+BACKENDS = ('eager', 'torchscript', 'dynamic_int8', 'static_int8', 'onnx')
+
+# Which backend CarBrandPredictor uses unless told otherwise
+DEFAULT_BACKEND = os.environ.get('INFERENCE_BACKEND', 'eager')
+
+# Directory of representative images static_int8 is calibrated on
+CALIBRATION_DIR = os.environ.get('CALIBRATION_DIR')
+# Calibration images used at most (sorted by name)
+DEFAULT_CALIBRATION_IMAGES = int(os.environ.get('CALIBRATION_IMAGES', 64))
+
+INPUT_SHAPE = (3, 224, 224)
+
+
+class EagerBackend:
+    """Plain fp32 PyTorch module"""
+
+    name = 'eager'
+
+    def __init__(self, model, device):
+        self.model = model
+        self.device = device
+
+    def __call__(self, batch):
+        with torch.inference_mode():
+            return self.model(batch.to(self.device))
+
+
+class TorchScriptBackend(EagerBackend):
+    """Traced, frozen and inference-optimized TorchScript graph"""
+
+    name = 'torchscript'
+
+    def __init__(self, model, device):
+        example = torch.zeros(1, *INPUT_SHAPE, device=device)
+        with torch.no_grad():
+            traced = torch.jit.trace(model.eval(), example)
+            frozen = torch.jit.freeze(traced)
+            try:
+                frozen = torch.jit.optimize_for_inference(frozen)
+            except Exception as e:
+                print(f"TorchScript optimize_for_inference skipped: {e}")
+        super().__init__(frozen, device)
+
+
+class DynamicQuantBackend(EagerBackend):
+    """Dynamic int8 quantization of the Linear layers (CPU only)"""
+
+    name = 'dynamic_int8'
+
+    def __init__(self, model, device):
+        cpu_model = _copy_to_cpu(model)
+        quantized = torch.ao.quantization.quantize_dynamic(
+            cpu_model, {nn.Linear}, dtype=torch.qint8
+        )
+        super().__init__(quantized, torch.device('cpu'))
+
+
+def load_calibration_batches(directory, count=DEFAULT_CALIBRATION_IMAGES, batch_size=8):
+    """
+    Preprocess images from a directory for static quantization
+
+    Args:
+        directory: Directory of representative (real, in-distribution) images
+        count: Images used at most
+        batch_size: Images per calibration batch
+
+    Returns:
+        List of Nx3x224x224 tensors
+
+    Raises:
+        ValueError: If the directory holds no readable images
+    """
+    from app.preprocess import load_image_tensor
+
+    try:
+        names = sorted(f for f in os.listdir(directory)
+                       if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+    except OSError as e:
+        raise ValueError(f"Can't read calibration directory {directory}: {e}")
+
+    tensors = [t for t in (load_image_tensor(os.path.join(directory, name))
+                           for name in names[:count]) if t is not None]
+    if not tensors:
+        raise ValueError(f"No readable calibration images in {directory}")
+    return list(torch.stack(tensors).split(batch_size))
+
+
+def check_backend(name, calibration_dir=None):
+    """
+    Refuse a backend that can't be built from its configuration
+
+    static_int8 needs real calibration images: activation ranges measured
+    on noise give a model that is fast and wrong.
+
+    Raises:
+        ValueError: For an unknown backend, or static_int8 without a
+            calibration directory (argument or CALIBRATION_DIR)
+    """
+    if name not in _BACKEND_CLASSES:
+        raise ValueError(f"Unknown backend '{name}', expected one of {BACKENDS}")
+    if name == 'static_int8' and not (calibration_dir or CALIBRATION_DIR):
+        raise ValueError("static_int8 needs calibration images; set CALIBRATION_DIR "
+                         "to a directory of representative car photos")
+
+
+class StaticQuantBackend(EagerBackend):
+    """
+    Static int8 quantization using torchvision's quantizable MobileNetV2
+    (fused conv-bn-relu, QuantStub/DeQuantStub - also the starting point
+    for quantization-aware training). CPU only.
+
+    Calibrated on the given batches, else on the images in
+    calibration_dir (default CALIBRATION_DIR); refuses to build with
+    neither.
+    """
+
+    name = 'static_int8'
+
+    def __init__(self, model, device, calibration_batches=None, calibration_dir=None):
+        from torchvision.models import quantization as qmodels
+
+        if not calibration_batches:
+            check_backend(self.name, calibration_dir)
+            calibration_batches = load_calibration_batches(calibration_dir or CALIBRATION_DIR)
+
+        engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'fbgemm'
+        torch.backends.quantized.engine = engine
+
+        qmodel = qmodels.mobilenet_v2(weights=None, quantize=False)
+        qmodel.classifier[1] = nn.Linear(qmodel.last_channel, model.classifier[1].out_features)
+        qmodel.load_state_dict(_copy_to_cpu(model).state_dict())
+        qmodel.eval()
+        qmodel.fuse_model(is_qat=False)
+
+        qmodel.qconfig = torch.ao.quantization.get_default_qconfig(engine)
+        torch.ao.quantization.prepare(qmodel, inplace=True)
+
+        with torch.inference_mode():
+            for batch in calibration_batches:
+                qmodel(batch.cpu())
+
+        torch.ao.quantization.convert(qmodel, inplace=True)
+        super().__init__(qmodel, torch.device('cpu'))
+
+
+class OnnxBackend:
+    """
+    ONNX export executed with ONNX Runtime (requires onnxruntime)
+
+    The model is exported in memory unless onnx_path asks for a file to
+    keep, so reloads and worker processes leave nothing behind.
+    """
+
+    name = 'onnx'
+
+    def __init__(self, model, device, onnx_path=None):
+        if onnxruntime is None:
+            raise ImportError("onnxruntime is not installed; pip install onnxruntime "
+                              "to use the 'onnx' backend")
+
+        target = onnx_path if onnx_path is not None else io.BytesIO()
+        cpu_model = _copy_to_cpu(model)
+        torch.onnx.export(
+            cpu_model, torch.zeros(1, *INPUT_SHAPE), target,
+            input_names=['input'], output_names=['logits'],
+            dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+            opset_version=17
+        )
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            onnx_path if onnx_path is not None else target.getvalue(),
+            options, providers=['CPUExecutionProvider']
+        )
+        self.onnx_path = onnx_path
+
+    def __call__(self, batch):
+        outputs = self.session.run(None, {'input': batch.detach().cpu().numpy()})
+        return torch.from_numpy(outputs[0])
+
+
+_BACKEND_CLASSES = {
+    'eager': EagerBackend,
+    'torchscript': TorchScriptBackend,
+    'dynamic_int8': DynamicQuantBackend,
+    'static_int8': StaticQuantBackend,
+    'onnx': OnnxBackend,
+}
+
+
+def _copy_to_cpu(model):
+    """Deep copy of a module on the CPU in eval mode"""
+    return copy.deepcopy(model).cpu().eval()
+
+
+def build_backend(name, model, device, **kwargs):
+    """
+    Wrap an eager model in the requested inference backend
+
+    Args:
+        name: One of BACKENDS
+        model: Loaded eager MobileNetV2 in eval mode
+        device: Device of the eager model
+        **kwargs: Backend-specific options (calibration_batches,
+            calibration_dir, onnx_path)
+
+    Returns:
+        Callable mapping an Nx3x224x224 batch to Nx(num classes) logits
+
+    Raises:
+        ValueError: See check_backend()
+    """
+    if name not in _BACKEND_CLASSES:
+        raise ValueError(f"Unknown backend '{name}', expected one of {BACKENDS}")
+    return _BACKEND_CLASSES[name](model, device, **kwargs)
+
+
+def compare_backends(model, device, fixtures, names=BACKENDS, batch_size=16, repeats=3):
+    """
+    Check each backend against eager on a fixture set and time it
+
+    Args:
+        model: Loaded eager model
+        device: Device of the eager model
+        fixtures: Nx3x224x224 tensor of preprocessed images
+        names: Backends to compare
+        batch_size: Batch size for the throughput measurement
+        repeats: Timed passes over the fixtures per backend
+
+    Returns:
+        Dict per backend with 'top1_agreement', 'max_abs_logit_diff',
+        'latency_ms' (batch of 1) and 'images_per_s', or 'error'
+    """
+    reference = EagerBackend(model, device)(fixtures).cpu()
+    reference_top1 = reference.argmax(dim=1)
+    report = {}
+
+    for name in names:
+        try:
+            kwargs = {}
+            if name == 'static_int8':
+                kwargs['calibration_batches'] = list(fixtures.split(batch_size))
+            backend = build_backend(name, model, device, **kwargs)
+        except Exception as e:
+            report[name] = {'error': str(e)}
+            continue
+
+        logits = torch.cat([backend(chunk) for chunk in fixtures.split(batch_size)]).cpu().float()
+
+        single = fixtures[:1]
+        backend(single)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            backend(single)
+        latency = (time.perf_counter() - start) / repeats
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for chunk in fixtures.split(batch_size):
+                backend(chunk)
+        elapsed = time.perf_counter() - start
+
+        report[name] = {
+            'top1_agreement': (logits.argmax(dim=1) == reference_top1).float().mean().item(),
+            'max_abs_logit_diff': (logits - reference).abs().max().item(),
+            'latency_ms': latency * 1000,
+            'images_per_s': repeats * len(fixtures) / elapsed
+        }
+
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from app.predictor import CarBrandPredictor, DEFAULT_MODEL_PATH
+    from app.preprocess import load_image_tensor
+
+    parser = argparse.ArgumentParser(description="Compare inference backends against eager")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--images', help="Directory of fixture images (default: random tensors)")
+    parser.add_argument('--count', type=int, default=32, help="Random fixtures if no --images")
+    args = parser.parse_args()
+
+    predictor = CarBrandPredictor(args.model, backend='eager')
+
+    if args.images:
+        paths = [os.path.join(args.images, f) for f in sorted(os.listdir(args.images))
+                 if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+        tensors = [t for t in map(load_image_tensor, paths) if t is not None]
+        fixtures = torch.stack(tensors)
+    else:
+        torch.manual_seed(0)
+        fixtures = torch.randn(args.count, *INPUT_SHAPE)
+
+    print(json.dumps(compare_backends(predictor.model, predictor.device, fixtures), indent=2))
@@ -0,0 +1,453 @@
+"""
+Offline batch classification
+Classifies large image archives: walks the tree lazily, classifies fixed
+size shards in worker processes (one torch thread each), appends
+per-image results to a JSONL/CSV file (or Parquet parts) and checkpoints
+every finished shard so an interrupted run picks up where it stopped.
+
+Usage:
+    python -m app.batch /data/archive --output results.jsonl --workers 8
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional dependency, only needed for --format parquet
+    pyarrow = None
+
+from app.backends import check_backend
+from app.cache import file_fingerprint
+from app.predictor import DEFAULT_MODEL_PATH, DEFAULT_BATCH_SIZE
+from app.postprocess import count_brands
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+OUTPUT_FORMATS = ('jsonl', 'csv', 'parquet')
+
+DEFAULT_SHARD_SIZE = 1000
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# torch intra-op threads per worker; workers, not threads, provide the parallelism
+DEFAULT_THREADS_PER_WORKER = 1
+
+CSV_FIELDS = ('path', 'brand', 'confidence', 'top_k')
+
+
+def iter_image_files(root, extensions=IMAGE_EXTENSIONS):
+    """
+    Walk a directory tree lazily, depth first, in name order
+
+    The whole tree is never listed at once: only the sorted listings of
+    the directories on the current path are held (each one in full, so
+    a flat directory of N files costs one sorted list of N entries). The
+    order is stable across runs, which keeps shard boundaries stable for
+    resuming.
+
+    Args:
+        root: Directory to walk
+        extensions: Lower-case file extensions to keep
+
+    Yields:
+        Image file paths
+    """
+    try:
+        with os.scandir(root) as scan:
+            entries = sorted(scan, key=lambda entry: entry.name)
+    except OSError as e:
+        print(f"✗ Skipping {root}: {e}")
+        return
+
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_image_files(entry.path, extensions)
+        elif entry.is_file() and entry.name.lower().endswith(extensions):
+            yield entry.path
+
+
+def iter_shards(paths, shard_size=DEFAULT_SHARD_SIZE):
+    """Group paths into (shard id, [paths]) chunks of shard_size"""
+    shard = []
+    shard_id = 0
+    for path in paths:
+        shard.append(path)
+        if len(shard) == shard_size:
+            yield shard_id, shard
+            shard_id += 1
+            shard = []
+    if shard:
+        yield shard_id, shard
+
+
+# Worker process state, set up once by _init_worker
+_predictor = None
+
+
+def _init_worker(model_path, backend, tta_views, fast_decode, threads):
+    """Load the model once per worker process, pinned to `threads` torch threads"""
+    global _predictor
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already fixed by an earlier parallel op
+
+    from app.predictor import CarBrandPredictor
+    _predictor = CarBrandPredictor(model_path, backend=backend, tta_views=tta_views,
+                                   fast_decode=fast_decode)
+    _predictor.warmup()
+
+
+def _classify_shard(shard_id, paths, root, batch_size):
+    """
+    Classify one shard in a worker
+
+    Returns:
+        (shard id, result dicts with 'path' relative to root, failed count)
+    """
+    names = [os.path.relpath(path, root) for path in paths]
+    results = _predictor.predict_images(paths, batch_size=batch_size, num_workers=0,
+                                        names=names)
+    return shard_id, results, len(paths) - len(results)
+
+
+class ResultWriter:
+    """
+    Append-only result output
+
+    jsonl/csv go to one file; each finished shard is appended, flushed
+    and fsynced before it is checkpointed, and on resume the file is cut
+    back to the last checkpointed offset so a shard interrupted mid-write
+    is neither lost nor duplicated. parquet writes one part file per
+    shard into the output directory (atomically, via rename).
+    """
+
+    def __init__(self, output, fmt, resume_offset=0):
+        self.output = output
+        self.fmt = fmt
+        self._file = None
+
+        if fmt == 'parquet':
+            if pyarrow is None:
+                raise ImportError("pyarrow is not installed; pip install pyarrow "
+                                  "to write parquet output")
+            os.makedirs(output, exist_ok=True)
+            return
+
+        directory = os.path.dirname(os.path.abspath(output))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(output, 'ab')
+        self._file.truncate(resume_offset)
+        self._file.seek(resume_offset)
+        if resume_offset == 0 and fmt == 'csv':
+            self._write_lines([','.join(CSV_FIELDS) + '\n'])
+
+    def _write_lines(self, lines):
+        self._file.write(''.join(lines).encode('utf-8'))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _csv_lines(self, results):
+        buffer = _LineBuffer()
+        writer = csv.writer(buffer)
+        for result in results:
+            writer.writerow([result['path'], result['brand'], result['confidence'],
+                             json.dumps(result['top_k'])])
+        return buffer.lines
+
+    def write_shard(self, shard_id, results):
+        """
+        Append one shard's results
+
+        Returns:
+            Output offset after the shard (0 for parquet)
+        """
+        if self.fmt == 'parquet':
+            table = pyarrow.table({
+                'path': [result['path'] for result in results],
+                'brand': [result['brand'] for result in results],
+                'confidence': [result['confidence'] for result in results],
+                'top_k': [json.dumps(result['top_k']) for result in results]
+            })
+            part = os.path.join(self.output, f'part-{shard_id:06d}.parquet')
+            pyarrow.parquet.write_table(table, part + '.tmp')
+            os.replace(part + '.tmp', part)
+            return 0
+
+        if self.fmt == 'csv':
+            lines = self._csv_lines(results)
+        else:
+            lines = [json.dumps(result) + '\n' for result in results]
+        self._write_lines(lines)
+        return self._file.tell()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class _LineBuffer:
+    """File-like sink collecting what csv.writer writes"""
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, text):
+        self.lines.append(text)
+
+
+class Checkpoint:
+    """
+    Record of finished shards, one JSON line each, appended after the
+    shard's results are durable
+
+    The first line stores the run settings that fix shard boundaries; a
+    resume with different settings is refused. Each shard line keeps its
+    first path so a changed input tree is detected as well.
+    """
+
+    def __init__(self, path, settings):
+        self.path = path
+        self.settings = settings
+        self.shards = {}
+
+        if os.path.exists(path):
+            self._load()
+        self._file = open(path, 'a')
+        if not self.shards and os.path.getsize(path) == 0:
+            self._append({'settings': settings})
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            lines = f.readlines()
+        header = self._parse(lines[0]) if lines else None
+        if header is None:
+            # Interrupted while writing the settings: start over like a new checkpoint
+            with open(self.path, 'rb+') as f:
+                f.truncate(0)
+            return
+
+        stored = header.get('settings')
+        if stored != self.settings:
+            raise ValueError(f"Checkpoint {self.path} was written with different settings "
+                             f"({stored}); use a new output or delete the checkpoint")
+
+        valid = len(lines[0])
+        for line in lines[1:]:
+            entry = self._parse(line)
+            if entry is None:
+                break
+            self.shards[entry['shard']] = entry
+            valid += len(line)
+
+        # Drop a torn last line from an interrupted write before appending
+        with open(self.path, 'rb+') as f:
+            f.truncate(valid)
+
+    @staticmethod
+    def _parse(line):
+        """A complete checkpoint line's entry, or None if the write was cut short"""
+        if not line.endswith(b'\n'):
+            return None
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            return None
+
+    def _append(self, entry):
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    @property
+    def offset(self):
+        """Output offset after the last checkpointed shard"""
+        return max((entry['offset'] for entry in self.shards.values()), default=0)
+
+    def check(self, shard_id, first_path):
+        """True if the shard is done; raises if the input changed under it"""
+        entry = self.shards.get(shard_id)
+        if entry is None:
+            return False
+        if entry['first'] != first_path:
+            raise ValueError(f"Input changed since the checkpoint: shard {shard_id} "
+                             f"started at {entry['first']}, now at {first_path}")
+        return True
+
+    def record(self, shard_id, first_path, images, failed, brand_counts, offset):
+        entry = {'shard': shard_id, 'first': first_path, 'images': images,
+                 'failed': failed, 'brand_counts': brand_counts, 'offset': offset}
+        self._append(entry)
+        self.shards[shard_id] = entry
+
+    def merged_counts(self):
+        """Brand counts summed over every finished shard"""
+        totals = {}
+        for entry in self.shards.values():
+            for brand, count in entry['brand_counts'].items():
+                totals[brand] = totals.get(brand, 0) + count
+        return totals
+
+    def close(self):
+        self._file.close()
+
+
+def run_batch(root, output, fmt='jsonl', workers=DEFAULT_WORKERS,
+              shard_size=DEFAULT_SHARD_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+              model_path=DEFAULT_MODEL_PATH, backend='eager', tta_views=0,
+              fast_decode=False, threads_per_worker=DEFAULT_THREADS_PER_WORKER):
+    """
+    Classify every image under a directory tree
+
+    Args:
+        root: Directory to walk
+        output: Results file (jsonl/csv) or directory (parquet)
+        fmt: One of OUTPUT_FORMATS
+        workers: Worker processes
+        shard_size: Images per shard (the unit of work and of checkpointing)
+        batch_size: Images per forward pass inside a worker
+        model_path: Model checkpoint
+        backend: Inference backend
+        tta_views: Test-time augmentation views (0 = off)
+        fast_decode: Draft-mode JPEG decoding (see CarBrandPredictor)
+        threads_per_worker: torch threads per worker process
+
+    Returns:
+        Dict with merged 'brand_counts', 'images', 'failed' and 'shards'
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{fmt}', expected one of {OUTPUT_FORMATS}")
+    # Fail here rather than in every worker's initializer
+    check_backend(backend)
+
+    root = os.path.abspath(root)
+    # The weights' content hash, not just their path: resuming after the
+    # checkpoint file changed would mix results from two models
+    settings = {'root': root, 'shard_size': shard_size, 'format': fmt,
+                'model': os.path.abspath(model_path), 'weights': file_fingerprint(model_path),
+                'backend': backend, 'tta_views': tta_views}
+    if fast_decode:
+        # Only recorded when on, so checkpoints from before the option still resume
+        settings['fast_decode'] = True
+    checkpoint_path = output.rstrip('/') + '.checkpoint.jsonl'
+    checkpoint = Checkpoint(checkpoint_path, settings)
+    writer = ResultWriter(output, fmt, resume_offset=checkpoint.offset)
+
+    if checkpoint.shards:
+        print(f"Resuming: {len(checkpoint.shards)} shards already done")
+
+    # spawn: forking a process that may hold OpenMP threads can deadlock
+    context = multiprocessing.get_context('spawn')
+    executor = ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=_init_worker,
+        initargs=(model_path, backend, tta_views, fast_decode, threads_per_worker)
+    )
+
+    shards = iter_shards(iter_image_files(root), shard_size)
+    first_paths = {}
+    pending = set()
+    done_now = 0
+    images_now = 0
+    start = time.perf_counter()
+
+    def refill():
+        # Keep a couple of shards per worker queued; the tree walk stays lazy
+        for shard_id, paths in shards:
+            first = os.path.relpath(paths[0], root)
+            if checkpoint.check(shard_id, first):
+                continue
+            first_paths[shard_id] = first
+            pending.add(executor.submit(_classify_shard, shard_id, paths, root, batch_size))
+            if len(pending) >= workers * 2:
+                return
+
+    try:
+        refill()
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                pending.discard(future)
+                shard_id, results, failed = future.result()
+
+                offset = writer.write_shard(shard_id, results)
+                checkpoint.record(shard_id, first_paths.pop(shard_id), len(results), failed,
+                                  count_brands(results), offset)
+
+                done_now += 1
+                images_now += len(results)
+                rate = images_now / (time.perf_counter() - start)
+                print(f"[shard {shard_id}] {len(results)} images, {failed} failed "
+                      f"({images_now} this run, {rate:.1f} img/s)")
+            refill()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True, cancel_futures=True)
+        writer.close()
+        checkpoint.close()
+
+    brand_counts = checkpoint.merged_counts()
+    summary = {
+        'brand_counts': brand_counts,
+        'images': sum(entry['images'] for entry in checkpoint.shards.values()),
+        'failed': sum(entry['failed'] for entry in checkpoint.shards.values()),
+        'shards': len(checkpoint.shards),
+        'shards_this_run': done_now
+    }
+    with open(output.rstrip('/') + '.counts.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify an image archive offline")
+    parser.add_argument('root', help="Directory tree of images")
+    parser.add_argument('--output', default='results.jsonl',
+                        help="Results file (jsonl/csv) or directory (parquet)")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS,
+                        help="Output format (default: from the output extension, else jsonl)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--threads-per-worker', type=int, default=DEFAULT_THREADS_PER_WORKER)
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--backend', default='eager')
+    parser.add_argument('--tta-views', type=int, default=0)
+    parser.add_argument('--fast-decode', action='store_true',
+                        help="Decode JPEGs at reduced scale (close to, not exactly, the default)")
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        extension = os.path.splitext(args.output.rstrip('/'))[1].lstrip('.')
+        fmt = extension if extension in OUTPUT_FORMATS else 'jsonl'
+
+    try:
+        summary = run_batch(args.root, args.output, fmt=fmt, workers=args.workers,
+                            shard_size=args.shard_size, batch_size=args.batch_size,
+                            model_path=args.model, backend=args.backend,
+                            tta_views=args.tta_views, fast_decode=args.fast_decode,
+                            threads_per_worker=args.threads_per_worker)
+    except (ValueError, ImportError) as e:
+        print(f"✗ {e}")
+        return 1
+
+    print(f"\n{'='*50}")
+    print("Prediction Summary:")
+    for brand, count in sorted(summary['brand_counts'].items(), key=lambda x: x[1], reverse=True):
+        print(f"  {brand}: {count}")
+    print(f"Images: {summary['images']}, failed: {summary['failed']}, "
+          f"shards: {summary['shards']} ({summary['shards_this_run']} this run)")
+    print(f"{'='*50}\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""
+Prediction cache module
+Content-addressed cache of model outputs keyed by image hash and
+model checkpoint fingerprint, with an in-memory LRU tier and an
+optional persistent SQLite tier
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_DISK_ENTRIES = 200000
+# Disk writes (inserts and last-used updates) batched into one commit
+DEFAULT_COMMIT_EVERY = 64
+# Once over max_disk_entries, the disk tier is trimmed to this fraction of it
+DISK_EVICT_TO = 0.9
+
+
+def hash_bytes(data):
+    """Content hash of encoded image bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """
+    Fingerprint a model checkpoint by hashing its contents
+
+    Args:
+        path: Path to the checkpoint file
+
+    Returns:
+        Hex digest, or None if the file can't be read
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """
+    Two-tier cache of (label, logits) per image.
+
+    Keys combine the image content hash with the model fingerprint, so
+    a new checkpoint never serves stale predictions. The memory tier is
+    an LRU bounded by max_entries; the optional disk tier is an SQLite
+    table bounded by max_disk_entries rows (a row count, not bytes; rows
+    are a key plus 4 bytes per class, so this also bounds the file).
+    Going over the cap evicts the least recently used rows down to
+    DISK_EVICT_TO of it in one statement.
+
+    Disk writes are committed in batches of commit_every, and disk hits
+    only queue their last-used update for the next commit, so a crash
+    can lose the most recent few entries but never corrupts the tier.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, db_path=None,
+                 max_disk_entries=DEFAULT_MAX_DISK_ENTRIES, commit_every=DEFAULT_COMMIT_EVERY):
+        """
+        Args:
+            max_entries: Maximum entries kept in memory
+            db_path: SQLite file for the persistent tier (None = memory only)
+            max_disk_entries: Maximum rows kept on disk
+            commit_every: Disk writes buffered before a commit
+        """
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.commit_every = max(1, commit_every)
+        self.db_path = db_path
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_rows = 0
+        self._pending_writes = 0
+        self._touched = {}
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path):
+        """Open (and create if needed) the SQLite tier"""
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS predictions ('
+            ' key TEXT PRIMARY KEY,'
+            ' label TEXT NOT NULL,'
+            ' logits BLOB NOT NULL,'
+            ' last_used REAL NOT NULL)'
+        )
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)'
+        )
+        self._db.commit()
+        # Counted once here, then tracked as rows are added and evicted
+        (self._disk_rows,) = self._db.execute('SELECT COUNT(*) FROM predictions').fetchone()
+
+    @staticmethod
+    def make_key(content_hash, fingerprint):
+        """Combine an image hash and a model fingerprint into a cache key"""
+        return f"{fingerprint}:{content_hash}"
+
+    def get(self, key):
+        """
+        Look up a cached prediction
+
+        Args:
+            key: Key from make_key()
+
+        Returns:
+            (label, logits list) tuple, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+
+            if self._db is not None:
+                row = self._db.execute(
+                    'SELECT label, logits FROM predictions WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None:
+                    self._touched[key] = time.time()
+                    self._wrote()
+                    entry = (row[0], array('f', row[1]).tolist())
+                    self._remember(key, entry)
+                    self.disk_hits += 1
+                    return entry
+
+            self.misses += 1
+            return None
+
+    def put(self, key, label, logits):
+        """
+        Store a prediction in both tiers
+
+        Args:
+            key: Key from make_key()
+            label: Predicted brand
+            logits: Sequence of raw model outputs
+        """
+        entry = (label, list(logits))
+
+        with self._lock:
+            self._remember(key, entry)
+
+            if self._db is not None:
+                row = (key, label, array('f', entry[1]).tobytes(), time.time())
+                inserted = self._db.execute(
+                    'INSERT OR IGNORE INTO predictions (key, label, logits, last_used) '
+                    'VALUES (?, ?, ?, ?)', row
+                ).rowcount
+                if inserted:
+                    self._disk_rows += 1
+                    if self._disk_rows > self.max_disk_entries:
+                        self._evict_disk()
+                else:
+                    self._db.execute(
+                        'UPDATE predictions SET label = ?, logits = ?, last_used = ? '
+                        'WHERE key = ?', row[1:] + row[:1]
+                    )
+                self._touched.pop(key, None)
+                self._wrote()
+
+    def _remember(self, key, entry):
+        """Insert into the memory tier, evicting LRU entries (lock held)"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _evict_disk(self):
+        """Trim the disk tier down to DISK_EVICT_TO of max_disk_entries (lock held)"""
+        # Pending last-used updates decide what counts as recently used
+        self._apply_touched()
+        excess = self._disk_rows - int(self.max_disk_entries * DISK_EVICT_TO)
+        deleted = self._db.execute(
+            'DELETE FROM predictions WHERE key IN '
+            '(SELECT key FROM predictions ORDER BY last_used LIMIT ?)',
+            (excess,)
+        ).rowcount
+        self._disk_rows -= deleted
+        self.evictions += deleted
+
+    def _apply_touched(self):
+        """Write queued last-used times of disk hits (lock held)"""
+        if self._touched:
+            self._db.executemany(
+                'UPDATE predictions SET last_used = ? WHERE key = ?',
+                [(used, key) for key, used in self._touched.items()]
+            )
+            self._touched = {}
+
+    def _wrote(self):
+        """Count a disk write, committing once commit_every have built up (lock held)"""
+        self._pending_writes += 1
+        if self._pending_writes >= self.commit_every:
+            self._commit()
+
+    def _commit(self):
+        """Commit buffered writes and queued last-used updates (lock held)"""
+        self._apply_touched()
+        self._db.commit()
+        self._pending_writes = 0
+
+    def flush(self):
+        """Make everything cached so far durable"""
+        with self._lock:
+            if self._db is not None:
+                self._commit()
+
+    def stats(self):
+        """Hit/miss statistics"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'memory_entries': len(self._entries),
+                'disk_entries': self._disk_rows
+            }
+
+    def clear(self):
+        """Drop all entries from both tiers"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM predictions')
+                self._touched = {}
+                self._commit()
+                self._disk_rows = 0
+
+    def close(self):
+        """Close the disk tier"""
+        with self._lock:
+            if self._db is not None:
+                self._commit()
+                self._db.close()
+                self._db = None
@@ -0,0 +1,338 @@
+"""
+Image embedding index
+Stores MobileNetV2's pooled 1280-d features of classified images in a
+compact float16 matrix and answers "find similar cars" and near-duplicate
+queries with cosine similarity computed as batched matrix multiplies,
+optionally over product-quantized codes for large collections
+"""
+
+import json
+import os
+
+import numpy as np
+
+# Rows of the index scored per matrix multiply; bounds the float32 working set
+DEFAULT_SEARCH_CHUNK = 65536
+# Cosine similarity at or above which two images count as near-duplicates
+DEFAULT_DUPLICATE_THRESHOLD = float(os.environ.get('EMBEDDING_DUPLICATE_THRESHOLD', 0.95))
+# Product quantization: sub-vectors per embedding and centroids per sub-space
+DEFAULT_PQ_SUBSPACES = 16
+DEFAULT_PQ_CENTROIDS = 256
+# Vectors the codebooks are trained on at most; the rest are only encoded
+DEFAULT_PQ_TRAIN_SAMPLE = 16384
+
+
+def normalize_rows(vectors):
+    """L2-normalize each row as float32 (zero rows stay zero)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores, k):
+    """Per-row indices of the k highest scores, best first"""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def _kmeans(data, k, iterations=15, seed=0, chunk=16384):
+    """
+    Plain Lloyd's k-means
+
+    Args:
+        data: NxD float32 array
+        k: Number of centroids (at most N)
+
+    Returns:
+        kxD float32 centroids
+    """
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = _assign(data, centroids, chunk)
+        # Sum each cluster's members in one pass over the rows sorted by cluster
+        order = np.argsort(assignment, kind='stable')
+        clusters, starts = np.unique(assignment[order], return_index=True)
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        counts = np.diff(np.append(starts, len(data)))
+        centroids[clusters] = sums / counts[:, None]
+    return centroids
+
+
+def _assign(data, centroids, chunk=16384):
+    """Nearest centroid (squared L2) per row, computed in chunks"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assignment = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), chunk):
+        block = data[start:start + chunk]
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2; |x|^2 doesn't change the argmin
+        distances = centroid_norms[None] - 2 * block @ centroids.T
+        assignment[start:start + chunk] = distances.argmin(axis=1)
+    return assignment
+
+
+class ProductQuantizer:
+    """
+    Splits D-dim vectors into `subspaces` sub-vectors and replaces each
+    with the id of its nearest of `centroids` k-means centroids, so a
+    1280-d float16 embedding (2560 bytes) becomes 16 bytes.
+
+    Inner products with a query are approximated by asymmetric distance
+    computation: one small lookup table per query and sub-space, summed
+    over the codes.
+    """
+
+    def __init__(self, subspaces=DEFAULT_PQ_SUBSPACES, centroids=DEFAULT_PQ_CENTROIDS):
+        if centroids > 256:
+            raise ValueError("At most 256 centroids per sub-space (codes are uint8)")
+        self.subspaces = subspaces
+        self.centroids = centroids
+        self.codebooks = None
+
+    def fit(self, vectors, iterations=15, seed=0, sample=DEFAULT_PQ_TRAIN_SAMPLE):
+        """Train one codebook per sub-space on (a sample of) normalized vectors"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) > sample:
+            rng = np.random.default_rng(seed)
+            vectors = vectors[rng.choice(len(vectors), size=sample, replace=False)]
+        dim = vectors.shape[1]
+        if dim % self.subspaces:
+            raise ValueError(f"Dimension {dim} is not divisible into {self.subspaces} sub-spaces")
+        if len(vectors) < self.centroids:
+            raise ValueError(f"Need at least {self.centroids} vectors to train the quantizer")
+
+        parts = vectors.reshape(len(vectors), self.subspaces, -1)
+        self.codebooks = np.stack([
+            _kmeans(np.ascontiguousarray(parts[:, sub]), self.centroids, iterations, seed + sub)
+            for sub in range(self.subspaces)
+        ])
+        return self
+
+    def encode(self, vectors):
+        """NxD vectors -> Nx(subspaces) uint8 codes"""
+        parts = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), self.subspaces, -1)
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for sub in range(self.subspaces):
+            codes[:, sub] = _assign(np.ascontiguousarray(parts[:, sub]), self.codebooks[sub])
+        return codes
+
+    def lookup_tables(self, queries):
+        """QxD queries -> Qx(subspaces)x(centroids) partial inner products"""
+        parts = queries.reshape(len(queries), self.subspaces, -1)
+        return np.einsum('qsd,scd->qsc', parts, self.codebooks)
+
+    def scores(self, tables, codes):
+        """Approximate inner products: QxN, summed over sub-spaces"""
+        scores = np.zeros((len(tables), len(codes)), dtype=np.float32)
+        for sub in range(self.subspaces):
+            scores += tables[:, sub, codes[:, sub]]
+        return scores
+
+
+class EmbeddingIndex:
+    """
+    Named embeddings, L2-normalized and stored as a float16 matrix.
+
+    search() scores a whole batch of queries against the index with one
+    matrix multiply per DEFAULT_SEARCH_CHUNK rows; since rows are
+    normalized, the products are cosine similarities. After compress()
+    the matrix is replaced by product-quantized codes.
+    """
+
+    def __init__(self, dim=1280):
+        self.dim = dim
+        self.names = []
+        self._vectors = np.empty((0, dim), dtype=np.float16)
+        self._size = 0
+        self.quantizer = None
+        self._codes = None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        """Stored float16 rows (None once compressed)"""
+        return None if self._vectors is None else self._vectors[:self._size]
+
+    def add(self, names, embeddings):
+        """
+        Add embeddings
+
+        Args:
+            names: One name per embedding (e.g. image path)
+            embeddings: NxD array-like
+        """
+        names = list(names)
+        vectors = normalize_rows(embeddings)
+        if len(names) != len(vectors):
+            raise ValueError("Need exactly one name per embedding")
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-d embeddings, got {vectors.shape[1]}")
+
+        if self.quantizer is not None:
+            self._codes = np.concatenate([self._codes, self.quantizer.encode(vectors)])
+        else:
+            needed = self._size + len(vectors)
+            if needed > len(self._vectors):
+                # Grow by doubling so repeated adds stay amortized O(1)
+                grown = np.empty((max(needed, 2 * len(self._vectors)), self.dim), dtype=np.float16)
+                grown[:self._size] = self._vectors[:self._size]
+                self._vectors = grown
+            self._vectors[self._size:needed] = vectors
+        self.names.extend(names)
+        self._size += len(vectors)
+
+    def add_results(self, results):
+        """Add result dicts from predict_images(..., embeddings=True)"""
+        results = [result for result in results if 'embedding' in result]
+        if results:
+            self.add([result['path'] for result in results],
+                     np.stack([result['embedding'] for result in results]))
+
+    def compress(self, subspaces=DEFAULT_PQ_SUBSPACES, centroids=DEFAULT_PQ_CENTROIDS):
+        """
+        Replace the float16 matrix with product-quantized codes
+
+        Trades exact scores for a much smaller index; later adds are
+        encoded with the same codebooks.
+        """
+        vectors = self.vectors.astype(np.float32)
+        self.quantizer = ProductQuantizer(subspaces, centroids).fit(vectors)
+        self._codes = self.quantizer.encode(vectors)
+        self._vectors = None
+
+    def _score_chunks(self, queries, chunk):
+        """Yield (start row, QxR similarity block) over the whole index"""
+        if self.quantizer is not None:
+            tables = self.quantizer.lookup_tables(queries)
+            for start in range(0, self._size, chunk):
+                yield start, self.quantizer.scores(tables, self._codes[start:start + chunk])
+        else:
+            for start in range(0, self._size, chunk):
+                block = self._vectors[start:min(start + chunk, self._size)].astype(np.float32)
+                yield start, queries @ block.T
+
+    def search(self, queries, k=5, chunk=DEFAULT_SEARCH_CHUNK):
+        """
+        Most similar indexed images for each query
+
+        Args:
+            queries: QxD (or D) embeddings
+            k: Neighbours per query
+
+        Returns:
+            One list per query of (name, cosine similarity), best first
+        """
+        if self._size == 0:
+            return [[] for _ in range(len(normalize_rows(queries)))]
+
+        queries = normalize_rows(queries)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+
+        for start, scores in self._score_chunks(queries, chunk):
+            # Merge this chunk's top-k with the running top-k
+            top = _top_k(scores, k)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            keep = _top_k(best_scores, k)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        return [
+            [(self.names[row], score) for row, score in zip(rows, scores)]
+            for rows, scores in zip(best_rows.tolist(), best_scores.tolist())
+        ]
+
+    def near_duplicates(self, threshold=DEFAULT_DUPLICATE_THRESHOLD, chunk=4096):
+        """
+        Pairs of indexed images at or above a cosine similarity
+
+        The index is compared with itself block by block, each block one
+        matrix multiply.
+
+        Returns:
+            List of (name, earlier name it duplicates, similarity)
+        """
+        pairs = []
+        for start in range(0, self._size, chunk):
+            stop = min(start + chunk, self._size)
+            if self.quantizer is not None:
+                queries = self.reconstruct(start, stop)
+            else:
+                queries = self._vectors[start:stop].astype(np.float32)
+
+            for block_start, scores in self._score_chunks(queries, chunk):
+                if block_start >= stop:
+                    break
+                # Only earlier images: column index below the query's row
+                rows, cols = np.nonzero(scores >= threshold)
+                earlier = cols + block_start < rows + start
+                for row, col in zip(rows[earlier].tolist(), cols[earlier].tolist()):
+                    pairs.append((self.names[start + row], self.names[block_start + col],
+                                  float(scores[row, col])))
+        return pairs
+
+    def reconstruct(self, start, stop):
+        """Approximate float32 rows decoded from PQ codes"""
+        codes = self._codes[start:stop]
+        parts = [self.quantizer.codebooks[sub][codes[:, sub]]
+                 for sub in range(self.quantizer.subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def save(self, path):
+        """Write the index to an .npz file"""
+        arrays = {'names': np.array(json.dumps(self.names))}
+        if self.quantizer is not None:
+            arrays['codes'] = self._codes
+            arrays['codebooks'] = self.quantizer.codebooks
+        else:
+            arrays['vectors'] = self.vectors
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()"""
+        with np.load(path) as data:
+            names = json.loads(str(data['names']))
+            if 'codes' in data:
+                codebooks = data['codebooks']
+                index = cls(dim=codebooks.shape[0] * codebooks.shape[2])
+                index.quantizer = ProductQuantizer(codebooks.shape[0], codebooks.shape[1])
+                index.quantizer.codebooks = codebooks
+                index._codes = data['codes']
+                index._vectors = None
+            else:
+                vectors = data['vectors']
+                index = cls(dim=vectors.shape[1])
+                index._vectors = vectors.astype(np.float16)
+            index.names = names
+            index._size = len(names)
+        return index
+
+
+def build_index(named_sources, predictor=None, **kwargs):
+    """
+    Classify images and index their embeddings
+
+    Args:
+        named_sources: (name, source) pairs, as for predict_sources()
+        predictor: CarBrandPredictor (defaults to the shared one)
+        **kwargs: Passed to predict_images()
+
+    Returns:
+        (EmbeddingIndex, per-image result dicts)
+    """
+    from app.predictor import get_predictor
+
+    predictor = predictor or get_predictor()
+    results = predictor.predict_sources(named_sources, embeddings=True, **kwargs)
+    index = EmbeddingIndex(dim=predictor.model.last_channel)
+    index.add_results(results)
+    return index, results
@@ -0,0 +1,305 @@
+"""
+Background job subsystem for scrape/analyze work
+Jobs run on a bounded executor so web workers return immediately;
+clients poll status/progress or follow it as server-sent events
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.metrics import get_metrics, log_event
+
+# Jobs running at once, and jobs allowed to wait behind them
+DEFAULT_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', 2))
+DEFAULT_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 8))
+# Finished jobs kept around for polling
+DEFAULT_HISTORY = 100
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+CANCELLED = 'cancelled'
+FINISHED = (DONE, ERROR, CANCELLED)
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a job body once cancellation was requested"""
+
+
+class Job:
+    """State of one background job, updated by its body and read by handlers"""
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.progress = {'current': 0, 'total': 0, 'message': 'Queued'}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+
+        self.version = 0
+        self._changed = threading.Condition()
+        self._cancel = threading.Event()
+        self.future = None
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        """Job bodies call this between steps to honour cancellation"""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def update(self, **fields):
+        """Update progress/status fields and wake any event-stream listeners"""
+        with self._changed:
+            progress = {k: fields.pop(k) for k in ('current', 'total', 'message') if k in fields}
+            self.progress.update(progress)
+            for key, value in fields.items():
+                setattr(self, key, value)
+            self.updated = time.time()
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait_for_change(self, version, timeout):
+        """Block until the job changes past `version` or the timeout passes"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': dict(self.progress),
+            'result': self.result,
+            'error': self.error,
+            'created': self.created,
+            'updated': self.updated
+        }
+
+
+class JobManager:
+    """
+    Runs job bodies on a bounded thread pool.
+
+    At most `concurrency` jobs run at once and at most `queue_size` wait
+    behind them; submit() raises QueueFullError beyond that so handlers
+    can answer 429. Finished jobs are kept (up to `history`) for polling.
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, queue_size=DEFAULT_QUEUE_SIZE,
+                 history=DEFAULT_HISTORY):
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(0, queue_size)
+        self.history = history
+
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                            thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _active(self):
+        return sum(1 for job in self._jobs.values() if job.status not in FINISHED)
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond the history limit (lock held)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def submit(self, kind, body, *args, **kwargs):
+        """
+        Queue a job
+
+        Args:
+            kind: Short job type label, e.g. 'scrape'
+            body: Callable run as body(job, *args, **kwargs); its return
+                value becomes the job result
+
+        Returns:
+            The new Job
+
+        Raises:
+            QueueFullError: If running + queued jobs are at capacity
+        """
+        with self._lock:
+            if self._active() >= self.concurrency + self.queue_size:
+                raise QueueFullError("Too many jobs in progress, please retry later")
+
+            job = Job(kind)
+            self._jobs[job.id] = job
+            self._prune()
+            job.future = self._executor.submit(self._run, job, body, args, kwargs)
+            return job
+
+    @staticmethod
+    def _run(job, body, args, kwargs):
+        if job.cancelled:
+            job.update(status=CANCELLED, message='Cancelled')
+            return
+
+        job.update(status=RUNNING, message='Running')
+        start = time.perf_counter()
+        try:
+            result = body(job, *args, **kwargs)
+        except JobCancelled:
+            job.update(status=CANCELLED, message='Cancelled')
+        except Exception as e:
+            get_metrics().inc('failures_total', stage=f'{job.kind}_job')
+            job.update(status=ERROR, error=str(e), message='Failed')
+        else:
+            job.update(status=DONE, result=result, message='Done')
+
+        if get_metrics().log:
+            log_event('job', job_id=job.id, kind=job.kind, status=job.status,
+                      seconds=round(time.perf_counter() - start, 4), error=job.error)
+
+    def get(self, job_id):
+        """Look up a job by id (None if unknown or pruned)"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Request cancellation of a job
+
+        Queued jobs never start; running jobs stop at their next
+        check_cancelled() call.
+
+        Returns:
+            The Job, or None if unknown
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+
+        job._cancel.set()
+        if job.future is not None and job.future.cancel():
+            job.update(status=CANCELLED, message='Cancelled')
+        return job
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.status == RUNNING)
+            queued = sum(1 for job in self._jobs.values() if job.status == QUEUED)
+        return {
+            'running': running,
+            'queued': queued,
+            'concurrency': self.concurrency,
+            'queue_size': self.queue_size
+        }
+
+
+def run_scrape_job(job, count, url, workspace):
+    """
+    Job body: scrape `count` images into a workspace with live progress
+
+    Returns:
+        {'images_scraped': n, 'workspace_id': id}; a failed or cancelled
+        scrape removes the workspace
+    """
+    from app.workspace import get_workspace_manager, scrape_to_workspace
+
+    job.update(total=count, message='Scraping')
+
+    def progress(scraped):
+        job.check_cancelled()
+        job.update(current=scraped, message=f'Scraped {scraped}/{count} images')
+
+    try:
+        scraped = scrape_to_workspace(workspace, url, count, progress=progress)
+        if scraped == 0:
+            raise Exception('No images could be scraped. Please try again.')
+    except Exception:
+        get_workspace_manager().remove(workspace.id)
+        raise
+    return {'images_scraped': scraped, 'workspace_id': workspace.id}
+
+
+def run_analyze_job(job, workspace, profile=False):
+    """
+    Job body: classify every image in a workspace and record its brand
+    counts for chart rendering
+
+    Args:
+        profile: Capture a torch profiler trace of this job. Its images
+            are then decoded and classified on the job's own thread
+            instead of the shared scheduler, so the trace holds only
+            this job's work.
+
+    Returns:
+        {'brand_counts': {...}, 'weighted_counts': {...},
+         'brands_detected': n, 'workspace_id': id}, plus 'profile'
+        (trace path and top operators) when profiling
+    """
+    from app.postprocess import count_brands
+
+    sources = workspace.image_sources()
+    if not sources:
+        raise Exception('No images found. Please scrape images first.')
+
+    job.update(total=len(sources), message='Analyzing')
+    profile_summary = None
+
+    if profile:
+        from app.metrics import capture_profile
+        from app.predictor import get_predictor
+
+        with capture_profile(f'analyze-{job.id}') as profile_summary:
+            results = get_predictor().predict_sources(sources, num_workers=0)
+        job.update(current=len(sources), message=f'Analyzed {len(sources)} images')
+    else:
+        from app.scheduler import get_scheduler
+
+        futures = get_scheduler().submit_many(sources)
+        results = []
+        for idx, future in enumerate(futures):
+            job.check_cancelled()
+            result = future.result()
+            if result is not None:
+                results.append(result)
+            job.update(current=idx + 1, message=f'Analyzed {idx + 1}/{len(sources)} images')
+
+    brand_counts = count_brands(results)
+
+    if not brand_counts:
+        raise Exception('Could not detect any brands in the images.')
+
+    workspace.brand_counts = brand_counts
+
+    result = {
+        'brand_counts': brand_counts,
+        'weighted_counts': count_brands(results, weighted=True),
+        'brands_detected': len(brand_counts),
+        'workspace_id': workspace.id
+    }
+    if profile_summary is not None:
+        result['profile'] = profile_summary
+    return result
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Get the process-wide JobManager"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
@@ -0,0 +1,298 @@
+"""
+Hot-path instrumentation
+Per-stage latency histograms and counters for the scrape -> preprocess ->
+infer -> plot pipeline, rendered in the Prometheus text format for
+/metrics and optionally echoed as structured (JSON line) logs. A torch
+profiler capture can be taken around a single job.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Set METRICS_ENABLED=0 to turn every timer and counter into a no-op
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+# Set METRICS_LOG=1 to also print one JSON line per timed stage
+METRICS_LOG = os.environ.get('METRICS_LOG', '0') == '1'
+# Where torch profiler traces are written
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join('cache', 'profiles'))
+
+NAMESPACE = 'carbrand'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'stage_seconds': ('histogram', 'Time spent in each pipeline stage', LATENCY_BUCKETS),
+    'batch_size': ('histogram', 'Images per forward pass', BATCH_SIZE_BUCKETS),
+    'images_total': ('counter', 'Images processed, by stage', None),
+    'failures_total': ('counter', 'Failed operations, by stage', None),
+    'cache_hits_total': ('counter', 'Cache hits, by cache', None),
+    'cache_misses_total': ('counter', 'Cache misses, by cache', None),
+}
+
+# Pipeline stages timed under stage_seconds
+STAGES = ('page_fetch', 'download', 'decode', 'transform', 'forward', 'postprocess', 'chart_render')
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics)"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, observations <= bound) pairs, ending with +Inf"""
+        total = 0
+        pairs = []
+        for bound, count in zip(list(self.buckets) + [float('inf')], self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class _Timer:
+    """Context manager observing elapsed time into stage_seconds"""
+
+    __slots__ = ('registry', 'labels', 'key', 'start')
+
+    def __init__(self, registry, labels):
+        self.registry = registry
+        self.labels = labels
+        self.key = _label_key(labels)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self.registry._observe('stage_seconds', self.key, elapsed)
+        if exc_type is not None:
+            self.registry.inc('failures_total', stage=self.labels['stage'])
+        if self.registry.log:
+            log_event('stage', seconds=round(elapsed, 6),
+                      error=exc_type.__name__ if exc_type else None, **self.labels)
+        return False
+
+
+class _NullTimer:
+    """Shared no-op timer handed out while metrics are disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+class MetricsRegistry:
+    """
+    Process-wide store of the counters and histograms in METRICS.
+
+    Series are created on first use per label set. When disabled, every
+    call returns before touching a lock, and timer() hands back a shared
+    no-op context manager.
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED, log=METRICS_LOG):
+        """
+        Args:
+            enabled: Record anything at all
+            log: Print a JSON line per timed stage
+        """
+        self.enabled = enabled
+        self.log = log and enabled
+        self._series = {name: {} for name in METRICS}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """Record one observation in a histogram"""
+        if not self.enabled:
+            return
+        self._observe(name, _label_key(labels), value)
+
+    def _observe(self, name, key, value):
+        with self._lock:
+            series = self._series[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(METRICS[name][2])
+            histogram.observe(value)
+
+    def timer(self, stage, **labels):
+        """
+        Time a block as one observation of a pipeline stage
+
+        An exception escaping the block also counts as a failure of it.
+
+        Usage:
+            with metrics.timer('forward'):
+                logits = model(batch)
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, {'stage': stage, **labels})
+
+    def snapshot(self):
+        """
+        Current values as plain data
+
+        Returns:
+            {metric name: [{'labels': {...}, 'value': n}] for counters, or
+             [{'labels': {...}, 'count', 'sum', 'buckets': {bound: n}}]
+             for histograms}
+        """
+        with self._lock:
+            snapshot = {}
+            for name, series in self._series.items():
+                rows = []
+                for key, value in sorted(series.items()):
+                    if isinstance(value, Histogram):
+                        rows.append({
+                            'labels': dict(key),
+                            'count': value.count,
+                            'sum': round(value.sum, 6),
+                            'buckets': {_format_value(bound): count
+                                        for bound, count in value.cumulative()}
+                        })
+                    else:
+                        rows.append({'labels': dict(key), 'value': value})
+                snapshot[name] = rows
+            return snapshot
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, _) in METRICS.items():
+                full_name = f'{NAMESPACE}_{name}'
+                lines.append(f'# HELP {full_name} {help_text}')
+                lines.append(f'# TYPE {full_name} {kind}')
+                for key, value in sorted(self._series[name].items()):
+                    if isinstance(value, Histogram):
+                        for bound, count in value.cumulative():
+                            labels = _format_labels(key + (('le', _format_value(bound)),))
+                            lines.append(f'{full_name}_bucket{labels} {count}')
+                        lines.append(f'{full_name}_sum{_format_labels(key)} {_format_value(value.sum)}')
+                        lines.append(f'{full_name}_count{_format_labels(key)} {value.count}')
+                    else:
+                        lines.append(f'{full_name}{_format_labels(key)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Drop every recorded series"""
+        with self._lock:
+            self._series = {name: {} for name in METRICS}
+
+
+def log_event(event, **fields):
+    """Print one structured log line (JSON) for an event"""
+    record = {'ts': round(time.time(), 3), 'event': event}
+    record.update((key, value) for key, value in fields.items() if value is not None)
+    print(json.dumps(record, default=str), flush=True)
+
+
+_registry = MetricsRegistry()
+_profile_lock = threading.Lock()
+
+
+def get_metrics():
+    """Get the process-wide MetricsRegistry"""
+    return _registry
+
+
+@contextmanager
+def capture_profile(name, output_dir=PROFILE_DIR, top=15):
+    """
+    Record a torch profiler trace of the enclosed block
+
+    Only torch work on the calling thread is captured, so the block
+    should run its own inference rather than hand it to the scheduler.
+    One capture runs at a time.
+
+    Args:
+        name: Trace file name (without extension)
+        output_dir: Directory for the Chrome trace
+        top: Operators listed in the summary
+
+    Yields:
+        Dict filled on exit with 'trace' (path of the Chrome trace, open
+        it in chrome://tracing or Perfetto) and 'top_ops'
+
+    Raises:
+        RuntimeError: If another capture is in progress
+    """
+    import torch.profiler
+
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("Another job is already being profiled")
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        summary = {'trace': os.path.join(output_dir, f'{name}.json')}
+        with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU],
+                                    record_shapes=True) as profiler:
+            yield summary
+
+        profiler.export_chrome_trace(summary['trace'])
+        events = sorted(profiler.key_averages(), key=lambda e: e.self_cpu_time_total,
+                        reverse=True)
+        summary['top_ops'] = [
+            {'name': e.key, 'calls': e.count,
+             'self_cpu_ms': round(e.self_cpu_time_total / 1000, 3),
+             'cpu_total_ms': round(e.cpu_time_total / 1000, 3)}
+            for e in events[:top]
+        ]
+        print(f"✓ Profile written to {summary['trace']}")
+    finally:
+        _profile_lock.release()
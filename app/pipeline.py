@@ -0,0 +1,66 @@
+"""
+Streaming scrape-to-predict pipeline
+Classifies images in micro-batches as they arrive from the scraper
+and keeps running brand counts up to date
+"""
+
+from app.predictor import get_predictor
+from app.postprocess import count_brands
+
+# Images per forward pass while streaming; small so results show up early
+DEFAULT_MICRO_BATCH = 8
+
+
+def stream_predictions(images, predictor=None, micro_batch=DEFAULT_MICRO_BATCH, scheduler=None):
+    """
+    Classify a stream of images incrementally
+
+    Args:
+        images: Iterable of (name, source) pairs where source is image
+            bytes, a memoryview or a file-like object, e.g. built from
+            scripts.scrapper.iter_flickr_images
+        predictor: CarBrandPredictor to use (defaults to the shared one)
+        micro_batch: Number of images per forward pass
+        scheduler: Optional InferenceScheduler; micro-batches are then
+            submitted to it so they share forward passes with other
+            in-flight requests
+
+    Yields:
+        (brand_counts, batch_results) after every micro-batch, where
+        brand_counts is a snapshot of the running totals and
+        batch_results are the per-image result dicts of that batch
+    """
+    if scheduler is None:
+        predictor = predictor or get_predictor()
+    counts = {}
+    pending = []
+
+    def flush():
+        if scheduler is not None:
+            results = scheduler.classify(pending)
+        else:
+            results = predictor.predict_sources(pending, batch_size=micro_batch, num_workers=0)
+        pending.clear()
+        for brand, count in count_brands(results).items():
+            counts[brand] = counts.get(brand, 0) + count
+        return results
+
+    for name, data in images:
+        pending.append((name, data))
+        if len(pending) >= micro_batch:
+            results = flush()
+            if results:
+                yield dict(counts), results
+
+    if pending:
+        results = flush()
+        if results:
+            yield dict(counts), results
+
+
+def format_brand_counts(brand_counts):
+    """Render brand counts as bullet lines, most frequent first"""
+    lines = []
+    for brand, count in sorted(brand_counts.items(), key=lambda x: x[1], reverse=True):
+        lines.append(f"  • {brand.capitalize()}: {count}")
+    return "\n".join(lines)
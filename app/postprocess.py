@@ -0,0 +1,180 @@
+"""
+Vectorized post-processing of model outputs
+Turns whole batches of logits into calibrated probabilities, top-k
+predictions and low-confidence rerouting, and aggregates brand counts
+with NumPy
+"""
+
+import os
+
+import numpy as np
+
+# Labels/probabilities reported per image
+DEFAULT_TOP_K = int(os.environ.get('PREDICTION_TOP_K', 3))
+# Predictions below this confidence are counted as LOW_CONFIDENCE_LABEL (0 disables)
+DEFAULT_THRESHOLD = float(os.environ.get('CONFIDENCE_THRESHOLD', 0.0))
+# 'others' folds them into the catch-all class, 'unknown' keeps them apart
+LOW_CONFIDENCE_LABEL = os.environ.get('LOW_CONFIDENCE_LABEL', 'others')
+# Softmax temperature; > 1 softens overconfident logits (see fit_temperature)
+DEFAULT_TEMPERATURE = float(os.environ.get('PREDICTION_TEMPERATURE', 1.0))
+
+
+def softmax(logits, temperature=1.0):
+    """
+    Numerically stable softmax over the last axis
+
+    Args:
+        logits: NxC array-like (torch tensors are converted)
+        temperature: Logits are divided by this before the softmax
+
+    Returns:
+        NxC float32 NumPy array of probabilities
+    """
+    if hasattr(logits, 'detach'):
+        logits = logits.detach().cpu().numpy()
+    scaled = np.asarray(logits, dtype=np.float32) / temperature
+    scaled = scaled - scaled.max(axis=-1, keepdims=True)
+    exp = np.exp(scaled)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def fit_temperature(logits, targets, temperatures=None):
+    """
+    Pick the temperature minimizing negative log-likelihood on held-out data
+
+    Args:
+        logits: NxC validation logits
+        targets: N true class indices
+        temperatures: Candidate temperatures (default 0.5 - 5.0)
+
+    Returns:
+        Best temperature as a float
+    """
+    if temperatures is None:
+        temperatures = np.linspace(0.5, 5.0, 46)
+    if hasattr(logits, 'detach'):
+        logits = logits.detach().cpu().numpy()
+    logits = np.asarray(logits, dtype=np.float64)
+    targets = np.asarray(targets)
+    temperatures = np.asarray(temperatures, dtype=np.float64)
+
+    # All candidates at once: TxNxC
+    scaled = logits[None] / temperatures[:, None, None]
+    scaled = scaled - scaled.max(axis=-1, keepdims=True)
+    log_probs = scaled - np.log(np.exp(scaled).sum(axis=-1, keepdims=True))
+    nll = -log_probs[:, np.arange(len(targets)), targets].mean(axis=1)
+    return float(temperatures[np.argmin(nll)])
+
+
+class PostProcessor:
+    """
+    Decodes batches of logits into per-image predictions.
+
+    Softmax (with temperature), top-k selection and threshold rerouting
+    run on the whole batch as array operations. An image whose top
+    probability falls below `threshold` is reported as `low_confidence_label`
+    with its original top-k kept for inspection.
+    """
+
+    def __init__(self, labels, top_k=DEFAULT_TOP_K, threshold=DEFAULT_THRESHOLD,
+                 low_confidence_label=LOW_CONFIDENCE_LABEL, temperature=DEFAULT_TEMPERATURE):
+        """
+        Args:
+            labels: Class names, indexed like the model outputs
+            top_k: Predictions reported per image
+            threshold: Minimum top probability to keep the predicted brand
+            low_confidence_label: Brand reported below the threshold
+            temperature: Softmax temperature
+        """
+        if temperature <= 0:
+            raise ValueError("temperature must be positive")
+
+        self.labels = list(labels)
+        self.top_k = max(1, top_k)
+        self.threshold = threshold
+        self.low_confidence_label = low_confidence_label
+        self.temperature = temperature
+
+    def _label_array(self, num_classes):
+        """Labels padded with 'Unknown' for outputs beyond the label list"""
+        labels = self.labels[:num_classes]
+        labels += ['Unknown'] * (num_classes - len(labels))
+        return np.array(labels + [self.low_confidence_label], dtype=object)
+
+    def decode(self, logits):
+        """
+        Decode a batch of logits
+
+        Args:
+            logits: NxC logits (tensor or array)
+
+        Returns:
+            List of dicts with 'brand', 'confidence' and 'top_k' (a list of
+            {'brand', 'probability'} from most to least likely), plus
+            'low_confidence': True for rerouted images
+        """
+        probs = softmax(logits, self.temperature)
+        if probs.shape[0] == 0:
+            return []
+
+        num_classes = probs.shape[1]
+        k = min(self.top_k, num_classes)
+        labels = self._label_array(num_classes)
+
+        # argpartition keeps this O(C) per row; only the k winners get sorted
+        top = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+        top_probs = np.take_along_axis(probs, top, axis=1)
+        order = np.argsort(-top_probs, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_probs = np.take_along_axis(top_probs, order, axis=1)
+
+        confidences = top_probs[:, 0]
+        low = confidences < self.threshold
+        # The extra last label is the low-confidence one
+        brands = labels[np.where(low, num_classes, top[:, 0])]
+        top_labels = labels[top]
+
+        return [
+            {
+                'brand': brand,
+                'confidence': confidence,
+                'top_k': [{'brand': label, 'probability': prob}
+                          for label, prob in zip(row_labels, row_probs)],
+                **({'low_confidence': True} if is_low else {})
+            }
+            for brand, confidence, row_labels, row_probs, is_low in zip(
+                brands.tolist(), confidences.tolist(), top_labels.tolist(),
+                top_probs.tolist(), low.tolist())
+        ]
+
+
+def count_brands(results, weighted=False):
+    """
+    Aggregate per-image results into brand counts
+
+    Args:
+        results: Result dicts with 'brand' and 'confidence'
+        weighted: Sum confidences instead of counting images. A result
+            rerouted below the threshold ('low_confidence') still carries
+            the confidence of the brand it was taken away from, so it adds
+            1 - that confidence to its low-confidence label instead.
+
+    Returns:
+        Dictionary mapping brand names to counts (ints), or to summed
+        confidences (floats) when weighted
+    """
+    if not results:
+        return {}
+
+    brands, inverse = np.unique([result['brand'] for result in results], return_inverse=True)
+    if weighted:
+        confidences = np.fromiter((result['confidence'] for result in results),
+                                  dtype=np.float64, count=len(results))
+        low = np.fromiter((result.get('low_confidence', False) for result in results),
+                          dtype=bool, count=len(results))
+        confidences = np.where(low, 1.0 - confidences, confidences)
+        totals = np.bincount(inverse, weights=confidences, minlength=len(brands))
+        return {brand: round(total, 4) for brand, total in zip(brands.tolist(), totals.tolist())}
+
+    totals = np.bincount(inverse, minlength=len(brands))
+    return dict(zip(brands.tolist(), totals.tolist()))
@@ -5,18 +5,62 @@ Loads the trained model and predicts brands from images
 
 import torch
 import torch.nn as nn
-import torchvision.transforms as transforms
 import torchvision.models as models
-from PIL import Image
+import functools
+import itertools
 import os
-from collections import Counter
+import threading
+import time
+
+from app.preprocess import (
+    PrefetchLoader, build_tta_transform, load_named_image_tensor, open_image, describe_source,
+    read_source_bytes, to_pixels, normalize_batch, DEFAULT_NUM_WORKERS, DEFAULT_QUEUE_DEPTH,
+    DEFAULT_TTA_VIEWS, DEFAULT_FAST_DECODE, DRAFT_SIZE
+)
+from app.cache import PredictionCache, hash_bytes, file_fingerprint
+from app.backends import build_backend, check_backend, DEFAULT_BACKEND
+from app.postprocess import PostProcessor, count_brands
+from app.metrics import get_metrics
+from app.tensor_store import TensorStore, TENSOR_STORE_DIR
 
 # Car brand labels - MUST match your training classes
 BRAND_LABELS = ["audi", "bmw", "lamborgini", "mercedes", "others", "porshe", "toyota"]
 
+DEFAULT_MODEL_PATH = 'model/car_brand_classifier.pt'
+
+# Images per forward pass for batched inference
+DEFAULT_BATCH_SIZE = 32
+
+# Optional persistent prediction cache (SQLite file), off unless configured
+PREDICTION_CACHE_DB = os.environ.get('PREDICTION_CACHE_DB')
+
 class CarBrandPredictor:
-    def __init__(self, model_path='model/car_brand_classifier.pt'):
-        """Initialize the predictor with the trained model"""
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, cache=None, backend=DEFAULT_BACKEND,
+                 postprocessor=None, tta_views=DEFAULT_TTA_VIEWS, tensor_store=None,
+                 fast_decode=DEFAULT_FAST_DECODE, **backend_options):
+        """
+        Initialize the predictor with the trained model
+        
+        Args:
+            model_path: Path to the model checkpoint
+            cache: Optional PredictionCache; repeated images skip inference
+            backend: Inference backend, one of app.backends.BACKENDS
+                ('eager', 'torchscript', 'dynamic_int8', 'static_int8', 'onnx')
+            postprocessor: PostProcessor turning logits into predictions
+                (defaults to top-k/threshold/temperature from the environment)
+            tta_views: Test-time augmentation views per image (0 = off);
+                see app.preprocess.MultiCropTransform
+            tensor_store: Optional TensorStore of preprocessed images;
+                stored images skip decoding (not used with TTA)
+            fast_decode: Decode JPEGs in draft mode (DCT-domain downscaling)
+                and normalize uint8 batches in the forward pass; close to,
+                not bit-exact with, the training transform; turned off
+                when a tensor store is attached
+            **backend_options: Passed to the backend (e.g. calibration_batches)
+        """
+        self.model_path = model_path
+        self.cache = cache
+        self.postprocessor = postprocessor or PostProcessor(BRAND_LABELS)
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         print(f"Using device: {self.device}")
         
@@ -34,15 +78,43 @@ class CarBrandPredictor:
             print(f"✗ Error loading model: {e}")
             raise
         
-        # Define image transformations (same as training)
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(
-                mean=[0.485, 0.456, 0.406],
-                std=[0.229, 0.224, 0.225]
-            )
-        ])
+        # Define image transformations (same as training, or TTA views)
+        self.tta_views = tta_views
+        self.transform = build_tta_transform(tta_views)
+        
+        # The store holds the plain 224x224 input, which TTA doesn't use
+        self.tensor_store = tensor_store if not tta_views else None
+        if tensor_store is not None and tta_views:
+            print("Tensor store disabled: it doesn't hold TTA views")
+        
+        # Stored pixels are fully decoded, so draft decoding would only
+        # apply to some images; the store wins
+        if fast_decode and self.tensor_store is not None:
+            print("Fast decode disabled: the tensor store holds fully decoded images")
+            fast_decode = False
+        self.fast_decode = fast_decode
+        self._draft_size = DRAFT_SIZE if fast_decode else None
+        
+        # Eager model stays available; inference goes through the backend
+        self.backend_name = backend
+        self.backend = build_backend(backend, self.model, self.device, **backend_options)
+        if backend != 'eager':
+            print(f"✓ Using {backend} inference backend")
+        
+        # Identifies these weights (and backend numerics) in prediction cache keys
+        self.fingerprint = f"{file_fingerprint(model_path)}:{backend}"
+        if tta_views:
+            self.fingerprint += f":tta{tta_views}"
+        if fast_decode:
+            self.fingerprint += ":draft"
+    
+    def warmup(self):
+        """
+        Run one dummy forward pass so the first real request
+        does not pay for lazy kernel/allocator initialization
+        """
+        dummy = torch.zeros(1, 3, 224, 224, device=self.device)
+        self.backend(dummy)
     
     def predict_single(self, image_path):
         """
@@ -54,69 +126,533 @@ class CarBrandPredictor:
         Returns:
             Predicted brand name
         """
+        image_tensor = self.load_tensor(image_path)
+        if image_tensor is None:
+            return None
+        
+        return self.classify_tensors([image_tensor])[0]['brand']
+    
+    def load_tensor(self, source, name=None):
+        """
+        Load and preprocess one image
+        
+        Args:
+            source: Path to the image file, encoded bytes / memoryview,
+                or a binary file-like object
+            name: Path or label used in error messages instead of the
+                source (e.g. when the source is the file's bytes)
+        
+        Returns:
+            3x224x224 tensor (Vx3x224x224 with TTA), or None if the
+            image can't be read; with fast_decode and no TTA the tensor
+            holds uint8 pixels, normalized when its batch is run
+        """
+        return self._load_tensor(source, name)
+    
+    def _load_tensor(self, source, name=None, store_key=None):
+        """load_tensor(), passing store_key on to _load_stored()"""
+        metrics = get_metrics()
         try:
-            # Load and preprocess image
-            image = Image.open(image_path).convert('RGB')
-            image_tensor = self.transform(image).unsqueeze(0).to(self.device)
+            if self.tensor_store is not None:
+                return self._load_stored(source, key=store_key)
+            with metrics.timer('decode'):
+                image = open_image(source, draft_size=self._draft_size)
+            with metrics.timer('transform'):
+                if self.fast_decode and not self.tta_views:
+                    return to_pixels(image)
+                return self.transform(image)
+        except Exception as e:
+            print(f"Error predicting {describe_source(source if name is None else name)}: {e}")
+            return None
+    
+    def _load_stored(self, source, key=None):
+        """
+        load_tensor() through the tensor store, adding the image if it's new
+        
+        Stored pixels are always fully decoded (fast_decode is turned off
+        when a store is attached), so the store's contents don't depend on
+        the predictor that filled it.
+        
+        Args:
+            source: Image source
+            key: Content hash of source when it's already known to be
+                missing from the store (source is then its bytes)
+        """
+        if key is not None:
+            data, row = source, None
+        else:
+            data = read_source_bytes(source)
+            if data is None:
+                return None
+            key = hash_bytes(data)
+            row = self.tensor_store.get(key)
+        if row is None:
+            metrics = get_metrics()
+            with metrics.timer('decode'):
+                image = open_image(data)
+            with metrics.timer('transform'):
+                row = self.tensor_store.put(key, to_pixels(image))
+        return self.tensor_store.load(row)
+    
+    def _load_item(self, item):
+        """load_tensor() for a (name, source, store key or None) loader item"""
+        name, source, store_key = item
+        return self._load_tensor(source, name, store_key)
+    
+    def forward_logits(self, tensors):
+        """
+        Run one forward pass over a list of preprocessed image tensors
+        
+        With TTA every view of every image goes through the same forward
+        pass and each image's logits are averaged over its views.
+        
+        Args:
+            tensors: List of 3x224x224 tensors, or Vx3x224x224 view stacks,
+                or an already stacked batch; uint8 pixels (fast_decode)
+                are normalized here, once for the whole batch
+        
+        Returns:
+            Nx(num classes) tensor of raw logits on the CPU
+        """
+        return self._forward(tensors)[0]
+    
+    def forward_embeddings(self, tensors):
+        """
+        Like forward_logits(), but also return each image's pooled
+        penultimate features (model.last_channel = 1280 values)
+        
+        With the eager backend the logits come from the same features, so
+        this costs one forward pass; other backends don't expose their
+        features and run the eager feature extractor as well.
+        
+        Returns:
+            (Nx(num classes) logits, NxD features), both float32 on the CPU
+        """
+        return self._forward(tensors, embeddings=True)
+    
+    def _forward(self, tensors, embeddings=False):
+        """Forward pass returning (logits, features or None), averaged over TTA views"""
+        metrics = get_metrics()
+        metrics.observe('batch_size', len(tensors))
+        with metrics.timer('forward'):
+            batch = tensors if torch.is_tensor(tensors) else torch.stack(tensors)
+            batch = batch.to(self.device)
+            if batch.dtype == torch.uint8:
+                batch = normalize_batch(batch)
+            views = None
+            if batch.dim() == 5:
+                images, views = batch.shape[:2]
+                batch = batch.flatten(0, 1)
+            
+            features = None
+            if embeddings:
+                with torch.inference_mode():
+                    features = self.model.features(batch)
+                    features = torch.flatten(nn.functional.adaptive_avg_pool2d(features, 1), 1)
+                    if self.backend_name == 'eager':
+                        logits = self.model.classifier(features)
+                    else:
+                        logits = self.backend(batch)
+                features = features.cpu().float()
+            else:
+                logits = self.backend(batch)
+            logits = logits.cpu().float()
+            
+            if views is not None:
+                logits = logits.view(images, views, -1).mean(dim=1)
+                if features is not None:
+                    features = features.view(images, views, -1).mean(dim=1)
+        metrics.inc('images_total', len(tensors), stage='forward')
+        return logits, features
+    
+    def decode_logits(self, logits):
+        """
+        Turn a batch of logits into predictions (see PostProcessor.decode)
+        
+        Returns:
+            List of dicts with 'brand', 'confidence' and 'top_k'
+        """
+        with get_metrics().timer('postprocess'):
+            return self.postprocessor.decode(logits)
+    
+    def classify_tensors(self, tensors):
+        """
+        Run one forward pass over a list of preprocessed image tensors
+        
+        Args:
+            tensors: List of 3x224x224 tensors
+        
+        Returns:
+            List of prediction dicts, one per tensor
+        """
+        return self.decode_logits(self.forward_logits(tensors))
+    
+    def predict_images(self, image_paths, batch_size=DEFAULT_BATCH_SIZE,
+                       num_workers=DEFAULT_NUM_WORKERS, queue_depth=DEFAULT_QUEUE_DEPTH,
+                       use_processes=False, stats=None, names=None, embeddings=False):
+        """
+        Predict brands for a list of images using batched forward passes
+        
+        Decoding and preprocessing run in a worker pool that prefetches
+        up to queue_depth batches ahead of the model. When a prediction
+        cache is attached, images already seen with these weights are
+        answered from the cache and skip decoding and inference. With a
+        tensor store attached, stored images are read back in batches of
+        consecutive rows instead of being decoded, and new ones are added
+        (except when decoding in a process pool).
+        
+        Args:
+            image_paths: List of image file paths, or in-memory sources
+                (bytes, memoryview, file-like) decoded without touching disk
+            batch_size: Number of images per forward pass
+            num_workers: Decode workers (0 decodes inline on this thread)
+            queue_depth: Ready batches buffered ahead of the model
+            use_processes: Decode in a process pool instead of threads
+                (sources must then be paths or bytes)
+            stats: Optional dict filled with 'input_wait_s',
+                'inference_s', 'batches', 'cache_hits' and 'stored'
+            names: Optional labels reported as 'path' instead of the sources
+            embeddings: Also return each image's pooled features as
+                'embedding' (float32 NumPy array); the prediction cache
+                holds no features, so every image goes through the model
+        
+        Returns:
+            List of per-image result dicts with 'path', 'brand',
+            'confidence' and 'top_k', in input order. Images that fail to load are
+            left out.
+        """
+        sources = list(image_paths)
+        names = list(names) if names is not None else sources
+        
+        results = {}
+        keys = {}
+        pending = list(range(len(sources)))
+        
+        if self.cache is not None and not embeddings:
+            pending, keys = self.lookup_cache(sources, names, pending, results)
+            # Decode from the bytes already read for hashing
+            sources = [sources[idx] if idx not in keys else keys[idx][1]
+                       for idx in range(len(sources))]
+        
+        cache_hits = len(results)
+        stored = []
+        store_keys = {}
+        if self.tensor_store is not None:
+            pending, stored, missing = self._split_stored(sources, pending)
+            # Decode misses from the bytes already read for hashing; in-process
+            # loaders also take the hash, to add them without another lookup
+            sources = [missing[idx][1] if idx in missing else source
+                       for idx, source in enumerate(sources)]
+            if not use_processes:
+                store_keys = {idx: key for idx, (key, _) in missing.items()}
+        
+        # Sources may be bytes by now; the names keep error messages readable
+        if use_processes:
+            load_fn = functools.partial(load_named_image_tensor, tta_views=self.tta_views,
+                                        fast_decode=self.fast_decode)
+            pending_items = [(names[idx], sources[idx]) for idx in pending]
+        else:
+            load_fn = self._load_item
+            pending_items = [(names[idx], sources[idx], store_keys.get(idx)) for idx in pending]
+        
+        if num_workers > 0:
+            loader = PrefetchLoader(
+                pending_items,
+                load_fn=load_fn,
+                batch_size=batch_size,
+                num_workers=num_workers,
+                queue_depth=queue_depth,
+                use_processes=use_processes,
+                names=pending
+            )
+        else:
+            loader = self._inline_batches(pending_items, pending, batch_size, load_fn)
+        
+        batches = (([idx for idx, _ in batch], [tensor for _, tensor in batch])
+                   for batch in loader)
+        if stored:
+            batches = itertools.chain(self._stored_batches(stored, batch_size), batches)
+        
+        inference_time = 0.0
+        
+        for indices, tensors in batches:
+            start = time.perf_counter()
+            logits, features = self._forward(tensors, embeddings=embeddings)
+            predictions = self.decode_logits(logits)
+            inference_time += time.perf_counter() - start
             
-            # Make prediction
-            with torch.no_grad():
-                outputs = self.model(image_tensor)
-                _, predicted = torch.max(outputs, 1)
-                brand_idx = predicted.item()
+            for idx, row, prediction in zip(indices, logits.tolist(), predictions):
+                results[idx] = {'path': names[idx], **prediction}
+                if idx in keys:
+                    self.cache.put(keys[idx][0], prediction['brand'], row)
+            if features is not None:
+                for idx, embedding in zip(indices, features.numpy()):
+                    results[idx]['embedding'] = embedding
+        
+        if stats is not None:
+            stats['input_wait_s'] = getattr(loader, 'wait_time', 0.0)
+            stats['inference_s'] = inference_time
+            stats['batches'] = getattr(loader, 'batches', 0)
+            stats['cache_hits'] = cache_hits
+            stats['stored'] = len(stored)
+        
+        if self.cache is not None:
+            self.cache.flush()
+        if self.tensor_store is not None:
+            self.tensor_store.flush()
+        return [results[idx] for idx in sorted(results)]
+    
+    def _split_stored(self, sources, pending):
+        """
+        Separate images already in the tensor store
+        
+        Each source is read once: misses come back with their hash and
+        bytes so they're decoded and stored without another read or lookup.
+        
+        Returns:
+            (indices still needing decoding, [(row, index)] for stored
+             images sorted by row so batches read consecutive rows,
+             {index: (hash, bytes)} for the misses)
+        """
+        misses = []
+        stored = []
+        missing = {}
+        for idx in pending:
+            data = read_source_bytes(sources[idx])
+            if data is None:
+                continue
+            key = hash_bytes(data)
+            row = self.tensor_store.get(key)
+            if row is None:
+                misses.append(idx)
+                missing[idx] = (key, data)
+            else:
+                stored.append((row, idx))
+        
+        metrics = get_metrics()
+        metrics.inc('cache_hits_total', len(stored), cache='tensor_store')
+        metrics.inc('cache_misses_total', len(misses), cache='tensor_store')
+        return misses, sorted(stored), missing
+    
+    def _stored_batches(self, stored, batch_size):
+        """Yield (indices, batch tensor) straight from the tensor store"""
+        for start in range(0, len(stored), batch_size):
+            chunk = stored[start:start + batch_size]
+            yield [idx for _, idx in chunk], self.tensor_store.load_batch([row for row, _ in chunk])
+    
+    def lookup_cache(self, sources, names, pending, results):
+        """
+        Answer what we can from the prediction cache
+        
+        Args:
+            sources: Image sources
+            names: Labels reported as 'path', parallel to sources
+            pending: Indices into sources to look up
+            results: Dict filled with {index: result dict} for hits
+        
+        Returns:
+            (indices still needing inference,
+             {index: (cache key, image bytes)} for those misses)
+        """
+        misses = []
+        keys = {}
+        hits = []
+        
+        for idx in pending:
+            data = read_source_bytes(sources[idx])
+            if data is None:
+                continue
             
-            # Return brand name
-            if brand_idx < len(BRAND_LABELS):
-                return BRAND_LABELS[brand_idx]
+            key = PredictionCache.make_key(hash_bytes(data), self.fingerprint)
+            entry = self.cache.get(key)
+            if entry is None:
+                misses.append(idx)
+                keys[idx] = (key, data)
             else:
-                return 'Unknown'
-                
-        except Exception as e:
-            print(f"Error predicting {image_path}: {e}")
-            return None
+                hits.append((idx, entry))
+        
+        metrics = get_metrics()
+        metrics.inc('cache_hits_total', len(hits), cache='prediction')
+        metrics.inc('cache_misses_total', len(misses), cache='prediction')
+        
+        if hits:
+            # Re-decode cached logits so thresholds/temperature changes apply
+            predictions = self.decode_logits([entry[1] for _, entry in hits])
+            for (idx, _), prediction in zip(hits, predictions):
+                results[idx] = {'path': names[idx], **prediction}
+        
+        return misses, keys
     
-    def predict_batch(self, image_dir):
+    def _inline_batches(self, sources, names, batch_size, load_fn=None):
+        """Load batches serially on the calling thread (with load_tensor() by default)"""
+        load_fn = load_fn or self.load_tensor
+        for start in range(0, len(sources), batch_size):
+            chunk = zip(names[start:start + batch_size], sources[start:start + batch_size])
+            batch = [(name, load_fn(source)) for name, source in chunk]
+            batch = [(name, tensor) for name, tensor in batch if tensor is not None]
+            if batch:
+                yield batch
+    
+    def predict_sources(self, named_sources, **kwargs):
+        """
+        Predict brands for in-memory images
+        
+        Args:
+            named_sources: Iterable of (name, source) pairs where source is
+                encoded bytes, a memoryview or a binary file-like object
+            **kwargs: Passed through to predict_images()
+        
+        Returns:
+            List of per-image result dicts, with 'path' set to the name
+        """
+        named_sources = list(named_sources)
+        if not named_sources:
+            return []
+        
+        names = [name for name, _ in named_sources]
+        sources = [source for _, source in named_sources]
+        return self.predict_images(sources, names=names, **kwargs)
+    
+    def predict_batch(self, image_dir, batch_size=DEFAULT_BATCH_SIZE,
+                      num_workers=DEFAULT_NUM_WORKERS, return_results=False):
         """
         Predict brands for all images in a directory
         
         Args:
             image_dir: Directory containing images
+            batch_size: Number of images per forward pass
+            num_workers: Decode workers feeding the model
+            return_results: Also return the per-image results
         
         Returns:
-            Dictionary with brand counts
+            Dictionary with brand counts, or (brand_counts, results)
+            when return_results is True
         """
-        predictions = []
-        
         # Get all image files
         image_files = [f for f in os.listdir(image_dir) 
                       if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
         
         if not image_files:
             print("No images found in directory!")
-            return {}
+            return ({}, []) if return_results else {}
         
         print(f"\nPredicting brands for {len(image_files)} images...")
         
-        for idx, filename in enumerate(image_files):
-            image_path = os.path.join(image_dir, filename)
-            brand = self.predict_single(image_path)
-            
-            if brand:
-                predictions.append(brand)
-                print(f"[{idx+1}/{len(image_files)}] {filename}: {brand}")
+        image_paths = [os.path.join(image_dir, f) for f in image_files]
+        stats = {}
+        results = self.predict_images(image_paths, batch_size=batch_size,
+                                      num_workers=num_workers, stats=stats)
+        
+        for idx, result in enumerate(results):
+            print(f"[{idx+1}/{len(image_files)}] {os.path.basename(result['path'])}: {result['brand']}")
         
         # Count occurrences
-        brand_counts = dict(Counter(predictions))
+        brand_counts = count_brands(results)
         
         print(f"\n{'='*50}")
         print("Prediction Summary:")
         for brand, count in sorted(brand_counts.items(), key=lambda x: x[1], reverse=True):
             print(f"  {brand}: {count}")
+        print(f"Inference: {stats['inference_s']:.2f}s, "
+              f"waiting on input: {stats['input_wait_s']:.2f}s, "
+              f"cache hits: {stats['cache_hits']}")
         print(f"{'='*50}\n")
         
+        if return_results:
+            return brand_counts, results
         return brand_counts
 
 
+def _checkpoint_signature(model_path):
+    """Return (mtime_ns, size) of a checkpoint file, or None if missing"""
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class PredictorRegistry:
+    """
+    Process-wide cache of loaded predictors, keyed by checkpoint path and backend.
+    
+    Each model is built, loaded and warmed up once and the same instance is
+    handed out to every caller. If the checkpoint file changes on disk the
+    next lookup transparently loads the new weights.
+    """
+    
+    def __init__(self):
+        self._predictors = {}
+        self._signatures = {}
+        self._lock = threading.Lock()
+        # Shared across reloads; keys include the checkpoint fingerprint
+        self.cache = PredictionCache(db_path=PREDICTION_CACHE_DB)
+        # Preprocessed inputs don't depend on the weights, so reloads reuse them
+        self.tensor_store = TensorStore(TENSOR_STORE_DIR) if TENSOR_STORE_DIR else None
+    
+    def get(self, model_path=DEFAULT_MODEL_PATH, backend=DEFAULT_BACKEND):
+        """
+        Get the shared predictor for a checkpoint, loading it if needed
+        
+        Args:
+            model_path: Path to the model checkpoint
+            backend: Inference backend name
+        
+        Returns:
+            CarBrandPredictor instance
+        
+        Raises:
+            ValueError: If the backend isn't configured for serving
+                (static_int8 without CALIBRATION_DIR)
+        """
+        check_backend(backend)
+        key = (os.path.abspath(model_path), backend)
+        signature = _checkpoint_signature(key[0])
+        
+        predictor = self._predictors.get(key)
+        if predictor is not None and self._signatures.get(key) == signature:
+            return predictor
+        
+        with self._lock:
+            # Another thread may have loaded it while we waited
+            predictor = self._predictors.get(key)
+            if predictor is not None and self._signatures.get(key) == signature:
+                return predictor
+            
+            if predictor is not None:
+                print(f"Checkpoint changed, reloading {model_path}")
+            
+            predictor = CarBrandPredictor(model_path, cache=self.cache, backend=backend,
+                                          tensor_store=self.tensor_store)
+            predictor.warmup()
+            self._predictors[key] = predictor
+            self._signatures[key] = signature
+            return predictor
+    
+    def clear(self):
+        """Drop all cached predictors"""
+        with self._lock:
+            self._predictors.clear()
+            self._signatures.clear()
+
+
+_registry = PredictorRegistry()
+
+
+def get_predictor(model_path=DEFAULT_MODEL_PATH, backend=DEFAULT_BACKEND):
+    """
+    Get the process-wide shared predictor for a checkpoint
+    
+    Args:
+        model_path: Path to the model checkpoint
+        backend: Inference backend (defaults to $INFERENCE_BACKEND or 'eager')
+    
+    Returns:
+        CarBrandPredictor instance (loaded once, reloaded if the file changes)
+    """
+    return _registry.get(model_path, backend)
+
+
 def predict_brands(image_dir):
     """
     Main function to predict brands from a directory of images
@@ -128,7 +664,7 @@ def predict_brands(image_dir):
         Dictionary mapping brand names to counts
     """
     try:
-        predictor = CarBrandPredictor()
+        predictor = get_predictor()
         return predictor.predict_batch(image_dir)
     except Exception as e:
         print(f"Error in prediction: {e}")
@@ -136,48 +672,21 @@ def predict_brands(image_dir):
 
 
 # Alternative: Direct batch classification (like your original code)
-def batch_classify_images(image_paths):
+def batch_classify_images(image_paths, model_path=DEFAULT_MODEL_PATH):
     """
     Classify a list of image paths (legacy function)
     
     Args:
         image_paths: List of image file paths
+        model_path: Path to the model checkpoint
     
     Returns:
         Dictionary mapping brand names to counts
     """
-    # Load model
-    model = models.mobilenet_v2(pretrained=False)
-    model.classifier[1] = nn.Linear(model.last_channel, len(BRAND_LABELS))
-    model.load_state_dict(torch.load('model/car_brand_classifier.pt', map_location='cpu'))
-    model.eval()
-    
-    # Transform
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
-    ])
-    
-    brand_counts = {}
-    
-    for img_path in image_paths:
-        try:
-            img = Image.open(img_path).convert('RGB')
-            img_tensor = transform(img).unsqueeze(0)
-            
-            with torch.no_grad():
-                output = model(img_tensor)
-                pred = output.argmax(1).item()
-            
-            brand = BRAND_LABELS[pred]
-            brand_counts[brand] = brand_counts.get(brand, 0) + 1
-            
-        except Exception as e:
-            print(f"Error processing {img_path}: {e}")
-            continue
-    
-    return brand_counts
+    # Reuse the shared, already-loaded model with batched inference
+    predictor = get_predictor(model_path)
+    results = predictor.predict_images(list(image_paths))
+    return count_brands(results)
 
 
 if __name__ == "__main__":
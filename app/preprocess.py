@@ -0,0 +1,344 @@
+"""
+Image preprocessing module
+Decodes and transforms images in a worker pool and prefetches
+ready batches so decoding overlaps with model inference
+"""
+
+import io
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+from app.metrics import get_metrics
+
+# Normalization constants used during training
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+DEFAULT_NUM_WORKERS = 4
+DEFAULT_QUEUE_DEPTH = 2
+
+CROP_SIZE = 224
+# Test-time augmentation views per image (0 = off, plain 224x224 resize);
+# more views cost proportionally more inference for better accuracy
+DEFAULT_TTA_VIEWS = int(os.environ.get('TTA_VIEWS', 0))
+# Views in the order they are added as TTA_VIEWS grows
+TTA_VIEWS = ('center', 'center_flip', 'start', 'end', 'start_flip', 'end_flip')
+# Set FAST_DECODE=1 to let libjpeg downscale JPEGs while decoding and to
+# normalize whole uint8 batches; inputs then match build_transform() within
+# a small tolerance instead of exactly (see benchmarks/decode.py)
+DEFAULT_FAST_DECODE = os.environ.get('FAST_DECODE', '0') == '1'
+# Smallest size a draft-mode decode may produce
+DRAFT_SIZE = (CROP_SIZE, CROP_SIZE)
+
+_transforms = {}
+
+
+def build_transform():
+    """Build the inference transform (same as training)"""
+    return transforms.Compose([
+        transforms.Resize((CROP_SIZE, CROP_SIZE)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+    ])
+
+
+def to_pixels(image):
+    """
+    Resize like build_transform() but stop before normalizing
+
+    Returns:
+        3x224x224 uint8 tensor of RGB pixels; normalize_batch() turns a
+        stack of these into exactly what build_transform() produces
+    """
+    image = transforms.Resize((CROP_SIZE, CROP_SIZE))(image)
+    return transforms.PILToTensor()(image)
+
+
+def normalize_batch(batch):
+    """
+    ToTensor + Normalize over a whole uint8 NCHW batch at once
+
+    Returns:
+        New float32 tensor
+    """
+    mean = torch.tensor(IMAGENET_MEAN, device=batch.device).view(1, 3, 1, 1)
+    std = torch.tensor(IMAGENET_STD, device=batch.device).view(1, 3, 1, 1)
+    return batch.float().div_(255).sub_(mean).div_(std)
+
+
+class MultiCropTransform:
+    """
+    Test-time augmentation views of one image, as a Vx3x224x224 tensor.
+
+    The image is resized once so its shorter side is 224 (keeping the
+    aspect ratio instead of squashing wide photos) and normalized once;
+    the crops along the long side ('start', 'center', 'end' - together
+    they cover the whole photo up to a 3:1 aspect) and their horizontal
+    flips are then cheap tensor slices.
+    """
+
+    def __init__(self, views=2, crop_size=CROP_SIZE):
+        """
+        Args:
+            views: Number of views, taken in TTA_VIEWS order (1 - 6)
+            crop_size: Side of each square crop
+        """
+        if not 1 <= views <= len(TTA_VIEWS):
+            raise ValueError(f"views must be between 1 and {len(TTA_VIEWS)}")
+        self.views = TTA_VIEWS[:views]
+        self.crop_size = crop_size
+        self.resize = transforms.Resize(crop_size)
+        self.normalize = transforms.Compose([
+            transforms.ToTensor(),
+            transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+        ])
+
+    def __call__(self, image):
+        tensor = self.normalize(self.resize(image))
+        height, width = tensor.shape[1:]
+        size = self.crop_size
+        # Offsets along the long axis; the short axis is exactly crop_size
+        span = max(height, width) - size
+        offsets = {'start': 0, 'center': span // 2, 'end': span}
+
+        crops = {}
+        views = []
+        for view in self.views:
+            position = view.split('_')[0]
+            if position not in crops:
+                offset = offsets[position]
+                if width >= height:
+                    crops[position] = tensor[:, :size, offset:offset + size]
+                else:
+                    crops[position] = tensor[:, offset:offset + size, :size]
+            crop = crops[position]
+            views.append(crop.flip(-1) if view.endswith('_flip') else crop)
+        return torch.stack(views)
+
+
+def build_tta_transform(views=DEFAULT_TTA_VIEWS):
+    """
+    Build the inference transform for a TTA setting
+
+    Args:
+        views: Views per image; 0 gives the plain training transform
+
+    Returns:
+        Callable mapping a PIL image to a 3x224x224 tensor, or to a
+        Vx3x224x224 tensor of views when views > 0
+    """
+    if views <= 0:
+        return build_transform()
+    return MultiCropTransform(views)
+
+
+def describe_source(source):
+    """Short printable name for an image source"""
+    if isinstance(source, (bytes, bytearray)):
+        return f"<{len(source)} bytes>"
+    if isinstance(source, memoryview):
+        return f"<{source.nbytes} byte buffer>"
+    if hasattr(source, 'read'):
+        return getattr(source, 'name', '<file object>')
+    return str(source)
+
+
+def open_image(source, draft_size=None):
+    """
+    Open an image as RGB without going through a temporary file
+
+    Args:
+        source: Path to an image file, encoded bytes / bytearray /
+            memoryview, or a binary file-like object
+        draft_size: Optional (width, height); JPEGs are then decoded at
+            the smallest 1/2, 1/4 or 1/8 scale still at least this size,
+            which skips most of the IDCT work (other formats ignore it)
+
+    Returns:
+        RGB PIL image
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    image = Image.open(source)
+    if draft_size is not None:
+        image.draft('RGB', draft_size)
+    return image.convert('RGB')
+
+
+def read_source_bytes(source):
+    """
+    Get the encoded bytes of an image source
+
+    Args:
+        source: Anything open_image() accepts
+
+    Returns:
+        bytes, or None if the source can't be read
+    """
+    try:
+        if isinstance(source, bytes):
+            return source
+        if isinstance(source, (bytearray, memoryview)):
+            return bytes(source)
+        if hasattr(source, 'read'):
+            return source.read()
+        with open(source, 'rb') as f:
+            return f.read()
+    except Exception as e:
+        print(f"Error reading {describe_source(source)}: {e}")
+        return None
+
+
+def load_image_tensor(source, tta_views=0, fast_decode=False, name=None):
+    """
+    Decode and preprocess one image
+
+    Module-level so it can be shipped to a process pool.
+
+    Args:
+        source: Anything open_image() accepts
+        tta_views: TTA views (see build_tta_transform)
+        fast_decode: Decode JPEGs in draft mode and, without TTA, return
+            uint8 pixels to be normalized a batch at a time (see
+            normalize_batch)
+        name: Path or label used in error messages instead of the source
+            (e.g. when the source is the file's bytes)
+
+    Returns:
+        3x224x224 tensor (Vx3x224x224 with TTA; uint8 with fast_decode
+        and no TTA), or None if the image can't be read
+    """
+    transform = _transforms.get(tta_views)
+    if transform is None:
+        transform = _transforms[tta_views] = build_tta_transform(tta_views)
+
+    metrics = get_metrics()
+    try:
+        with metrics.timer('decode'):
+            image = open_image(source, draft_size=DRAFT_SIZE if fast_decode else None)
+        with metrics.timer('transform'):
+            if fast_decode and not tta_views:
+                return to_pixels(image)
+            return transform(image)
+    except Exception as e:
+        print(f"Error predicting {describe_source(source if name is None else name)}: {e}")
+        return None
+
+
+def load_named_image_tensor(item, **kwargs):
+    """load_image_tensor() for a (name, source) pair; picklable for process pools"""
+    name, source = item
+    return load_image_tensor(source, name=name, **kwargs)
+
+
+class _ProducerError:
+    """Wraps an exception raised in the producer thread"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+_DONE = object()
+
+
+class PrefetchLoader:
+    """
+    DataLoader-style prefetcher for inference.
+
+    A background thread fans decode/transform work out to a thread or
+    process pool and pushes ready batches into a bounded queue. Iterating
+    the loader yields lists of (item, tensor) pairs; items that failed
+    to load are dropped (item is the matching entry of `names` when
+    given). wait_time records how long the consumer spent
+    blocked waiting for input.
+    """
+
+    def __init__(self, items, load_fn=load_image_tensor, batch_size=32,
+                 num_workers=DEFAULT_NUM_WORKERS, queue_depth=DEFAULT_QUEUE_DEPTH,
+                 use_processes=False, names=None):
+        """
+        Args:
+            items: Sequence of inputs (e.g. image paths) passed to load_fn
+            load_fn: Callable returning a tensor or None for one item
+            batch_size: Number of items per yielded batch
+            num_workers: Size of the decode pool
+            queue_depth: Maximum number of ready batches buffered ahead
+            use_processes: Use a process pool instead of threads
+                (load_fn must then be picklable)
+            names: Optional labels yielded in place of the items
+        """
+        self.items = list(items)
+        self.names = list(names) if names is not None else self.items
+        self.load_fn = load_fn
+        self.batch_size = max(1, batch_size)
+        self.num_workers = max(1, num_workers)
+        self.queue_depth = max(1, queue_depth)
+        self.use_processes = use_processes
+
+        self.wait_time = 0.0
+        self.batches = 0
+
+    def _produce(self, ready, stop):
+        """Decode chunks in the pool and enqueue them in order"""
+        executor_cls = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+
+        try:
+            with executor_cls(max_workers=self.num_workers) as pool:
+                for start in range(0, len(self.items), self.batch_size):
+                    if stop.is_set():
+                        return
+
+                    chunk = self.items[start:start + self.batch_size]
+                    names = self.names[start:start + self.batch_size]
+                    tensors = list(pool.map(self.load_fn, chunk))
+                    batch = [(name, tensor) for name, tensor in zip(names, tensors)
+                             if tensor is not None]
+
+                    if batch and not self._put(ready, batch, stop):
+                        return
+        except Exception as e:
+            self._put(ready, _ProducerError(e), stop)
+            return
+
+        self._put(ready, _DONE, stop)
+
+    @staticmethod
+    def _put(ready, value, stop):
+        """Blocking put that gives up once the consumer has gone away"""
+        while not stop.is_set():
+            try:
+                ready.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        ready = queue.Queue(maxsize=self.queue_depth)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(ready, stop), daemon=True)
+        producer.start()
+
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                batch = ready.get()
+                self.wait_time += time.perf_counter() - wait_start
+
+                if batch is _DONE:
+                    return
+                if isinstance(batch, _ProducerError):
+                    raise batch.error
+
+                self.batches += 1
+                yield batch
+        finally:
+            stop.set()
+            producer.join()
@@ -1,5 +1,5 @@
-from flask import Flask, render_template, request, jsonify
-import os
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+import json
 
 app = Flask(__name__, 
             template_folder='../templates',
@@ -10,6 +10,34 @@ def index():
     """Render the main page"""
     return render_template('index.html')
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness probe: 200 once the model is loaded and warm, 503 until then
+    
+    With WARMUP_ON_BOOT=0 the probe never loads the model: it answers 200
+    with 'lazy': true, since the first real request loads it.
+    """
+    from app.startup import WARMUP_ON_BOOT, get_warmup
+    
+    warmup = get_warmup()
+    if not WARMUP_ON_BOOT:
+        return jsonify({**warmup.to_dict(), 'lazy': True}), 200
+    
+    # Servers whose entry point didn't start warming up (e.g. under gunicorn) start here
+    warmup.start()
+    return jsonify(warmup.to_dict()), 200 if warmup.ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint; ?format=json returns a JSON snapshot"""
+    from app.metrics import get_metrics
+    
+    registry = get_metrics()
+    if request.args.get('format') == 'json':
+        return jsonify(registry.snapshot())
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/scrape', methods=['POST'])
 def scrape_images():
     """Step 1: Scrape images from the web"""
@@ -23,15 +51,24 @@ def scrape_images():
                 'error': 'Image count must be between 10 and 200'
             })
         
-        from scripts.scrapper import scrape_flickr_simple
+        from app.workspace import get_workspace_manager, scrape_to_workspace
         
-        images_scraped = scrape_flickr_simple(
-            url="https://www.flickr.com/groups/carexpressions/pool/",
-            save_dir="static/raw_images",
-            limit=image_count
-        )
+        # Each scrape gets its own workspace so concurrent users don't collide
+        manager = get_workspace_manager()
+        workspace = manager.create()
+        try:
+            images_scraped = scrape_to_workspace(
+                workspace,
+                url="https://www.flickr.com/groups/carexpressions/pool/",
+                limit=image_count
+            )
+        except Exception:
+            # e.g. WorkspaceQuotaError: don't leave a half-filled workspace behind
+            manager.remove(workspace.id)
+            raise
         
         if images_scraped == 0:
+            manager.remove(workspace.id)
             return jsonify({
                 'status': 'error',
                 'error': 'No images could be scraped. Please try again.'
@@ -39,7 +76,8 @@ def scrape_images():
         
         return jsonify({
             'status': 'done',
-            'images_scraped': images_scraped
+            'images_scraped': images_scraped,
+            'workspace_id': workspace.id
         })
         
     except Exception as e:
@@ -52,17 +90,19 @@ def scrape_images():
 def analyze_images():
     """Step 2: Analyze scraped images and generate chart"""
     try:
-        raw_images_dir = "static/raw_images"
-        if not os.path.exists(raw_images_dir) or len(os.listdir(raw_images_dir)) == 0:
+        data = request.get_json(silent=True) or {}
+        workspace = _get_workspace(data.get('workspace_id'))
+        if workspace is None or workspace.image_count() == 0:
             return jsonify({
                 'status': 'error',
                 'error': 'No images found. Please scrape images first.'
             })
         
-        from app.predictor import predict_brands
-        from visualize.plot import create_brand_chart
+        from app.scheduler import get_scheduler
+        from app.postprocess import count_brands
         
-        brand_counts = predict_brands(raw_images_dir)
+        results = get_scheduler().classify(workspace.image_sources())
+        brand_counts = count_brands(results)
         
         if not brand_counts:
             return jsonify({
@@ -70,12 +110,14 @@ def analyze_images():
                 'error': 'Could not detect any brands in the images.'
             })
         
-        chart_path = "static/brand_chart.png"
-        create_brand_chart(brand_counts, chart_path)
+        # The chart is rendered in memory when first requested
+        workspace.brand_counts = brand_counts
         
         return jsonify({
             'status': 'done',
-            'brands_detected': len(brand_counts)
+            'brands_detected': len(brand_counts),
+            'weighted_counts': count_brands(results, weighted=True),
+            'chart_url': _chart_url(workspace)
         })
         
     except Exception as e:
@@ -84,5 +126,213 @@ def analyze_images():
             'error': str(e)
         })
 
+@app.route('/scrape_analyze', methods=['POST'])
+def scrape_and_analyze_stream():
+    """Scrape and classify in one pass, streaming live counts as NDJSON"""
+    data = request.get_json(silent=True) or {}
+    image_count = data.get('count', 50)
+    
+    if image_count < 10 or image_count > 200:
+        return jsonify({
+            'status': 'error',
+            'error': 'Image count must be between 10 and 200'
+        })
+    
+    # Images are classified straight from memory; archiving them into
+    # the workspace (for a later /analyze) is opt-in
+    archive = bool(data.get('archive', False))
+    
+    from scripts.scrapper import iter_flickr_images, image_extension
+    from app.pipeline import stream_predictions
+    from app.scheduler import get_scheduler
+    from app.workspace import get_workspace_manager
+    
+    workspace = get_workspace_manager().create(in_memory=True)
+    
+    def generate():
+        try:
+            downloads = iter_flickr_images(
+                url="https://www.flickr.com/groups/carexpressions/pool/",
+                limit=image_count
+            )
+            
+            def images():
+                for idx, result in enumerate(downloads):
+                    if archive:
+                        workspace.add_image(f'car_{idx}{image_extension(result)}', result.content)
+                    yield result.url, result.content
+            
+            brand_counts = {}
+            analyzed = 0
+            for brand_counts, batch_results in stream_predictions(images(), scheduler=get_scheduler()):
+                analyzed += len(batch_results)
+                yield json.dumps({
+                    'status': 'running',
+                    'images_analyzed': analyzed,
+                    'brand_counts': brand_counts
+                }) + '\n'
+            
+            if not brand_counts:
+                get_workspace_manager().remove(workspace.id)
+                yield json.dumps({
+                    'status': 'error',
+                    'error': 'No images could be scraped or classified. Please try again.'
+                }) + '\n'
+                return
+            
+            workspace.brand_counts = brand_counts
+            
+            yield json.dumps({
+                'status': 'done',
+                'images_analyzed': analyzed,
+                'brand_counts': brand_counts,
+                'brands_detected': len(brand_counts),
+                'workspace_id': workspace.id,
+                'chart_url': _chart_url(workspace)
+            }) + '\n'
+            
+        except Exception as e:
+            get_workspace_manager().remove(workspace.id)
+            yield json.dumps({
+                'status': 'error',
+                'error': str(e)
+            }) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/jobs/scrape', methods=['POST'])
+def submit_scrape_job():
+    """Start a background scrape; returns a job id immediately"""
+    data = request.get_json(silent=True) or {}
+    image_count = data.get('count', 50)
+    
+    if image_count < 10 or image_count > 200:
+        return jsonify({
+            'status': 'error',
+            'error': 'Image count must be between 10 and 200'
+        }), 400
+    
+    from app.jobs import run_scrape_job
+    from app.workspace import get_workspace_manager
+    
+    return _submit_job('scrape', run_scrape_job, image_count,
+                       url="https://www.flickr.com/groups/carexpressions/pool/",
+                       workspace=get_workspace_manager().create())
+
+@app.route('/jobs/analyze', methods=['POST'])
+def submit_analyze_job():
+    """Start a background analysis of a workspace; returns a job id immediately"""
+    data = request.get_json(silent=True) or {}
+    workspace = _get_workspace(data.get('workspace_id'))
+    if workspace is None:
+        return jsonify({
+            'status': 'error',
+            'error': 'Unknown or expired workspace. Please scrape images first.'
+        }), 404
+    
+    from app.jobs import run_analyze_job
+    
+    # profile=true captures a torch profiler trace of this one job
+    return _submit_job('analyze', run_analyze_job, workspace=workspace,
+                       profile=bool(data.get('profile')))
+
+def _submit_job(kind, body, *args, **kwargs):
+    """Queue a job, answering 429 when the queue is full"""
+    from app.jobs import get_job_manager, QueueFullError
+    
+    try:
+        job = get_job_manager().submit(kind, body, *args, **kwargs)
+    except QueueFullError as e:
+        return jsonify({
+            'status': 'error',
+            'error': str(e)
+        }), 429
+    
+    return jsonify({
+        'status': job.status,
+        'job_id': job.id
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a job's status, progress and result"""
+    from app.jobs import get_job_manager
+    
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    from app.jobs import get_job_manager
+    
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Follow a job as server-sent events until it finishes"""
+    from app.jobs import get_job_manager, FINISHED
+    
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'error': 'Unknown job'}), 404
+    
+    def generate():
+        version = -1
+        while True:
+            if job.version != version:
+                version = job.version
+                yield f"data: {json.dumps(job.to_dict())}\n\n"
+                if job.status in FINISHED:
+                    return
+            else:
+                # Comment line keeps proxies from timing out idle streams
+                yield ": keep-alive\n\n"
+            job.wait_for_change(version, timeout=15)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/workspaces/<workspace_id>/chart', methods=['GET'])
+def workspace_chart(workspace_id):
+    """
+    Serve a workspace's chart, rendered in memory
+    
+    Query args: kind=bar|pie, format=png|svg|json (json is the chart data
+    for client-side rendering)
+    """
+    workspace = _get_workspace(workspace_id)
+    if workspace is None or not workspace.brand_counts:
+        return jsonify({'status': 'error', 'error': 'Chart not found'}), 404
+    
+    from visualize.plot import CHART_KINDS, CHART_FORMATS, CHART_MIMETYPES, render_chart
+    
+    kind = request.args.get('kind', 'bar')
+    fmt = request.args.get('format', 'png')
+    if kind not in CHART_KINDS or fmt not in CHART_FORMATS:
+        return jsonify({
+            'status': 'error',
+            'error': f'kind must be one of {CHART_KINDS} and format one of {CHART_FORMATS}'
+        }), 400
+    
+    return Response(render_chart(workspace.brand_counts, kind, fmt),
+                    mimetype=CHART_MIMETYPES[fmt], headers={'Cache-Control': 'no-cache'})
+
+def _get_workspace(workspace_id):
+    """Look up a workspace by id, tolerating a missing id"""
+    if not workspace_id:
+        return None
+    
+    from app.workspace import get_workspace_manager
+    return get_workspace_manager().get(workspace_id)
+
+def _chart_url(workspace):
+    return f"/workspaces/{workspace.id}/chart"
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,243 @@
+"""
+Dynamic micro-batching inference scheduler
+Request handlers submit images and get futures back; a single dedicated
+worker groups submissions from all in-flight requests into batches and
+fans the results back out
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+from app.predictor import get_predictor
+from app.postprocess import count_brands
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 10
+# Intra-op threads for the inference worker (0 = leave torch's default)
+DEFAULT_NUM_THREADS = int(os.environ.get('INFERENCE_THREADS', 0))
+
+_STOP = object()
+
+
+class InferenceScheduler:
+    """
+    Collects submissions into batches bounded by max_batch_size and a
+    max_wait_ms deadline measured from the oldest queued image, runs one
+    forward pass per batch on a dedicated worker thread, and resolves
+    each caller's future with its own result.
+
+    Decoding happens on the submitting thread, so request threads share
+    the preprocessing work while the worker only runs the model.
+    """
+
+    def __init__(self, predictor=None, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, num_threads=DEFAULT_NUM_THREADS):
+        """
+        Args:
+            predictor: CarBrandPredictor (defaults to the shared one)
+            max_batch_size: Largest batch per forward pass
+            max_wait_ms: Longest an image waits for others to batch with
+            num_threads: torch.set_num_threads value pinned by the worker
+                (0 keeps torch's default)
+        """
+        self.predictor = predictor or get_predictor()
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.num_threads = num_threads
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.images = 0
+
+    def start(self):
+        """Start the worker thread if it isn't running"""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='inference-scheduler',
+                                                daemon=True)
+                self._worker.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Finish queued work and stop the worker"""
+        with self._lock:
+            worker = self._worker
+            self._worker = None
+        if worker is not None:
+            self._queue.put(_STOP)
+            worker.join(timeout)
+
+    def submit(self, source, name=None):
+        """
+        Queue one image for classification
+
+        Args:
+            source: Image path, bytes, memoryview or file-like object
+            name: Label reported as 'path' (defaults to the source)
+
+        Returns:
+            Future resolving to a result dict with 'path', 'brand',
+            'confidence' and 'top_k', or None if the image couldn't be decoded
+        """
+        return self.submit_many([(name if name is not None else source, source)])[0]
+
+    def submit_many(self, named_sources):
+        """
+        Submit (name, source) pairs; returns their futures in order
+
+        Images already in the prediction cache are answered right away,
+        with all of their cached logits decoded in one call; the rest are
+        decoded here and queued for the worker.
+        """
+        named_sources = list(named_sources)
+        names = [name for name, _ in named_sources]
+        sources = [source for _, source in named_sources]
+        futures = [Future() for _ in named_sources]
+        pending = list(range(len(sources)))
+        keys = {}
+
+        # Repeated images are answered from the prediction cache
+        if self.predictor.cache is not None:
+            hits = {}
+            pending, keys = self.predictor.lookup_cache(sources, names, pending, hits)
+            for idx, future in enumerate(futures):
+                if idx in hits:
+                    future.set_result(hits[idx])
+                elif idx not in keys:
+                    future.set_result(None)  # unreadable
+
+        for idx in pending:
+            cache_key, source = keys.get(idx, (None, sources[idx]))
+            tensor = self.predictor.load_tensor(source, name=names[idx])
+            if tensor is None:
+                futures[idx].set_result(None)
+                continue
+
+            self.start()
+            self._queue.put((names[idx], tensor, cache_key, futures[idx]))
+        return futures
+
+    def classify(self, named_sources, timeout=None):
+        """
+        Submit images and wait for all results
+
+        Returns:
+            List of result dicts in input order (undecodable images left out)
+        """
+        futures = self.submit_many(named_sources)
+        results = [future.result(timeout) for future in futures]
+        return [result for result in results if result is not None]
+
+    def _collect_batch(self, first):
+        """Gather more items until the batch is full or the deadline passes"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+
+        return batch
+
+    def _run(self):
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+
+            batch = self._collect_batch(first)
+            try:
+                logits = self.predictor.forward_logits([tensor for _, tensor, _, _ in batch])
+                predictions = self.predictor.decode_logits(logits)
+            except Exception as e:
+                for _, _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.images += len(batch)
+            # A failing cache write must not kill the worker or leave callers waiting
+            try:
+                for (name, _, cache_key, future), row, prediction in zip(
+                        batch, logits.tolist(), predictions):
+                    if cache_key is not None:
+                        self.predictor.cache.put(cache_key, prediction['brand'], row)
+                    future.set_result({'path': name, **prediction})
+                if self.predictor.cache is not None:
+                    # Commit this batch's disk-tier writes so other processes aren't locked out
+                    self.predictor.cache.flush()
+            except Exception as e:
+                print(f"✗ Scheduler batch failed: {e}")
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def stats(self):
+        """Batches run, images classified and mean batch size"""
+        return {
+            'batches': self.batches,
+            'images': self.images,
+            'mean_batch_size': self.images / self.batches if self.batches else 0.0,
+            'queued': self._queue.qsize()
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Get the process-wide scheduler bound to the shared predictor
+
+    A new scheduler is created if the shared predictor was reloaded.
+    """
+    global _scheduler
+    predictor = get_predictor()
+    with _scheduler_lock:
+        if _scheduler is None or _scheduler.predictor is not predictor:
+            if _scheduler is not None:
+                _scheduler.stop()
+            _scheduler = InferenceScheduler(predictor).start()
+        return _scheduler
+
+
+def classify_directory(image_dir):
+    """
+    Scheduler-backed equivalent of predict_brands for request handlers
+
+    Images from concurrent requests are batched together instead of
+    each request running its own forward passes.
+
+    Args:
+        image_dir: Directory containing images
+
+    Returns:
+        Dictionary mapping brand names to counts
+    """
+    image_files = [f for f in sorted(os.listdir(image_dir))
+                   if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    named_sources = [(f, os.path.join(image_dir, f)) for f in image_files]
+
+    results = get_scheduler().classify(named_sources)
+    return count_brands(results)
@@ -0,0 +1,160 @@
+"""
+Fast startup
+Heavy modules (torch, torchvision, matplotlib, the scraper) are imported
+and the model is loaded and warmed up on a background thread, so the
+server starts answering while the model gets hot. Readiness and a
+per-phase timing breakdown are reported for health checks.
+"""
+
+import importlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Set WARMUP_ON_BOOT=0 to load everything lazily on the first request instead
+# (/ready then answers 200 without loading anything)
+WARMUP_ON_BOOT = os.environ.get('WARMUP_ON_BOOT', '1') != '0'
+
+# Imported in this order during warm-up; each phase times only what
+# the modules before it have not already pulled in
+HEAVY_MODULES = (
+    'torch',
+    'torchvision',
+    'app.predictor',
+    'app.scheduler',
+    'visualize.plot',
+    'scripts.scrapper',
+)
+
+PENDING = 'pending'
+WARMING = 'warming'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class StartupProfile:
+    """Wall-clock time of each named startup phase, in the order they ran"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as one phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases.append((name, time.perf_counter() - start))
+
+    def report(self):
+        with self._lock:
+            phases = list(self.phases)
+        return {
+            'phases': [{'name': name, 'seconds': round(seconds, 4)} for name, seconds in phases],
+            'total_s': round(sum(seconds for _, seconds in phases), 4),
+            'since_start_s': round(time.perf_counter() - self.started, 4)
+        }
+
+    def print_report(self):
+        report = self.report()
+        print(f"\n{'='*50}")
+        print("Startup time breakdown:")
+        for phase in report['phases']:
+            print(f"  {phase['name']:<32} {phase['seconds']:7.3f}s")
+        print(f"  {'total':<32} {report['total_s']:7.3f}s")
+        print(f"{'='*50}\n")
+
+
+class Warmup:
+    """
+    Background warm-up: heavy imports, model load + dummy forward pass,
+    and the inference scheduler, each recorded as a startup phase.
+
+    Requests that arrive before it finishes simply wait on the predictor
+    registry's lock for the same load instead of starting another.
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.status = PENDING
+        self.error = None
+
+        self._thread = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start warming up in the background (no-op if already started)"""
+        with self._lock:
+            if self._thread is None:
+                self.status = WARMING
+                self._thread = threading.Thread(target=self._run, name='warmup', daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            for module in HEAVY_MODULES:
+                with self.profile.phase(f'import {module}'):
+                    importlib.import_module(module)
+
+            from app.predictor import get_predictor
+            from app.scheduler import get_scheduler
+
+            with self.profile.phase('load model + warm-up pass'):
+                get_predictor()
+            with self.profile.phase('start inference scheduler'):
+                get_scheduler()
+        except Exception as e:
+            self.error = str(e)
+            self.status = FAILED
+            print(f"✗ Warm-up failed: {e}")
+        else:
+            self.status = READY
+            print("✓ Model loaded and warmed up")
+        finally:
+            self._done.set()
+            self.profile.print_report()
+
+    @property
+    def ready(self):
+        return self.status == READY
+
+    def wait(self, timeout=None):
+        """Block until warm-up finishes; returns True if the model is ready"""
+        self._done.wait(timeout)
+        return self.ready
+
+    def to_dict(self):
+        return {
+            'status': self.status,
+            'ready': self.ready,
+            'error': self.error,
+            'startup': self.profile.report()
+        }
+
+
+_profile = StartupProfile()
+_warmup = Warmup(_profile)
+
+
+def get_startup_profile():
+    """Get the process-wide StartupProfile"""
+    return _profile
+
+
+def get_warmup():
+    """Get the process-wide Warmup"""
+    return _warmup
+
+
+def start_warmup():
+    """Start the background warm-up unless WARMUP_ON_BOOT=0"""
+    if WARMUP_ON_BOOT:
+        _warmup.start()
+    return _warmup
@@ -0,0 +1,247 @@
+"""
+Preprocessed tensor store
+Keeps every decoded, resized 3x224x224 image in one memory-mapped array
+file, indexed by image content hash, so re-analyzing a corpus (new
+checkpoint, new threshold) skips JPEG decoding and resizing and feeds
+batches to the model straight from the page cache
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import torch
+
+from app.preprocess import CROP_SIZE, normalize_batch
+
+STORE_DTYPES = ('uint8', 'float16')
+
+# Directory of the shared store used by the predictor registry, off unless configured
+TENSOR_STORE_DIR = os.environ.get('TENSOR_STORE_DIR')
+# 'uint8' keeps exact pixels (normalized on load), 'float16' keeps normalized values
+DEFAULT_STORE_DTYPE = os.environ.get('TENSOR_STORE_DTYPE', 'uint8')
+
+ROW_SHAPE = (3, CROP_SIZE, CROP_SIZE)
+DEFAULT_INITIAL_ROWS = 1024
+# Index rows committed at once; data is flushed before each commit
+DEFAULT_COMMIT_EVERY = 64
+
+
+class TensorStore:
+    """
+    Append-only array of preprocessed images backed by a memory-mapped file.
+
+    tensors.bin holds rows of ROW_SHAPE in the store dtype; index.sqlite
+    maps image hashes to row numbers. The file grows by doubling. Data is
+    flushed before index entries are committed, so after a crash every
+    indexed row is complete; rows written after the last commit are
+    left unindexed.
+
+    Several processes may share a directory: each claims blocks of
+    commit_every rows (and grows the file) under SQLite's write lock, so
+    they never write the same row. Rows another process adds after this
+    one opened the store are not seen until it is reopened; an image
+    stored by both just takes two rows.
+
+    load_batch() over consecutive rows is a view of the mapping wrapped
+    with torch.from_numpy; the only copy is the float32 conversion the
+    model needs anyway.
+    """
+
+    def __init__(self, directory, dtype=DEFAULT_STORE_DTYPE, initial_rows=DEFAULT_INITIAL_ROWS,
+                 commit_every=DEFAULT_COMMIT_EVERY):
+        """
+        Args:
+            directory: Store directory (created if missing)
+            dtype: 'uint8' or 'float16'; an existing store keeps its own
+            initial_rows: Rows allocated when creating the data file
+            commit_every: Index entries buffered before a commit
+        """
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Unknown store dtype '{dtype}', expected one of {STORE_DTYPES}")
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.commit_every = max(1, commit_every)
+        self._data_path = os.path.join(directory, 'tensors.bin')
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'),
+                                   check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS rows (hash TEXT PRIMARY KEY, row INTEGER)')
+
+        stored = self._db.execute("SELECT value FROM meta WHERE key = 'layout'").fetchone()
+        layout = {'dtype': dtype, 'shape': list(ROW_SHAPE)}
+        if stored is None:
+            self._db.execute("INSERT INTO meta VALUES ('layout', ?)", (json.dumps(layout),))
+            self._db.commit()
+        elif json.loads(stored[0])['shape'] != list(ROW_SHAPE):
+            raise ValueError(f"Tensor store {directory} holds rows of another shape")
+        else:
+            layout = json.loads(stored[0])
+
+        self.dtype = np.dtype(layout['dtype'])
+        self.row_bytes = int(np.prod(ROW_SHAPE)) * self.dtype.itemsize
+
+        self._index = dict(self._db.execute('SELECT hash, row FROM rows'))
+        self._uncommitted = []
+        # Stores from before row reservation start after their last indexed row
+        self._db.execute("INSERT OR IGNORE INTO meta VALUES ('next_row', ?)",
+                         (str(max(self._index.values(), default=-1) + 1),))
+        self._db.commit()
+
+        # Rows [_next_row, _reserved_end) are claimed by this process
+        self._next_row = 0
+        self._reserved_end = 0
+        self.initial_rows = max(1, initial_rows)
+        self._data = None
+        self._locked(lambda: self._ensure_capacity(self.initial_rows))
+
+        self.hits = 0
+        self.misses = 0
+        self.contiguous_batches = 0
+        self.gathered_batches = 0
+
+    def _locked(self, fn):
+        """Run fn inside an immediate transaction, holding the store's write lock across processes"""
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn()
+        except Exception:
+            self._db.rollback()
+            raise
+        self._db.commit()
+        return result
+
+    def _ensure_capacity(self, rows):
+        """
+        Make the data file hold at least `rows` rows and map it (write lock held)
+
+        The file only ever grows, by doubling, and another process may have
+        grown it already; existing views keep the old mapping.
+        """
+        with open(self._data_path, 'ab') as f:
+            capacity = f.seek(0, os.SEEK_END) // self.row_bytes
+            if capacity < rows:
+                capacity = max(capacity * 2, rows, self.initial_rows)
+                f.truncate(capacity * self.row_bytes)
+        if self._data is None or len(self._data) < capacity:
+            if self._data is not None:
+                self._data.flush()
+            self._data = np.memmap(self._data_path, dtype=self.dtype, mode='r+',
+                                   shape=(capacity,) + ROW_SHAPE)
+
+    def _reserve(self):
+        """Claim the next block of rows for this process (lock held)"""
+        def claim():
+            start = int(self._db.execute("SELECT value FROM meta WHERE key = 'next_row'").fetchone()[0])
+            end = start + self.commit_every
+            self._db.execute("UPDATE meta SET value = ? WHERE key = 'next_row'", (str(end),))
+            self._ensure_capacity(end)
+            return start, end
+
+        self._next_row, self._reserved_end = self._locked(claim)
+
+    def get(self, key):
+        """Row number stored for an image hash, or None"""
+        row = self._index.get(key)
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row
+
+    def put(self, key, pixels):
+        """
+        Store one image
+
+        Args:
+            key: Image content hash
+            pixels: 3x224x224 uint8 array or tensor of resized RGB pixels
+
+        Returns:
+            Row number
+        """
+        pixels = torch.as_tensor(np.asarray(pixels))
+        if self.dtype == np.float16:
+            pixels = normalize_batch(pixels.unsqueeze(0))[0].half()
+
+        with self._lock:
+            row = self._index.get(key)
+            if row is not None:
+                return row
+            if self._next_row >= self._reserved_end:
+                self._reserve()
+            row = self._next_row
+            self._data[row] = pixels.numpy()
+            self._next_row += 1
+            self._index[key] = row
+            self._uncommitted.append((key, row))
+            if len(self._uncommitted) >= self.commit_every:
+                self._commit()
+            return row
+
+    def _commit(self):
+        """Flush data, then index the rows written since the last commit (lock held)"""
+        if not self._uncommitted:
+            return
+        self._data.flush()
+        self._db.executemany('INSERT OR REPLACE INTO rows VALUES (?, ?)', self._uncommitted)
+        self._db.commit()
+        self._uncommitted = []
+
+    def flush(self):
+        """Make everything stored so far durable"""
+        with self._lock:
+            self._commit()
+
+    def load_batch(self, rows):
+        """
+        Normalized float32 batch for a list of rows
+
+        Consecutive rows are read through a view of the mapping with no
+        intermediate copy; other row sets are gathered first.
+
+        Returns:
+            Nx3x224x224 float32 tensor
+        """
+        data = self._data
+        start = rows[0]
+        if list(rows) == list(range(start, start + len(rows))):
+            self.contiguous_batches += 1
+            batch = torch.from_numpy(data[start:start + len(rows)])
+        else:
+            self.gathered_batches += 1
+            batch = torch.from_numpy(data[np.asarray(rows)])
+
+        if self.dtype == np.float16:
+            return batch.float()
+        return normalize_batch(batch)
+
+    def load(self, row):
+        """Normalized 3x224x224 float32 tensor for one row"""
+        return self.load_batch([row])[0]
+
+    def __len__(self):
+        return len(self._index)
+
+    def stats(self):
+        return {
+            'rows': len(self._index),
+            'dtype': self.dtype.name,
+            'file_mb': round(os.path.getsize(self._data_path) / (1024 * 1024), 1),
+            'hits': self.hits,
+            'misses': self.misses,
+            'contiguous_batches': self.contiguous_batches,
+            'gathered_batches': self.gathered_batches
+        }
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._db.close()
+            self._data.flush()
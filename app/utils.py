@@ -33,3 +33,21 @@ def get_file_count(directory, extensions=('.jpg', '.jpeg', '.png')):
             count += 1
     return count
 
+def remove_directory(directory):
+    """Delete a directory and everything in it"""
+    if os.path.exists(directory):
+        try:
+            shutil.rmtree(directory)
+        except Exception as e:
+            print(f'Failed to remove {directory}. Reason: {e}')
+
+def get_directory_size(directory):
+    """Total size in bytes of the files directly inside a directory"""
+    if not os.path.exists(directory):
+        return 0
+    
+    total = 0
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
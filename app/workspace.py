@@ -0,0 +1,273 @@
+"""
+Per-job workspaces
+Each scrape/analyze job gets its own image store instead of sharing
+static/raw_images, with per-workspace and global quotas and TTL-based
+cleanup
+"""
+
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from app.utils import ensure_directory, clear_directory, remove_directory, get_directory_size
+
+DEFAULT_ROOT = os.environ.get(
+    'WORKSPACE_ROOT', os.path.join(tempfile.gettempdir(), 'car_brand_workspaces')
+)
+DEFAULT_TTL = int(os.environ.get('WORKSPACE_TTL', 3600))  # seconds
+DEFAULT_QUOTA = int(os.environ.get('WORKSPACE_QUOTA_MB', 200)) * 1024 * 1024
+# Image bytes held by all in-memory workspaces together
+DEFAULT_MEMORY_LIMIT = int(os.environ.get('WORKSPACE_MEMORY_MB', 512)) * 1024 * 1024
+# Seconds between background sweeps for expired workspaces
+DEFAULT_SWEEP_INTERVAL = int(os.environ.get('WORKSPACE_SWEEP_INTERVAL', 60))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+class WorkspaceQuotaError(Exception):
+    """Raised when adding an image would exceed the workspace quota"""
+
+
+class MemoryBudget:
+    """Byte limit shared by all in-memory workspaces"""
+
+    def __init__(self, limit_bytes=DEFAULT_MEMORY_LIMIT):
+        self.limit_bytes = limit_bytes
+        self.used_bytes = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, size):
+        """
+        Account for `size` more bytes
+
+        Raises:
+            WorkspaceQuotaError: If the shared limit would be exceeded
+        """
+        with self._lock:
+            if self.used_bytes + size > self.limit_bytes:
+                raise WorkspaceQuotaError(
+                    f"In-memory workspace limit of {self.limit_bytes // (1024 * 1024)} MB "
+                    "reached; try again later"
+                )
+            self.used_bytes += size
+
+    def release(self, size):
+        with self._lock:
+            self.used_bytes = max(0, self.used_bytes - size)
+
+
+class Workspace:
+    """
+    Isolated storage for one job.
+
+    Disk workspaces keep images under <root>/<id>/images; memory
+    workspaces keep image bytes in a dict, counted against an optional
+    MemoryBudget shared with the other in-memory workspaces.
+    """
+
+    def __init__(self, root, in_memory=False, quota_bytes=DEFAULT_QUOTA, memory_budget=None):
+        self.id = uuid.uuid4().hex
+        self.path = os.path.join(root, self.id)
+        self.image_dir = os.path.join(self.path, 'images')
+        self.in_memory = in_memory
+        self.quota_bytes = quota_bytes
+        self.memory_budget = memory_budget if in_memory else None
+        self.last_used = time.time()
+        self.brand_counts = None
+
+        self._images = {}
+        self._used_bytes = 0
+        self._lock = threading.Lock()
+
+        if not in_memory:
+            ensure_directory(self.image_dir)
+
+    def touch(self):
+        self.last_used = time.time()
+
+    def add_image(self, name, data):
+        """
+        Store one image
+
+        Args:
+            name: Filename, e.g. car_0.jpg
+            data: Encoded image bytes
+
+        Raises:
+            WorkspaceQuotaError: If this workspace's quota or the shared
+                in-memory limit would be exceeded
+        """
+        with self._lock:
+            if self._used_bytes + len(data) > self.quota_bytes:
+                raise WorkspaceQuotaError(
+                    f"Workspace quota of {self.quota_bytes // (1024 * 1024)} MB exceeded"
+                )
+            if self.memory_budget is not None:
+                self.memory_budget.reserve(len(data))
+            self._used_bytes += len(data)
+
+            if self.in_memory:
+                self._images[name] = bytes(data)
+            else:
+                with open(os.path.join(self.image_dir, os.path.basename(name)), 'wb') as f:
+                    f.write(data)
+        self.touch()
+
+    def image_sources(self):
+        """(name, source) pairs for the predictor: bytes in memory, paths on disk"""
+        self.touch()
+        if self.in_memory:
+            return list(self._images.items())
+        return [(f, os.path.join(self.image_dir, f)) for f in sorted(os.listdir(self.image_dir))
+                if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+    def image_count(self):
+        return len(self.image_sources())
+
+    def used_bytes(self):
+        if self.in_memory:
+            return self._used_bytes
+        return get_directory_size(self.image_dir)
+
+    def clear_images(self):
+        """Remove all images but keep the workspace"""
+        with self._lock:
+            self._release_memory()
+            if not self.in_memory:
+                clear_directory(self.image_dir)
+
+    def destroy(self):
+        """Delete everything the workspace holds"""
+        with self._lock:
+            self._release_memory()
+            if not self.in_memory:
+                remove_directory(self.path)
+
+    def _release_memory(self):
+        """Drop in-memory images and hand their bytes back (lock held)"""
+        self._images.clear()
+        if self.memory_budget is not None:
+            self.memory_budget.release(self._used_bytes)
+        self._used_bytes = 0
+
+
+class WorkspaceManager:
+    """
+    Creates workspaces and removes those unused for longer than the TTL.
+
+    Expired workspaces are swept whenever one is created or looked up,
+    and by a background thread every sweep_interval seconds so idle
+    servers release memory and disk too. In-memory workspaces share one
+    byte limit.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, ttl=DEFAULT_TTL, quota_bytes=DEFAULT_QUOTA,
+                 memory_limit=DEFAULT_MEMORY_LIMIT, sweep_interval=DEFAULT_SWEEP_INTERVAL):
+        """
+        Args:
+            root: Directory holding disk workspaces
+            ttl: Seconds an unused workspace is kept
+            quota_bytes: Image bytes per workspace
+            memory_limit: Image bytes across all in-memory workspaces
+            sweep_interval: Seconds between background sweeps (0 = lazy only)
+        """
+        self.root = root
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self.memory_budget = MemoryBudget(memory_limit)
+        self._workspaces = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        ensure_directory(root)
+
+        if sweep_interval > 0:
+            sweeper = threading.Thread(target=self._sweep, args=(sweep_interval,),
+                                       name='workspace-sweeper', daemon=True)
+            sweeper.start()
+
+    def _sweep(self, interval):
+        """Background loop removing expired workspaces"""
+        while not self._stop.wait(interval):
+            try:
+                self.cleanup_expired()
+            except Exception as e:
+                print(f"✗ Workspace sweep failed: {e}")
+
+    def create(self, in_memory=False):
+        """Create a new workspace"""
+        self.cleanup_expired()
+        workspace = Workspace(self.root, in_memory=in_memory, quota_bytes=self.quota_bytes,
+                              memory_budget=self.memory_budget)
+        with self._lock:
+            self._workspaces[workspace.id] = workspace
+        return workspace
+
+    def get(self, workspace_id):
+        """Look up a live workspace (None if unknown or expired)"""
+        self.cleanup_expired()
+        with self._lock:
+            workspace = self._workspaces.get(workspace_id)
+        if workspace is not None:
+            workspace.touch()
+        return workspace
+
+    def remove(self, workspace_id):
+        with self._lock:
+            workspace = self._workspaces.pop(workspace_id, None)
+        if workspace is not None:
+            workspace.destroy()
+
+    def cleanup_expired(self):
+        """Destroy workspaces idle for longer than the TTL"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [ws for ws in self._workspaces.values() if ws.last_used < cutoff]
+            for workspace in expired:
+                del self._workspaces[workspace.id]
+        for workspace in expired:
+            workspace.destroy()
+        return len(expired)
+
+    def close(self):
+        """Stop the background sweep"""
+        self._stop.set()
+
+
+def scrape_to_workspace(workspace, url, limit, progress=None):
+    """
+    Scrape images straight into a workspace
+
+    Args:
+        workspace: Target Workspace
+        url: Flickr group pool URL
+        limit: Maximum number of images
+        progress: Optional callback(count) after each stored image;
+            may raise to abort the scrape
+
+    Returns:
+        Number of images stored
+    """
+    from scripts.scrapper import iter_flickr_images, image_extension
+
+    count = 0
+    for result in iter_flickr_images(url=url, limit=limit):
+        workspace.add_image(f'car_{count}{image_extension(result)}', result.content)
+        count += 1
+        if progress is not None:
+            progress(count)
+    return count
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_workspace_manager():
+    """Get the process-wide WorkspaceManager"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = WorkspaceManager()
+        return _manager
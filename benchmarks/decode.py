@@ -0,0 +1,193 @@
+"""
+JPEG decode benchmark for the preprocessing fast path
+
+Times decode + resize + normalize on large JPEG fixtures (Flickr `_b`
+size and up) for the default full decode through build_transform(),
+draft-mode decoding with batch normalization (FAST_DECODE=1), and
+torchvision.io.decode_jpeg on raw bytes with tensor resizing. Reports
+per-image time and speedup, and checks each path's model input (and,
+with a checkpoint, its logits and top-1 brand) against the default.
+
+Usage:
+    python -m benchmarks.decode --output bench_decode.json
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+
+import torch
+import torchvision.transforms as transforms
+
+try:
+    from torchvision.io import ImageReadMode, decode_jpeg
+except ImportError:
+    decode_jpeg = None
+
+from app.predictor import CarBrandPredictor, DEFAULT_MODEL_PATH
+from app.preprocess import (
+    CROP_SIZE, DRAFT_SIZE, build_transform, normalize_batch, open_image, to_pixels
+)
+from benchmarks.predict import make_fixtures, resolve_checkpoint
+
+DEFAULT_SIZES = ((1024, 768), (2048, 1536), (4000, 3000))
+# Largest allowed difference from build_transform(), in normalized units
+# (0.15 is about 9/255 of pixel intensity)
+DEFAULT_TOLERANCE = 0.15
+
+
+def _decode_pil(blobs):
+    transform = build_transform()
+    return torch.stack([transform(open_image(data)) for data in blobs])
+
+
+def _decode_draft(blobs):
+    return normalize_batch(torch.stack([to_pixels(open_image(data, draft_size=DRAFT_SIZE))
+                                        for data in blobs]))
+
+
+def _decode_torchvision(blobs):
+    resize = transforms.Resize((CROP_SIZE, CROP_SIZE), antialias=True)
+    pixels = [resize(decode_jpeg(torch.frombuffer(bytearray(data), dtype=torch.uint8),
+                                 mode=ImageReadMode.RGB))
+              for data in blobs]
+    return normalize_batch(torch.stack(pixels))
+
+
+# name: callable mapping a list of encoded JPEGs to an Nx3x224x224 batch
+DECODERS = {
+    'pil': _decode_pil,
+    'draft': _decode_draft,
+    'torchvision': _decode_torchvision,
+}
+
+
+def bench_decoder(decode, blobs, repeats):
+    """
+    Time one decoder over a group of images
+
+    Returns:
+        (median ms per image, last output batch)
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        batch = decode(blobs)
+        timings.append((time.perf_counter() - start) / len(blobs))
+    return statistics.median(timings) * 1000, batch
+
+
+def run(groups, decoders, repeats, predictor=None):
+    """
+    Benchmark every decoder on every fixture group
+
+    Args:
+        groups: {label: list of encoded JPEGs}
+        decoders: Decoder names (the 'pil' reference always runs)
+        repeats: Timed runs per decoder and group
+        predictor: Optional CarBrandPredictor for the logits comparison
+
+    Returns:
+        {label: {decoder: stats}}
+    """
+    results = {}
+    for label, blobs in groups.items():
+        reference_ms, reference = bench_decoder(DECODERS['pil'], blobs, repeats)
+        reference_logits = predictor.forward_logits(reference) if predictor else None
+        results[label] = {'pil': {'ms_per_image': round(reference_ms, 2)}}
+        print(f"  {label:>10} {'pil':<12} {reference_ms:7.2f} ms/image  (reference)")
+
+        for name in decoders:
+            if name == 'pil':
+                continue
+            ms, batch = bench_decoder(DECODERS[name], blobs, repeats)
+            diff = (batch - reference).abs()
+            row = {
+                'ms_per_image': round(ms, 2),
+                'speedup': round(reference_ms / ms, 2),
+                'max_abs_diff': round(diff.max().item(), 4),
+                'mean_abs_diff': round(diff.mean().item(), 5)
+            }
+            if predictor is not None:
+                logits = predictor.forward_logits(batch)
+                row['max_logit_diff'] = round((logits - reference_logits).abs().max().item(), 4)
+                row['top1_agreement'] = round(
+                    (logits.argmax(1) == reference_logits.argmax(1)).float().mean().item(), 3)
+            results[label][name] = row
+            print(f"  {label:>10} {name:<12} {ms:7.2f} ms/image  "
+                  f"{row['speedup']:.2f}x  max diff {row['max_abs_diff']:.4f}")
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark JPEG decoding for inference")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--no-model', action='store_true',
+                        help="Only compare input tensors, not logits")
+    parser.add_argument('--decoders', nargs='+', default=list(DECODERS), choices=list(DECODERS))
+    parser.add_argument('--per-size', type=int, default=4,
+                        help="Fixture images per resolution")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--output', default='bench_decode.json')
+    args = parser.parse_args(argv)
+
+    decoders = list(args.decoders)
+    if decode_jpeg is None and 'torchvision' in decoders:
+        print("torchvision.io.decode_jpeg unavailable, skipping the torchvision decoder")
+        decoders.remove('torchvision')
+
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = make_fixtures(workdir, per_size=args.per_size, sizes=DEFAULT_SIZES,
+                              formats=('jpg',))
+        # Decode from memory so disk reads don't blur the comparison
+        groups = {}
+        for (width, height) in DEFAULT_SIZES:
+            label = f'{width}x{height}'
+            groups[label] = []
+            for path in paths:
+                if f'_{label}_' in path:
+                    with open(path, 'rb') as f:
+                        groups[label].append(f.read())
+
+        predictor = None
+        weights = None
+        if not args.no_model:
+            model_path, weights = resolve_checkpoint(args.model, workdir)
+            predictor = CarBrandPredictor(model_path)
+
+        print(f"Decoding {len(paths)} JPEG fixtures, {args.repeats} repeats")
+        results = run(groups, decoders, args.repeats, predictor)
+
+    failures = [
+        f"{label}/{name}: max diff {row['max_abs_diff']} > {args.tolerance}"
+        for label, rows in results.items() for name, row in rows.items()
+        if row.get('max_abs_diff', 0) > args.tolerance
+    ]
+
+    report = {
+        'meta': {
+            'torch': torch.__version__,
+            'threads': torch.get_num_threads(),
+            'per_size': args.per_size,
+            'repeats': args.repeats,
+            'tolerance': args.tolerance,
+            'weights': weights
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Results written to {args.output}")
+
+    for failure in failures:
+        print(f"✗ Outside tolerance: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
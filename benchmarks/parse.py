@@ -0,0 +1,180 @@
+"""
+HTML parser benchmark for the scraper
+
+Times image-URL extraction over saved pool pages (or generated
+Flickr-like fixtures): the BeautifulSoup html.parser baseline, BeautifulSoup
+on lxml, and the streaming lxml extractor. Reports per-page time,
+throughput, peak traced memory and, for streaming, time to the first
+URL, and checks every parser finds the same URLs.
+
+Usage:
+    python -m benchmarks.parse --fixtures saved_pages/ --output bench_parse.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from scripts.scrapper import (
+    extract_image_urls_soup, iter_image_urls, normalize_image_url, _img_source
+)
+
+DEFAULT_PAGE_SIZES = (50, 500, 2000)  # photos per generated page
+DEFAULT_CHUNK_SIZE = 16384
+
+
+def make_fixture(photos, seed=0):
+    """
+    Generate a pool page shaped like Flickr's: inline scripts, nested
+    layout divs and one photo tile (plus an avatar) per photo
+
+    Returns:
+        Page body as bytes
+    """
+    parts = ['<!DOCTYPE html><html><head><title>Pool</title>',
+             '<script>' + 'var modelExport = {"a": 1};' * 200 + '</script>',
+             '</head><body><div class="main"><div class="photo-list-view">']
+    for idx in range(photos):
+        photo_id = 50000000000 + seed * 100000 + idx
+        parts.append(
+            f'<div class="view photo-list-photo-view" style="width:240px">'
+            f'<div class="interaction-view"><a href="/photos/user{idx}/{photo_id}/">'
+            f'<img src="//live.staticflickr.com/65535/{photo_id}_abcdef{idx % 10}_m.jpg" '
+            f'alt="Car {idx}" loading="lazy"></a>'
+            f'<span class="title">Photo {idx}</span>'
+            f'<img class="avatar" src="//combo.staticflickr.com/pw/images/buddyicon{idx % 5}_s.png">'
+            f'</div></div>'
+        )
+    parts.append('</div></div><footer>' + '<p>footer text</p>' * 50 + '</footer></body></html>')
+    return ''.join(parts).encode('utf-8')
+
+
+def load_fixtures(directory):
+    """Read saved .html pages from a directory"""
+    fixtures = {}
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(('.html', '.htm')):
+            with open(os.path.join(directory, name), 'rb') as f:
+                fixtures[name] = f.read()
+    return fixtures
+
+
+def _soup_lxml(html):
+    soup = BeautifulSoup(html, 'lxml')
+    urls = (normalize_image_url(_img_source(img)) for img in soup.find_all('img'))
+    return [url for url in urls if url]
+
+
+def _stream(html, chunk_size=DEFAULT_CHUNK_SIZE):
+    chunks = (html[start:start + chunk_size] for start in range(0, len(html), chunk_size))
+    return list(iter_image_urls(chunks))
+
+
+PARSERS = {
+    'soup_html_parser': extract_image_urls_soup,
+    'soup_lxml': _soup_lxml,
+    'lxml_stream': _stream,
+}
+
+
+def _first_url_ms(html, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Time until the streaming extractor yields its first URL"""
+    chunks = (html[start:start + chunk_size] for start in range(0, len(html), chunk_size))
+    start = time.perf_counter()
+    next(iter_image_urls(chunks), None)
+    return (time.perf_counter() - start) * 1000
+
+
+def bench_parser(parse, html, repeats):
+    """Median time and peak traced memory of one parser on one page"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        urls = parse(html)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    parse(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return urls, {
+        'median_ms': median * 1000,
+        'mb_per_s': len(html) / (1024 * 1024) / median if median else 0.0,
+        'peak_mem_mb': peak / (1024 * 1024)
+    }
+
+
+def run(fixtures, parsers, repeats):
+    """Benchmark every parser on every fixture; returns the report dict"""
+    report = {}
+    for name, html in fixtures.items():
+        page = {'bytes': len(html), 'parsers': {}}
+        reference = None
+
+        # The extractors print a per-page summary; keep the timing output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            for parser_name in parsers:
+                urls, stats = bench_parser(PARSERS[parser_name], html, repeats)
+                if reference is None:
+                    reference = urls
+                stats['urls'] = len(urls)
+                stats['matches_reference'] = urls == reference
+                page['parsers'][parser_name] = stats
+            if 'lxml_stream' in parsers:
+                page['parsers']['lxml_stream']['first_url_ms'] = _first_url_ms(html)
+
+        report[name] = page
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark scraper HTML parsing")
+    parser.add_argument('--fixtures', help="Directory of saved pool pages (default: generated)")
+    parser.add_argument('--photos', type=int, nargs='+', default=list(DEFAULT_PAGE_SIZES),
+                        help="Photos per generated page")
+    parser.add_argument('--parsers', nargs='+', default=list(PARSERS), choices=list(PARSERS))
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', default='bench_parse.json')
+    args = parser.parse_args(argv)
+
+    if args.fixtures:
+        fixtures = load_fixtures(args.fixtures)
+    else:
+        fixtures = {f'generated_{photos}.html': make_fixture(photos) for photos in args.photos}
+    if not fixtures:
+        print("No fixtures found")
+        return 1
+
+    report = run(fixtures, args.parsers, args.repeats)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Results written to {args.output}")
+
+    print(f"\n{'='*50}")
+    for name, page in report.items():
+        print(f"{name} ({page['bytes'] / 1024:.0f} KB)")
+        for parser_name, stats in page['parsers'].items():
+            first = f", first URL {stats['first_url_ms']:.1f} ms" if 'first_url_ms' in stats else ''
+            check = '' if stats['matches_reference'] else '  ✗ URL mismatch'
+            print(f"  {parser_name:<18} {stats['median_ms']:8.1f} ms  "
+                  f"{stats['peak_mem_mb']:6.1f} MB peak{first}{check}")
+    print(f"{'='*50}\n")
+
+    mismatched = any(not stats['matches_reference']
+                     for page in report.values() for stats in page['parsers'].values())
+    return 1 if mismatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+"""
+Inference benchmark suite for the predictor
+
+Generates synthetic JPEG/PNG fixtures and measures cold-start load time,
+per-image latency percentiles, throughput across batch sizes and torch
+thread counts, and peak RSS. Runs offline on CPU and writes JSON so runs
+can be compared across commits.
+
+Usage:
+    python -m benchmarks.predict --output bench.json
+    python -m benchmarks.predict --compare baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torchvision.models as models
+from PIL import Image
+
+from app.predictor import (
+    CarBrandPredictor, BRAND_LABELS, DEFAULT_MODEL_PATH,
+    batch_classify_images, get_predictor
+)
+
+DEFAULT_SIZES = ((320, 240), (640, 480), (1024, 768), (2048, 1536))
+DEFAULT_BATCH_SIZES = (1, 8, 32)
+DEFAULT_THREAD_COUNTS = (1, 2, 4)
+
+# Durations and memory are lower-is-better; rates (..._per_s) are higher-is-better
+_LOWER_IS_BETTER = ('_s', '_ms', '_mb')
+
+_COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from app.predictor import CarBrandPredictor
+imported = time.perf_counter()
+predictor = CarBrandPredictor(sys.argv[1], backend=sys.argv[2])
+loaded = time.perf_counter()
+predictor.warmup()
+warm = time.perf_counter()
+print(json.dumps({'import_s': imported - start, 'load_s': loaded - imported,
+                  'warmup_s': warm - loaded, 'total_s': warm - start}))
+"""
+
+
+def make_fixtures(directory, per_size=4, sizes=DEFAULT_SIZES, formats=('jpg', 'png'), seed=0):
+    """
+    Write synthetic car-photo-sized images
+
+    Args:
+        directory: Output directory
+        per_size: Images per (resolution, format) pair
+        sizes: (width, height) resolutions
+        formats: File formats to generate
+
+    Returns:
+        List of fixture paths
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+
+    for width, height in sizes:
+        # Smooth gradients plus noise compress like real photos, not like pure noise
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        for fmt in formats:
+            for idx in range(per_size):
+                noise = rng.normal(0, 25, (height, width, 3)).astype(np.float32)
+                pixels = np.clip(gradient + noise + rng.integers(0, 80), 0, 255).astype(np.uint8)
+                path = os.path.join(directory, f'fixture_{width}x{height}_{idx}.{fmt}')
+                if fmt == 'jpg':
+                    Image.fromarray(pixels).save(path, quality=90)
+                else:
+                    Image.fromarray(pixels).save(path)
+                paths.append(path)
+
+    return paths
+
+
+def resolve_checkpoint(model_path, workdir):
+    """
+    Use the real checkpoint if it loads, otherwise random weights
+
+    The benchmark measures speed, not accuracy, so random weights of the
+    same architecture keep it runnable offline (e.g. without Git LFS).
+
+    Returns:
+        (checkpoint path, 'trained' or 'random')
+    """
+    try:
+        torch.load(model_path, map_location='cpu')
+        return model_path, 'trained'
+    except Exception as e:
+        print(f"Checkpoint {model_path} unavailable ({e}); using random weights")
+
+    model = models.mobilenet_v2(weights=None)
+    model.classifier[1] = nn.Linear(model.last_channel, len(BRAND_LABELS))
+    random_path = os.path.join(workdir, 'random_weights.pt')
+    torch.save(model.state_dict(), random_path)
+    return random_path, 'random'
+
+
+def bench_cold_start(model_path, backend, runs=3, calibration_dir=None):
+    """Import + load + warm-up time in fresh interpreters"""
+    env = dict(os.environ)
+    if calibration_dir:
+        env['CALIBRATION_DIR'] = calibration_dir
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', _COLD_START_SCRIPT, model_path, backend],
+            capture_output=True, text=True, check=True, env=env,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+
+def _percentiles(samples_ms):
+    cuts = statistics.quantiles(samples_ms, n=100, method='inclusive')
+    return {
+        'p50_ms': statistics.median(samples_ms),
+        'p95_ms': cuts[94],
+        'p99_ms': cuts[98],
+        'mean_ms': statistics.fmean(samples_ms)
+    }
+
+
+def bench_latency(predictor, paths, repeats=3):
+    """Per-image predict_single latency percentiles, overall and per resolution"""
+    overall = []
+    by_size = {}
+
+    for _ in range(repeats):
+        for path in paths:
+            start = time.perf_counter()
+            predictor.predict_single(path)
+            elapsed = (time.perf_counter() - start) * 1000
+            overall.append(elapsed)
+            size = os.path.basename(path).split('_')[1]
+            by_size.setdefault(size, []).append(elapsed)
+
+    report = _percentiles(overall)
+    report['by_resolution'] = {size: _percentiles(samples) for size, samples in by_size.items()}
+    return report
+
+
+def bench_throughput(predictor, paths, batch_sizes, thread_counts, num_workers, repeats=2):
+    """images/sec of predict_images across batch sizes and torch thread counts"""
+    original_threads = torch.get_num_threads()
+    rows = []
+
+    try:
+        for threads in thread_counts:
+            torch.set_num_threads(threads)
+            for batch_size in batch_sizes:
+                predictor.predict_images(paths[:batch_size], batch_size=batch_size,
+                                         num_workers=num_workers)
+                stats = {}
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    predictor.predict_images(paths, batch_size=batch_size,
+                                             num_workers=num_workers, stats=stats)
+                elapsed = time.perf_counter() - start
+
+                rows.append({
+                    'threads': threads,
+                    'batch_size': batch_size,
+                    'images_per_s': repeats * len(paths) / elapsed,
+                    'input_wait_s': stats.get('input_wait_s', 0.0)
+                })
+    finally:
+        torch.set_num_threads(original_threads)
+
+    return rows
+
+
+def bench_legacy(paths, model_path, repeats=2):
+    """images/sec of batch_classify_images (prediction cache cleared each run)"""
+    shared = get_predictor(model_path)
+    elapsed = 0.0
+    for _ in range(repeats):
+        if shared.cache is not None:
+            shared.cache.clear()
+        start = time.perf_counter()
+        batch_classify_images(paths, model_path=model_path)
+        elapsed += time.perf_counter() - start
+    return {'images_per_s': repeats * len(paths) / elapsed}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _flatten(report, prefix=''):
+    """Flatten nested numeric metrics into dotted keys"""
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, list):
+            for row in value:
+                label = ','.join(f"{k}={row[k]}" for k in ('threads', 'batch_size') if k in row)
+                flat.update(_flatten({k: v for k, v in row.items()
+                                      if k not in ('threads', 'batch_size')},
+                                     f"{name}[{label}]."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_reports(current, baseline, tolerance=0.10):
+    """
+    List metrics that regressed by more than `tolerance`
+
+    Returns:
+        List of (metric, baseline value, current value) tuples
+    """
+    current_flat = _flatten({k: v for k, v in current.items() if k != 'meta'})
+    baseline_flat = _flatten({k: v for k, v in baseline.items() if k != 'meta'})
+    regressions = []
+
+    for metric, old in baseline_flat.items():
+        new = current_flat.get(metric)
+        if new is None or old == 0:
+            continue
+        lower_is_better = metric.endswith(_LOWER_IS_BETTER) and not metric.endswith('per_s')
+        change = (new - old) / old
+        if (lower_is_better and change > tolerance) or (not lower_is_better and change < -tolerance):
+            regressions.append((metric, old, new))
+
+    return regressions
+
+
+def run(args):
+    """Run the full benchmark and return the report dict"""
+    with tempfile.TemporaryDirectory(prefix='predict_bench_') as workdir:
+        return _run_in(args, workdir)
+
+
+def _run_in(args, workdir):
+    """run() with fixtures and fallback weights under workdir"""
+    model_path, weights = resolve_checkpoint(args.model, workdir)
+
+    print("Generating fixtures...")
+    fixture_dir = os.path.join(workdir, 'fixtures')
+    paths = make_fixtures(fixture_dir, per_size=args.per_size)
+    # static_int8 is calibrated on the fixtures unless CALIBRATION_DIR is set
+    backend_options = {}
+    if args.backend == 'static_int8':
+        backend_options['calibration_dir'] = os.environ.get('CALIBRATION_DIR', fixture_dir)
+
+    print("Measuring cold start...")
+    cold_start = bench_cold_start(model_path, args.backend, runs=args.cold_runs,
+                                  calibration_dir=backend_options.get('calibration_dir'))
+
+    predictor = CarBrandPredictor(model_path, backend=args.backend, tta_views=args.tta_views,
+                                  **backend_options)
+    predictor.warmup()
+
+    print("Measuring per-image latency...")
+    latency = bench_latency(predictor, paths, repeats=args.repeats)
+
+    print("Measuring throughput...")
+    throughput = bench_throughput(predictor, paths, args.batch_sizes, args.threads,
+                                  args.num_workers, repeats=args.repeats)
+    legacy = bench_legacy(paths, model_path, repeats=args.repeats)
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'cpu_count': os.cpu_count(),
+            'backend': args.backend,
+            'tta_views': args.tta_views,
+            'weights': weights,
+            'fixtures': len(paths)
+        },
+        'cold_start': cold_start,
+        'latency': latency,
+        'throughput': throughput,
+        'batch_classify_images': legacy,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CarBrandPredictor inference")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--backend', default='eager')
+    parser.add_argument('--tta-views', type=int, default=0,
+                        help="Test-time augmentation views per image (0 = off)")
+    parser.add_argument('--output', default='bench_predict.json')
+    parser.add_argument('--compare', help="Baseline JSON to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    parser.add_argument('--per-size', type=int, default=4,
+                        help="Fixtures per resolution and format")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(DEFAULT_BATCH_SIZES))
+    parser.add_argument('--threads', type=int, nargs='+', default=list(DEFAULT_THREAD_COUNTS))
+    parser.add_argument('--num-workers', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=2)
+    parser.add_argument('--cold-runs', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    # Read before the report is written: --output may be the baseline itself
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report = run(args)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Results written to {args.output}")
+
+    print(f"\n{'='*50}")
+    print(f"Cold start: {report['cold_start']['total_s']:.2f}s")
+    print(f"Latency p50/p95/p99: {report['latency']['p50_ms']:.1f} / "
+          f"{report['latency']['p95_ms']:.1f} / {report['latency']['p99_ms']:.1f} ms")
+    for row in report['throughput']:
+        print(f"  threads={row['threads']} batch={row['batch_size']}: "
+              f"{row['images_per_s']:.1f} img/s")
+    print(f"Peak RSS: {report['peak_rss_mb']:.0f} MB")
+    print(f"{'='*50}\n")
+
+    if baseline is not None:
+        regressions = compare_reports(report, baseline, args.tolerance)
+        for metric, old, new in regressions:
+            print(f"✗ Regression in {metric}: {old:.4g} -> {new:.4g}")
+        if regressions:
+            return 1
+        print("✓ No regressions against baseline")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,14 +2,19 @@
 Main entry point for the Flask application
 """
 
-from app.routes import app
+from app.startup import get_startup_profile, start_warmup
 import os
 
+with get_startup_profile().phase('import flask app'):
+    from app.routes import app
+
 if __name__ == '__main__':
     # Create necessary directories
-    os.makedirs('static/raw_images', exist_ok=True)
     os.makedirs('static', exist_ok=True)
     
+    # Import torch and load the model in the background; /ready reports when it's hot
+    start_warmup()
+    
     # Get port from environment (for deployment) or use 5001 locally
     port = int(os.environ.get('PORT', 5001))
     
@@ -0,0 +1,284 @@
+"""
+Duplicate filtering for scraped images
+Canonical photo keys let the crawl frontier skip size variants of a photo
+before download; near-duplicate downloads (resized or recompressed
+copies) are dropped by perceptual hash looked up in a BK-tree
+"""
+
+import io
+import os
+import re
+from urllib.parse import urlsplit
+
+import numpy as np
+from PIL import Image
+
+# Hash side length: 8 gives 64-bit hashes
+DEFAULT_HASH_SIZE = 8
+# Hamming distance (out of 64 bits) at or below which two images are duplicates
+DEFAULT_MAX_DISTANCE = int(os.environ.get('DEDUPE_MAX_DISTANCE', 6))
+HASH_METHODS = ('dhash', 'ahash')
+
+# <server>/<photo id>_<secret>[_<size suffix>].<ext> on Flickr's CDN
+_FLICKR_PHOTO = re.compile(r'/(\d+)_([0-9a-f]+)(?:_[a-z0-9]{1,2})?\.(?:jpe?g|png|gif)$', re.I)
+
+
+def canonical_image_key(url):
+    """
+    Key identifying the photo behind an image URL, ignoring size variants
+
+    Flickr serves one photo at many sizes (_m, _n, _w, _b, ...) and from
+    several hosts; those all map to the photo id and secret. Other URLs
+    are keyed by host and path without query string or fragment.
+
+    Args:
+        url: Image URL
+
+    Returns:
+        Hashable key
+    """
+    parts = urlsplit(url)
+    match = _FLICKR_PHOTO.search(parts.path)
+    if match and 'staticflickr' in parts.netloc:
+        return ('flickr', match.group(1), match.group(2))
+    return ('url', parts.netloc.lower(), parts.path)
+
+
+def load_thumbnail(data, size):
+    """
+    Decode an image straight to a small grayscale thumbnail
+
+    JPEGs are decoded at reduced scale (Image.draft), so a full-size
+    photo is never materialized.
+
+    Args:
+        data: Encoded image bytes
+        size: (width, height) of the thumbnail
+
+    Returns:
+        HxW uint8 array
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        img.draft('L', (size[0] * 4, size[1] * 4))
+        return np.asarray(img.convert('L').resize(size, Image.BILINEAR), dtype=np.uint8)
+
+
+def _pack_bits(bits):
+    """Pack an NxB boolean array (B <= 64) into N Python ints"""
+    packed = np.packbits(bits, axis=1)
+    return [int.from_bytes(row.tobytes(), 'big') for row in packed]
+
+
+def average_hash(thumbnails):
+    """
+    aHash of a batch: each pixel compared with its thumbnail's mean
+
+    Args:
+        thumbnails: NxSxS uint8 array
+
+    Returns:
+        List of N integer hashes
+    """
+    flat = thumbnails.reshape(len(thumbnails), -1).astype(np.float32)
+    return _pack_bits(flat > flat.mean(axis=1, keepdims=True))
+
+
+def difference_hash(thumbnails):
+    """
+    dHash of a batch: each pixel compared with its right-hand neighbour
+
+    Args:
+        thumbnails: NxSx(S+1) uint8 array
+
+    Returns:
+        List of N integer hashes
+    """
+    bits = thumbnails[:, :, 1:] > thumbnails[:, :, :-1]
+    return _pack_bits(bits.reshape(len(thumbnails), -1))
+
+
+def image_hashes(images, method='dhash', hash_size=DEFAULT_HASH_SIZE):
+    """
+    Perceptual hashes of encoded images, computed over one thumbnail batch
+
+    Args:
+        images: List of encoded image bytes
+        method: 'dhash' or 'ahash'
+        hash_size: Hash side length (hash_size ** 2 bits)
+
+    Returns:
+        List of integer hashes, None where an image couldn't be decoded
+    """
+    if method not in HASH_METHODS:
+        raise ValueError(f"Unknown hash method '{method}', expected one of {HASH_METHODS}")
+
+    size = (hash_size + 1, hash_size) if method == 'dhash' else (hash_size, hash_size)
+    thumbnails = []
+    decoded = []
+    for idx, data in enumerate(images):
+        try:
+            thumbnails.append(load_thumbnail(data, size))
+            decoded.append(idx)
+        except Exception:
+            continue
+
+    hashes = [None] * len(images)
+    if thumbnails:
+        batch = np.stack(thumbnails)
+        values = difference_hash(batch) if method == 'dhash' else average_hash(batch)
+        for idx, value in zip(decoded, values):
+            hashes[idx] = value
+    return hashes
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes under Hamming distance.
+
+    A radius-r search only descends into children whose edge distance
+    lies within r of the query's distance to the node, so lookups touch
+    a small part of the tree instead of every stored hash.
+    """
+
+    def __init__(self):
+        self._root = None
+        self.size = 0
+
+    def add(self, value, item=None):
+        """Insert a hash with an optional payload"""
+        self.size += 1
+        if self._root is None:
+            self._root = (value, item, {})
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, item, {})
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """
+        Find stored hashes within max_distance of value
+
+        Returns:
+            List of (distance, hash, item) tuples, closest first
+        """
+        matches = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                matches.append((distance, node_value, item))
+            for edge in range(distance - max_distance, distance + max_distance + 1):
+                child = children.get(edge)
+                if child is not None:
+                    stack.append(child)
+        return sorted(matches, key=lambda match: match[0])
+
+    def __len__(self):
+        return self.size
+
+
+class ImageDeduplicator:
+    """
+    Rejects images perceptually identical to one already accepted.
+
+    accept() plugs into the downloader's accept predicate, so rejected
+    duplicates don't count towards the scrape limit and further
+    candidates are fetched in their place.
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, method='dhash',
+                 hash_size=DEFAULT_HASH_SIZE):
+        """
+        Args:
+            max_distance: Largest Hamming distance treated as a duplicate
+            method: 'dhash' or 'ahash'
+            hash_size: Hash side length
+        """
+        self.max_distance = max_distance
+        self.method = method
+        self.hash_size = hash_size
+
+        self.index = BKTree()
+        self.image_duplicates = 0
+
+    def find_duplicate(self, image_hash):
+        """Closest indexed (distance, hash, name) within max_distance, or None"""
+        matches = self.index.search(image_hash, self.max_distance)
+        return matches[0] if matches else None
+
+    def accept(self, result):
+        """
+        Decide whether a downloaded image is new
+
+        Args:
+            result: DownloadResult
+
+        Returns:
+            False for near-duplicates of an accepted image or undecodable
+            content, True otherwise (the image is then indexed, so only
+            call this for images that will be kept)
+        """
+        image_hash = image_hashes([result.content], self.method, self.hash_size)[0]
+        if image_hash is None:
+            print(f"✗ Undecodable image: {result.url}")
+            return False
+
+        match = self.find_duplicate(image_hash)
+        if match is not None:
+            self.image_duplicates += 1
+            print(f"✗ Duplicate of {match[2]} (distance {match[0]}): {result.url}")
+            return False
+
+        self.index.add(image_hash, result.url)
+        return True
+
+    def stats(self):
+        return {
+            'image_duplicates': self.image_duplicates,
+            'unique_images': len(self.index)
+        }
+
+
+def dedupe_images(named_images, max_distance=DEFAULT_MAX_DISTANCE, method='dhash',
+                  hash_size=DEFAULT_HASH_SIZE):
+    """
+    Drop near-duplicates from a set of already downloaded images
+
+    All thumbnails are hashed in one vectorized batch; the first image of
+    each duplicate group is kept.
+
+    Args:
+        named_images: List of (name, encoded bytes) pairs
+        max_distance: Largest Hamming distance treated as a duplicate
+
+    Returns:
+        (kept pairs, {dropped name: name of the kept image it duplicates})
+    """
+    hashes = image_hashes([data for _, data in named_images], method, hash_size)
+    index = BKTree()
+    kept = []
+    dropped = {}
+
+    for (name, data), image_hash in zip(named_images, hashes):
+        if image_hash is None:
+            kept.append((name, data))
+            continue
+        matches = index.search(image_hash, max_distance)
+        if matches:
+            dropped[name] = matches[0][2]
+            continue
+        index.add(image_hash, name)
+        kept.append((name, data))
+
+    return kept, dropped
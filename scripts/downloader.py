@@ -0,0 +1,325 @@
+"""
+Concurrent image downloader
+Reuses one pooled keep-alive session, caps in-flight requests per host,
+rate-limits with a token bucket and retries with exponential backoff
+"""
+
+import asyncio
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.metrics import get_metrics
+
+DownloadResult = namedtuple('DownloadResult', ['url', 'content', 'content_type'])
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_PER_HOST = 4
+DEFAULT_RATE = 8.0  # requests per second
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+
+
+class TokenBucket:
+    """
+    Thread-safe token-bucket rate limiter
+
+    Allows bursts of up to `capacity` requests, refilling at `rate`
+    tokens per second. A rate of None or 0 disables limiting.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate or 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        if not self.rate:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                delay = (1 - self._tokens) / self.rate
+
+            time.sleep(delay)
+
+
+def build_session(headers=None, pool_size=DEFAULT_MAX_WORKERS,
+                  retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """
+    Create a keep-alive session with a connection pool and retry policy
+
+    Args:
+        headers: Default headers sent with every request
+        pool_size: Connections kept open per host
+        retries: Retry attempts for connection errors and 429/5xx responses
+        backoff: Exponential backoff factor in seconds
+
+    Returns:
+        Configured requests.Session
+    """
+    session = requests.Session()
+    if headers:
+        session.headers.update(headers)
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+class ConcurrentDownloader:
+    """
+    Downloads many URLs concurrently over a shared pooled session.
+
+    Use iter_downloads() for a thread pool or iter_downloads_async()
+    from asyncio code. Both yield DownloadResult objects as they
+    complete and stop once `limit` results have been accepted.
+    """
+
+    def __init__(self, headers=None, max_workers=DEFAULT_MAX_WORKERS,
+                 per_host=DEFAULT_PER_HOST, rate=DEFAULT_RATE, burst=None,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 timeout=10, session=None, http_cache=None, fresh_for=0):
+        """
+        Args:
+            headers: Default request headers
+            max_workers: Maximum downloads in flight overall
+            per_host: Maximum downloads in flight to a single host
+            rate: Requests per second across all hosts (None = unlimited)
+            burst: Token-bucket capacity (defaults to rate)
+            retries: Retry attempts per request
+            backoff: Exponential backoff factor in seconds
+            timeout: Per-request timeout in seconds
+            session: Existing session to reuse instead of building one
+            http_cache: Optional scripts.http_cache.HttpCache; fresh
+                entries skip the network, stale ones are revalidated
+            fresh_for: Seconds cached bodies are served without revalidation
+        """
+        self.max_workers = max(1, max_workers)
+        self.per_host = max(1, per_host)
+        self.timeout = timeout
+        self.session = session or build_session(
+            headers=headers, pool_size=self.max_workers,
+            retries=retries, backoff=backoff
+        )
+        self.bucket = TokenBucket(rate, burst)
+        self.http_cache = http_cache
+        self.fresh_for = fresh_for
+
+        self.attempted = 0
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, url):
+        """Get the semaphore limiting concurrency for a URL's host"""
+        host = urlparse(url).netloc
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.per_host)
+                self._host_slots[host] = slot
+            return slot
+
+    def fetch(self, url):
+        """
+        Download a single URL
+
+        Args:
+            url: URL to download
+
+        Returns:
+            DownloadResult, or None if the download failed
+        """
+        with self._lock:
+            self.attempted += 1
+        metrics = get_metrics()
+
+        # Fresh cache hits cost neither bandwidth nor rate-limit tokens
+        if self.http_cache is not None:
+            response = self.http_cache.get_fresh(url)
+            if response is not None:
+                metrics.inc('images_total', stage='download')
+                return DownloadResult(url, response.content, response.headers.get('content-type', ''))
+
+        with self._host_slot(url):
+            self.bucket.acquire()
+            try:
+                with metrics.timer('download'):
+                    response = self.get(url)
+                    response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                print(f"✗ Failed to download image: {e}")
+                return None
+
+        metrics.inc('images_total', stage='download')
+        return DownloadResult(url, response.content, response.headers.get('content-type', ''))
+
+    def get(self, url, timeout=None, fresh_for=None):
+        """
+        GET a URL on the pooled session, through the HTTP cache if set
+
+        Args:
+            url: URL to fetch
+            timeout: Request timeout (defaults to the downloader's)
+            fresh_for: Cache freshness override in seconds
+
+        Returns:
+            requests.Response
+        """
+        timeout = timeout or self.timeout
+        if self.http_cache is None:
+            return self.session.get(url, timeout=timeout)
+
+        if fresh_for is None:
+            fresh_for = self.fresh_for
+        return self.http_cache.fetch(self.session, url, timeout=timeout, fresh_for=fresh_for)
+
+    def stream(self, url, timeout=None, fresh_for=None, chunk_size=16384):
+        """
+        GET a URL and yield its body in chunks as they arrive
+
+        Goes through the HTTP cache if set (see HttpCache.stream).
+
+        Raises:
+            requests.HTTPError: For error responses
+        """
+        timeout = timeout or self.timeout
+        if self.http_cache is not None:
+            if fresh_for is None:
+                fresh_for = self.fresh_for
+            yield from self.http_cache.stream(self.session, url, timeout=timeout,
+                                              fresh_for=fresh_for, chunk_size=chunk_size)
+            return
+
+        with self.session.get(url, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            yield from response.iter_content(chunk_size)
+
+    def iter_downloads(self, urls, limit=None, accept=None):
+        """
+        Download URLs on a thread pool, yielding results as they complete
+
+        Only up to max_workers requests are in flight at once. New URLs
+        are submitted only while fewer than `limit` results have been
+        accepted, so failures are replaced by further candidates without
+        overshooting the budget.
+
+        Args:
+            urls: Iterable of candidate URLs
+            limit: Stop after this many accepted results (None = all)
+            accept: Optional predicate on DownloadResult; rejected
+                results don't count towards the limit. Only called while
+                under the limit, and every result it accepts is yielded.
+
+        Yields:
+            Accepted DownloadResult objects
+        """
+        pending_urls = iter(urls)
+        accepted = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            in_flight = set()
+
+            def refill():
+                budget = self.max_workers if limit is None else limit - accepted
+                while len(in_flight) < min(self.max_workers, budget):
+                    url = next(pending_urls, None)
+                    if url is None:
+                        return
+                    in_flight.add(pool.submit(self.fetch, url))
+
+            refill()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.discard(future)
+                    result = future.result()
+                    # Limit first: accept may record the result (e.g. index its hash)
+                    if result is None or (limit is not None and accepted >= limit):
+                        continue
+                    if accept and not accept(result):
+                        continue
+
+                    accepted += 1
+                    yield result
+
+                if limit is not None and accepted >= limit:
+                    for future in in_flight:
+                        future.cancel()
+                    return
+                refill()
+
+    async def iter_downloads_async(self, urls, limit=None, accept=None):
+        """
+        Asyncio variant of iter_downloads()
+
+        Requests run through asyncio.to_thread on the same pooled
+        session, with the same per-host caps and rate limit.
+
+        Yields:
+            Accepted DownloadResult objects
+        """
+        pending_urls = iter(urls)
+        accepted = 0
+        in_flight = set()
+
+        def refill():
+            budget = self.max_workers if limit is None else limit - accepted
+            while len(in_flight) < min(self.max_workers, budget):
+                url = next(pending_urls, None)
+                if url is None:
+                    return
+                in_flight.add(asyncio.ensure_future(asyncio.to_thread(self.fetch, url)))
+
+        refill()
+        try:
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    in_flight.discard(task)
+                    result = task.result()
+                    # Limit first: accept may record the result (e.g. index its hash)
+                    if result is None or (limit is not None and accepted >= limit):
+                        continue
+                    if accept and not accept(result):
+                        continue
+
+                    accepted += 1
+                    yield result
+
+                if limit is not None and accepted >= limit:
+                    return
+                refill()
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    def close(self):
+        """Close the pooled session"""
+        self.session.close()
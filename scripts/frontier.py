@@ -0,0 +1,249 @@
+"""
+Crawl frontier for multi-page, multi-source scraping
+Walks the pages of several group pools at once, never queues the same
+photo twice, spaces out page requests per host, and splits the image
+budget across sources
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from scripts.dedup import canonical_image_key
+
+# Pool pages fetched per source at most
+DEFAULT_MAX_PAGES = int(os.environ.get('CRAWL_MAX_PAGES', 10))
+# Minimum seconds between page requests to the same host
+DEFAULT_PAGE_DELAY = float(os.environ.get('CRAWL_PAGE_DELAY', 0.5))
+# Buffered URLs per source below which its next page is fetched
+DEFAULT_PREFETCH_AT = 8
+
+
+def pool_page_url(base_url, page):
+    """URL of page `page` (1-based) of a Flickr group pool"""
+    if page == 1:
+        return base_url
+    return f"{base_url.rstrip('/')}/page{page}/"
+
+
+class HostPoliteness:
+    """Spaces out requests to each host by at least `delay` seconds"""
+
+    def __init__(self, delay=DEFAULT_PAGE_DELAY):
+        self.delay = delay
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """Block until the URL's host may be contacted again"""
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, 0.0))
+            self._next_slot[host] = slot + self.delay
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class _Source:
+    """Crawl state of one pool"""
+
+    def __init__(self, url):
+        self.url = url
+        self.next_page = 1
+        self.pages = 0
+        self.buffer = deque()
+        self.pending = None
+        self.exhausted = False
+        self.accepted = 0
+        self.quota = 0
+
+    @property
+    def done(self):
+        return self.exhausted and not self.buffer and self.pending is None
+
+
+class CrawlFrontier:
+    """
+    Lazily produces candidate image URLs from several pool sources.
+
+    Each source's next page is fetched on a background thread once its
+    buffered URLs run low, so pages of different pools load in parallel
+    while images download. Pages are streamed: URLs join the buffer as
+    soon as they are parsed, before the page has finished arriving.
+    URLs are handed out round-robin across sources that are under their
+    share of the budget. A source stops when a page fails, yields no new
+    photos or max_pages is reached, and its unused share is spread over
+    the remaining sources. Shares count accepted images, so a source can
+    overshoot its share by the downloads it has in flight.
+
+    Feed iter_urls() to the downloader and pass each download it yields
+    to record() so the frontier knows which sources delivered.
+    """
+
+    def __init__(self, fetch_page, sources, limit, max_pages=DEFAULT_MAX_PAGES,
+                 page_delay=DEFAULT_PAGE_DELAY, prefetch_at=DEFAULT_PREFETCH_AT, seen=None):
+        """
+        Args:
+            fetch_page: Callable(page url) -> iterable of image URLs on it;
+                a generator lets URLs through while the page downloads
+            sources: Pool URLs to crawl
+            limit: Total images wanted across all sources
+            max_pages: Pages fetched per source at most
+            page_delay: Minimum seconds between page requests per host
+            prefetch_at: Buffered URLs per source below which the next
+                page is fetched (about the downloader's concurrency)
+            seen: Optional set of canonical photo keys shared across crawls
+        """
+        self.fetch_page = fetch_page
+        self.limit = limit
+        self.max_pages = max_pages
+        self.prefetch_at = prefetch_at
+        self.politeness = HostPoliteness(page_delay)
+        self.seen = set() if seen is None else seen
+        self.duplicate_urls = 0
+
+        self.sources = [_Source(url) for url in dict.fromkeys(sources)]
+        self._owner = {}
+        self._lock = threading.Lock()
+        # Set whenever a URL is buffered or a page finishes
+        self._arrived = threading.Event()
+        self._closed = False
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(self.sources)),
+                                        thread_name_prefix='frontier')
+        self._rebalance()
+
+    def _fetch_page(self, source, url):
+        """Stream one page's new URLs into the source's buffer (background thread)"""
+        self.politeness.wait(url)
+        added = 0
+        for img_url in self.fetch_page(url):
+            if self._closed:
+                break
+            key = canonical_image_key(img_url)
+            with self._lock:
+                if key in self.seen:
+                    self.duplicate_urls += 1
+                    continue
+                self.seen.add(key)
+                self._owner[img_url] = source
+            source.buffer.append(img_url)
+            added += 1
+            self._arrived.set()
+        return added
+
+    def _request_page(self, source):
+        """Start fetching the source's next page in the background"""
+        if source.exhausted or source.pending is not None:
+            return
+        if source.pages >= self.max_pages:
+            source.exhausted = True
+            return
+        source.pending = self._pool.submit(self._fetch_page, source,
+                                           pool_page_url(source.url, source.next_page))
+        source.pending.add_done_callback(lambda _: self._arrived.set())
+        source.next_page += 1
+        source.pages += 1
+
+    def _collect_page(self, source):
+        """Settle a finished page fetch"""
+        future, source.pending = source.pending, None
+        try:
+            added = future.result()
+        except Exception as e:
+            print(f"✗ Stopping {source.url}: {e}")
+            source.exhausted = True
+            return
+
+        if added == 0:
+            # Past the last page Flickr repeats it; nothing new means we're done
+            source.exhausted = True
+
+    def _rebalance(self):
+        """Split what's left of the budget over sources that can still deliver"""
+        active = [source for source in self.sources if not source.done]
+        if not active:
+            return
+        accepted = sum(source.accepted for source in self.sources)
+        share = math.ceil(max(0, self.limit - accepted) / len(active))
+        for source in active:
+            source.quota = source.accepted + share
+
+    def _next_url(self, source):
+        """Next buffered URL of a source, or None if it has none ready yet"""
+        if source.pending is not None and source.pending.done():
+            self._collect_page(source)
+        if len(source.buffer) <= self.prefetch_at:
+            self._request_page(source)
+        if not source.buffer:
+            return None
+        return source.buffer.popleft()
+
+    def iter_urls(self):
+        """
+        Yield candidate image URLs, fetching pages as they are needed
+
+        Blocks only when no source has a URL ready.
+        """
+        try:
+            active_count = len(self.sources)
+            while True:
+                # Cleared before looking, so arrivals during the scan aren't missed
+                self._arrived.clear()
+                active = [source for source in self.sources if not source.done]
+                if not active:
+                    return
+                if len(active) != active_count:
+                    active_count = len(active)
+                    self._rebalance()
+
+                if all(source.accepted >= source.quota for source in active):
+                    # Shares are used up; anything left over goes to who can deliver
+                    self._rebalance()
+                    if all(source.accepted >= source.quota for source in active):
+                        return
+
+                progressed = False
+                for source in active:
+                    if source.accepted >= source.quota:
+                        continue
+                    url = self._next_url(source)
+                    if url is not None:
+                        progressed = True
+                        yield url
+
+                if not progressed and any(source.pending is not None for source in active
+                                          if source.accepted < source.quota):
+                    self._arrived.wait()
+        finally:
+            self.close()
+
+    def record(self, result):
+        """
+        Credit a delivered image to the source it came from
+
+        Call it for downloads actually handed on (yielded by the
+        downloader), not from its accept predicate, so quotas only count
+        kept images.
+        """
+        source = self._owner.get(result.url)
+        if source is not None:
+            source.accepted += 1
+
+    def stats(self):
+        return {
+            'sources': {source.url: {'pages': source.pages, 'accepted': source.accepted}
+                        for source in self.sources},
+            'duplicate_urls': self.duplicate_urls
+        }
+
+    def close(self):
+        self._closed = True
+        for source in self.sources:
+            if source.pending is not None:
+                source.pending.cancel()
+        self._pool.shutdown(wait=False)
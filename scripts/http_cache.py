@@ -0,0 +1,375 @@
+"""
+Persistent HTTP cache for the scraper
+Stores response bodies keyed by URL along with their validators
+(ETag / Last-Modified) so repeat scrapes revalidate with conditional
+requests or skip the network entirely while an entry is still fresh
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from app.metrics import get_metrics
+
+DEFAULT_CACHE_DIR = os.environ.get('SCRAPER_CACHE_DIR', 'cache/http')
+
+# Flickr CDN image URLs embed a per-photo secret, so their content never
+# changes; serve them from cache without revalidating for this long
+IMAGE_MAX_AGE = 30 * 24 * 3600
+
+# Total size of cached bodies; least recently used entries go first
+DEFAULT_MAX_BYTES = int(os.environ.get('SCRAPER_CACHE_MAX_MB', 512)) * 1024 * 1024
+# Entries not used for this many seconds are dropped (0 = keep until evicted by size)
+DEFAULT_MAX_IDLE = int(os.environ.get('SCRAPER_CACHE_MAX_IDLE_DAYS', 7)) * 24 * 3600
+# Once over max_bytes, the cache is pruned to this fraction of it
+PRUNE_TO = 0.9
+
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+def _freshness(headers, fresh_for):
+    """Seconds a response may be served without revalidation"""
+    cache_control = headers.get('cache-control', '')
+    match = _MAX_AGE_RE.search(cache_control)
+    max_age = int(match.group(1)) if match else 0
+    if 'no-cache' in cache_control:
+        max_age = 0
+    return max(max_age, fresh_for)
+
+
+class HttpCache:
+    """
+    URL-keyed response cache on disk.
+
+    The index (validators, content type, expiry) lives in SQLite and
+    bodies are stored as individual files. fetch() serves fresh entries
+    without any request, revalidates stale ones with If-None-Match /
+    If-Modified-Since, and reuses the stored body on 304 Not Modified.
+
+    The cache is pruned when opened and whenever a store takes it over
+    max_bytes: entries idle for longer than max_idle go first, then the
+    least recently used ones until the bodies fit in PRUNE_TO of
+    max_bytes. Body files are deleted along with their rows. Uses only
+    update last_used in memory and are written with the next store.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 max_idle=DEFAULT_MAX_IDLE):
+        """
+        Args:
+            cache_dir: Directory holding the index and cached bodies
+            max_bytes: Maximum total size of cached bodies
+            max_idle: Seconds an unused entry is kept (0 = no limit)
+        """
+        self.cache_dir = cache_dir
+        self.body_dir = os.path.join(cache_dir, 'bodies')
+        self.max_bytes = max_bytes
+        self.max_idle = max_idle
+        os.makedirs(self.body_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'),
+                                   check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' url TEXT PRIMARY KEY,'
+            ' etag TEXT,'
+            ' last_modified TEXT,'
+            ' content_type TEXT,'
+            ' expires REAL NOT NULL,'
+            ' size INTEGER NOT NULL DEFAULT 0,'
+            ' last_used REAL NOT NULL DEFAULT 0)'
+        )
+        self._migrate()
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)'
+        )
+        self._db.commit()
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evicted = 0
+        self._touched = {}
+
+        (self._total_bytes,) = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses'
+        ).fetchone()
+        with self._lock:
+            self._prune()
+
+    def _migrate(self):
+        """Add the size / last_used columns to an index from before pruning"""
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(responses)')}
+        if 'size' in columns:
+            return
+        self._db.execute('ALTER TABLE responses ADD COLUMN size INTEGER NOT NULL DEFAULT 0')
+        self._db.execute('ALTER TABLE responses ADD COLUMN last_used REAL NOT NULL DEFAULT 0')
+        now = time.time()
+        sizes = []
+        for (url,) in self._db.execute('SELECT url FROM responses').fetchall():
+            try:
+                sizes.append((os.path.getsize(self._body_path(url)), now, url))
+            except OSError:
+                sizes.append((0, 0, url))  # body already gone; pruned as idle
+        self._db.executemany('UPDATE responses SET size = ?, last_used = ? WHERE url = ?', sizes)
+
+    def _body_path(self, url):
+        return os.path.join(self.body_dir, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def _lookup(self, url):
+        """Return (etag, last_modified, content_type, expires, body) or None"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT etag, last_modified, content_type, expires FROM responses WHERE url = ?',
+                (url,)
+            ).fetchone()
+            if row is not None:
+                self._touched[url] = time.time()
+        if row is None:
+            return None
+
+        try:
+            with open(self._body_path(url), 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+        return row + (body,)
+
+    def _store(self, url, response, fresh_for, body=None):
+        """Persist a 200 response body (response.content unless given) and its validators"""
+        headers = response.headers
+        if 'no-store' in headers.get('cache-control', ''):
+            return
+
+        if body is None:
+            body = response.content
+        body_path = self._body_path(url)
+        tmp_path = f"{body_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, body_path)
+
+        now = time.time()
+        with self._lock:
+            previous = self._db.execute(
+                'SELECT size FROM responses WHERE url = ?', (url,)
+            ).fetchone()
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(url, etag, last_modified, content_type, expires, size, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, headers.get('etag'), headers.get('last-modified'),
+                 headers.get('content-type', ''), now + _freshness(headers, fresh_for),
+                 len(body), now)
+            )
+            self._touched.pop(url, None)
+            self._total_bytes += len(body) - (previous[0] if previous else 0)
+            if self._total_bytes > self.max_bytes:
+                self._prune()
+            self._apply_touched()
+            self._db.commit()
+
+    def _apply_touched(self):
+        """Write the last_used times of entries served since the last commit (lock held)"""
+        if self._touched:
+            self._db.executemany(
+                'UPDATE responses SET last_used = ? WHERE url = ?',
+                [(used, url) for url, used in self._touched.items()]
+            )
+            self._touched = {}
+
+    def _prune(self):
+        """Drop idle entries, then LRU ones until under PRUNE_TO of max_bytes (lock held)"""
+        self._apply_touched()
+        victims = []
+        if self.max_idle:
+            victims = self._db.execute(
+                'SELECT url, size FROM responses WHERE last_used < ?',
+                (time.time() - self.max_idle,)
+            ).fetchall()
+
+        remaining = self._total_bytes - sum(size for _, size in victims)
+        target = self.max_bytes * PRUNE_TO
+        if remaining > self.max_bytes:
+            idle = {url for url, _ in victims}
+            for url, size in self._db.execute(
+                    'SELECT url, size FROM responses ORDER BY last_used'):
+                if remaining <= target:
+                    break
+                if url not in idle:
+                    victims.append((url, size))
+                    remaining -= size
+
+        if not victims:
+            return
+        self._db.executemany('DELETE FROM responses WHERE url = ?',
+                             [(url,) for url, _ in victims])
+        self._db.commit()
+        for url, _ in victims:
+            try:
+                os.remove(self._body_path(url))
+            except OSError:
+                pass
+        self._total_bytes = remaining
+        self.evicted += len(victims)
+
+    def _refresh(self, url, headers, fresh_for):
+        """Extend the expiry of an entry after a 304"""
+        with self._lock:
+            self._db.execute(
+                'UPDATE responses SET expires = ? WHERE url = ?',
+                (time.time() + _freshness(headers, fresh_for), url)
+            )
+            self._apply_touched()
+            self._db.commit()
+
+    @staticmethod
+    def _cached_response(url, content_type, body):
+        """Build a requests.Response around a cached body"""
+        response = requests.Response()
+        response.url = url
+        response.status_code = 200
+        response.reason = 'OK'
+        response._content = body
+        response.headers = CaseInsensitiveDict({'content-type': content_type or ''})
+        response.from_cache = True
+        return response
+
+    def get_fresh(self, url):
+        """
+        Serve a URL from cache without touching the network
+
+        Returns:
+            Cached requests.Response if a fresh entry exists, else None
+        """
+        entry = self._lookup(url)
+        if entry is None or entry[3] <= time.time():
+            return None
+        self.hits += 1
+        get_metrics().inc('cache_hits_total', cache='http')
+        return self._cached_response(url, entry[2], entry[4])
+
+    def fetch(self, session, url, timeout=10, fresh_for=0):
+        """
+        GET a URL through the cache
+
+        Args:
+            session: requests.Session used for network requests
+            url: URL to fetch
+            timeout: Request timeout in seconds
+            fresh_for: Minimum seconds a stored entry is served without
+                revalidation (0 = always revalidate)
+
+        Returns:
+            requests.Response; cached responses have from_cache = True
+        """
+        entry = self._lookup(url)
+        request_headers = {}
+
+        if entry is not None:
+            etag, last_modified, content_type, expires, body = entry
+            if expires > time.time():
+                self.hits += 1
+                get_metrics().inc('cache_hits_total', cache='http')
+                return self._cached_response(url, content_type, body)
+
+            if etag:
+                request_headers['If-None-Match'] = etag
+            if last_modified:
+                request_headers['If-Modified-Since'] = last_modified
+
+        response = session.get(url, headers=request_headers, timeout=timeout)
+
+        if response.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            get_metrics().inc('cache_hits_total', cache='http_revalidated')
+            self._refresh(url, response.headers, fresh_for)
+            return self._cached_response(url, entry[2], entry[4])
+
+        self.misses += 1
+        get_metrics().inc('cache_misses_total', cache='http')
+        if response.status_code == 200:
+            self._store(url, response, fresh_for)
+        response.from_cache = False
+        return response
+
+    def stream(self, session, url, timeout=10, fresh_for=0, chunk_size=16384):
+        """
+        Like fetch(), but yield the body in chunks as it arrives
+
+        Cached and revalidated bodies are yielded in one piece; a 200 is
+        streamed from the network and stored once it is complete.
+
+        Raises:
+            requests.HTTPError: For error responses
+        """
+        entry = self._lookup(url)
+        request_headers = {}
+
+        if entry is not None:
+            etag, last_modified, content_type, expires, body = entry
+            if expires > time.time():
+                self.hits += 1
+                get_metrics().inc('cache_hits_total', cache='http')
+                yield body
+                return
+
+            if etag:
+                request_headers['If-None-Match'] = etag
+            if last_modified:
+                request_headers['If-Modified-Since'] = last_modified
+
+        with session.get(url, headers=request_headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304 and entry is not None:
+                self.revalidated += 1
+                get_metrics().inc('cache_hits_total', cache='http_revalidated')
+                self._refresh(url, response.headers, fresh_for)
+                yield entry[4]
+                return
+
+            self.misses += 1
+            get_metrics().inc('cache_misses_total', cache='http')
+            response.raise_for_status()
+            chunks = []
+            for chunk in response.iter_content(chunk_size):
+                chunks.append(chunk)
+                yield chunk
+            if response.status_code == 200:
+                self._store(url, response, fresh_for, body=b''.join(chunks))
+
+    def stats(self):
+        """Hit/revalidation/miss counts"""
+        return {
+            'hits': self.hits,
+            'revalidated': self.revalidated,
+            'misses': self.misses,
+            'evicted': self.evicted,
+            'mb': round(self._total_bytes / (1024 * 1024), 1)
+        }
+
+    def close(self):
+        with self._lock:
+            self._apply_touched()
+            self._db.commit()
+            self._db.close()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_http_cache():
+    """Get the process-wide HTTP cache in DEFAULT_CACHE_DIR"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = HttpCache()
+        return _default_cache
@@ -1,22 +1,370 @@
 """
 Simple web scraper for car images without Selenium
-Uses requests and BeautifulSoup for static content scraping
+Uses requests and a streaming lxml parser for static content scraping
 """
 
 import requests
 from bs4 import BeautifulSoup
+import asyncio
 import os
-import time
-from urllib.parse import urljoin
 
-def scrape_flickr_simple(url, save_dir, limit=50):
+try:
+    from lxml import etree
+except ImportError:  # fall back to BeautifulSoup's pure-Python parser
+    etree = None
+
+from app.metrics import get_metrics
+from scripts.dedup import ImageDeduplicator
+from scripts.downloader import ConcurrentDownloader, DEFAULT_MAX_WORKERS
+from scripts.frontier import CrawlFrontier, DEFAULT_MAX_PAGES
+from scripts.http_cache import get_http_cache, IMAGE_MAX_AGE
+
+# Group pools crawled by scrape_from_multiple_sources
+FLICKR_SOURCES = [
+    "https://www.flickr.com/groups/carexpressions/pool/",
+    "https://www.flickr.com/groups/carphotography/pool/",
+]
+
+# Set up headers to mimic a browser
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1'
+}
+
+
+def normalize_image_url(img_url):
+    """
+    Turn a raw img src into a downloadable large Flickr image URL
+    
+    Args:
+        img_url: Value of the img src/data-src attribute
+    
+    Returns:
+        Normalized URL, or None if the image should be skipped
+    """
+    if not img_url:
+        return None
+    
+    # FIX: Add https: if URL starts with //
+    if img_url.startswith('//'):
+        img_url = 'https:' + img_url
+    
+    # Filter for Flickr CDN images only
+    if not ('staticflickr' in img_url or 'live.staticflickr' in img_url):
+        return None
+    
+    # Skip very small images (thumbnails, icons)
+    if any(size in img_url for size in ['_t.', '_s.', '_q.']):
+        return None
+    
+    # Try to get larger version if available
+    if '_m.' in img_url:
+        img_url = img_url.replace('_m.', '_b.')
+    elif '_n.' in img_url:
+        img_url = img_url.replace('_n.', '_b.')
+    elif '_w.' in img_url:
+        img_url = img_url.replace('_w.', '_b.')
+    
+    return img_url
+
+
+def _img_source(attrs):
+    """Get image source from various possible attributes"""
+    return attrs.get('src') or attrs.get('data-src') or attrs.get('data-defer-src')
+
+
+class _ImageCollector:
+    """
+    lxml parser target collecting image URLs from <img> start tags
+    
+    A parser target gets callbacks instead of building a tree, so the
+    page is never held in memory as a document.
+    """
+    
+    def __init__(self):
+        self.urls = []
+        self.img_tags = 0
+    
+    def start(self, tag, attrib):
+        if tag == 'img':
+            self.img_tags += 1
+            img_url = normalize_image_url(_img_source(attrib))
+            if img_url:
+                self.urls.append(img_url)
+    
+    def end(self, tag):
+        pass
+    
+    def data(self, data):
+        pass
+    
+    def close(self):
+        pass
+    
+    def drain(self):
+        urls, self.urls = self.urls, []
+        return urls
+
+
+def iter_image_urls(chunks):
+    """
+    Incrementally parse a page, yielding image URLs as their tags arrive
+    
+    Args:
+        chunks: Iterable of page body chunks (bytes or str), e.g. straight
+            from a streaming response
+    
+    Yields:
+        Normalized image URLs in page order
+    """
+    if etree is None:
+        yield from extract_image_urls_soup(b''.join(
+            chunk.encode() if isinstance(chunk, str) else chunk for chunk in chunks
+        ))
+        return
+    
+    collector = _ImageCollector()
+    parser = etree.HTMLParser(target=collector)
+    
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from collector.drain()
+    
+    parser.close()
+    yield from collector.drain()
+    print(f"Found {collector.img_tags} img tags")
+
+
+def extract_image_urls(html):
+    """
+    Extract candidate image URLs from a pool page
+    
+    Args:
+        html: Page body (bytes or str)
+    
+    Returns:
+        List of normalized image URLs in page order
+    """
+    return list(iter_image_urls([html]))
+
+
+def extract_image_urls_soup(html):
+    """
+    Reference extractor building a full BeautifulSoup html.parser tree
+    
+    Used when lxml isn't installed, and as the parser benchmark baseline.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # Find all image elements
+    img_tags = soup.find_all('img')
+    print(f"Found {len(img_tags)} img tags")
+    
+    urls = []
+    for img in img_tags:
+        img_url = normalize_image_url(_img_source(img))
+        if img_url:
+            urls.append(img_url)
+    
+    return urls
+
+
+def _is_image(result):
+    """Accept only responses that are actually images"""
+    if 'image' not in result.content_type:
+        print(f"✗ Not an image: {result.content_type}")
+        return False
+    return True
+
+
+def image_extension(result):
+    """Determine file extension from URL and content type"""
+    if '.png' in result.url.lower() or 'png' in result.content_type:
+        return '.png'
+    elif '.jpeg' in result.url.lower():
+        return '.jpeg'
+    return '.jpg'
+
+
+def make_downloader(max_workers=DEFAULT_MAX_WORKERS, use_cache=True):
+    """
+    Build the scraper's downloader
+    
+    Args:
+        max_workers: Concurrent image downloads
+        use_cache: Route requests through the persistent HTTP cache
+    
+    Returns:
+        ConcurrentDownloader
+    """
+    return ConcurrentDownloader(
+        headers=HEADERS,
+        max_workers=max_workers,
+        http_cache=get_http_cache() if use_cache else None,
+        fresh_for=IMAGE_MAX_AGE
+    )
+
+
+def fetch_pool_page(downloader, url):
+    """
+    Fetch a pool page, yielding its image URLs while the body is still
+    arriving
+    
+    The page is always revalidated (If-None-Match / If-Modified-Since),
+    so an unchanged page costs a 304 instead of a full download.
+    """
+    print(f"Fetching page: {url}")
+    with get_metrics().timer('page_fetch'):
+        yield from iter_image_urls(downloader.stream(url, timeout=15, fresh_for=0))
+
+
+def _prune_stale_images(save_dir, keep):
+    """Remove previously saved images that this run didn't overwrite"""
+    for file in os.listdir(save_dir):
+        if file.endswith(('.jpg', '.jpeg', '.png')) and file not in keep:
+            try:
+                os.remove(os.path.join(save_dir, file))
+            except Exception as e:
+                print(f"Could not remove {file}: {e}")
+
+
+def _download_filters(url, downloader, limit, max_pages, dedupe):
+    """
+    Candidate URLs and accept predicate for a scrape
+    
+    URLs come from a crawl frontier over the pool pages of every source,
+    which never queues the same photo twice. With dedupe, near-duplicate
+    images are also rejected after download; rejected images don't
+    count towards the limit.
+    
+    Args:
+        url: Pool URL or list of pool URLs
+    
+    Returns:
+        (urls, accept, CrawlFrontier, ImageDeduplicator or None); pass
+        every yielded download to CrawlFrontier.record()
+    """
+    sources = [url] if isinstance(url, str) else list(url)
+    frontier = CrawlFrontier(lambda page_url: fetch_pool_page(downloader, page_url),
+                             sources, limit, max_pages=max_pages,
+                             prefetch_at=downloader.max_workers)
+    
+    deduplicator = ImageDeduplicator() if dedupe else None
+    
+    def accept(result):
+        return _is_image(result) and (deduplicator is None or deduplicator.accept(result))
+    
+    return frontier.iter_urls(), accept, frontier, deduplicator
+
+
+def _print_crawl_stats(frontier, deduplicator):
+    print(f"Crawl: {frontier.stats()}")
+    if deduplicator is not None:
+        print(f"Duplicates skipped: {deduplicator.stats()}")
+
+
+async def _collect_async(downloader, urls, limit, accept=_is_image, frontier=None):
+    """Drain the asyncio download iterator into a list, crediting the frontier"""
+    results = []
+    async for result in downloader.iter_downloads_async(urls, limit=limit, accept=accept):
+        results.append(result)
+        if frontier is not None:
+            frontier.record(result)
+    return results
+
+
+def iter_flickr_images(url, limit=50, max_workers=DEFAULT_MAX_WORKERS, downloader=None,
+                       use_cache=True, dedupe=True, max_pages=DEFAULT_MAX_PAGES):
+    """
+    Stream images from Flickr pools as they are downloaded
+    
+    Pool pages are followed until `limit` images are found; with several
+    sources the pools are crawled in parallel and the limit is split
+    between them.
+    
+    Args:
+        url: Flickr group pool URL, or a list of them
+        limit: Maximum number of images to yield
+        max_workers: Concurrent image downloads
+        downloader: Optional ConcurrentDownloader to reuse
+        use_cache: Serve repeat images from the persistent HTTP cache
+        dedupe: Skip perceptually near-identical images (the same photo
+            at another size is always skipped)
+        max_pages: Pool pages crawled per source at most
+    
+    Yields:
+        DownloadResult (url, content bytes, content_type) per image,
+        in completion order
+    """
+    owns_downloader = downloader is None
+    if owns_downloader:
+        downloader = make_downloader(max_workers, use_cache)
+    
+    image_urls, accept, frontier, deduplicator = _download_filters(
+        url, downloader, limit, max_pages, dedupe
+    )
+    try:
+        for result in downloader.iter_downloads(image_urls, limit=limit, accept=accept):
+            yield result
+            # Credited once handed on, before the downloader asks for more URLs
+            frontier.record(result)
+    finally:
+        image_urls.close()
+        _print_crawl_stats(frontier, deduplicator)
+        if owns_downloader:
+            downloader.close()
+
+
+def archive_images(results, save_dir, prefix='car_'):
+    """
+    Optional archival sink: write each downloaded image to disk
+    while passing it through unchanged
+    
+    Args:
+        results: Iterable of DownloadResult
+        save_dir: Directory to archive images into
+        prefix: Filename prefix for archived images
+    
+    Yields:
+        The same DownloadResult objects
+    """
+    if not os.path.exists(save_dir):
+        os.makedirs(save_dir)
+    
+    for idx, result in enumerate(results):
+        img_path = os.path.join(save_dir, f'{prefix}{idx}{image_extension(result)}')
+        try:
+            with open(img_path, 'wb') as f:
+                f.write(result.content)
+        except Exception as e:
+            print(f"✗ Error archiving image: {e}")
+        yield result
+
+
+def scrape_flickr_simple(url, save_dir, limit=50, max_workers=DEFAULT_MAX_WORKERS,
+                         mode='threads', downloader=None, use_cache=True, clear_first=False,
+                         dedupe=True, max_pages=DEFAULT_MAX_PAGES):
     """
     Scrape images from Flickr using simple requests (no Selenium)
     
     Args:
-        url: Flickr group pool URL
+        url: Flickr group pool URL, or a list of them crawled in parallel
         save_dir: Directory to save images
         limit: Maximum number of images to scrape
+        max_workers: Concurrent image downloads
+        mode: 'threads' for a thread pool or 'asyncio' for an event loop
+        downloader: Optional ConcurrentDownloader to reuse
+        use_cache: Revalidate the page and reuse cached images instead
+            of downloading them again
+        clear_first: Delete existing images before scraping. Otherwise
+            files are overwritten in place and only leftovers from a
+            previous, larger scrape are pruned at the end.
+        dedupe: Skip near-duplicate photos
+        max_pages: Pool pages crawled per source at most
     
     Returns:
         Number of images successfully scraped
@@ -25,114 +373,53 @@ def scrape_flickr_simple(url, save_dir, limit=50):
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
     
-    # Clear existing images
-    print(f"Clearing existing images from {save_dir}...")
-    for file in os.listdir(save_dir):
-        if file.endswith(('.jpg', '.jpeg', '.png')):
-            try:
-                os.remove(os.path.join(save_dir, file))
-            except Exception as e:
-                print(f"Could not remove {file}: {e}")
+    if clear_first:
+        print(f"Clearing existing images from {save_dir}...")
+        _prune_stale_images(save_dir, keep=set())
     
-    # Set up headers to mimic a browser
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Accept-Encoding': 'gzip, deflate',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1'
-    }
+    owns_downloader = downloader is None
+    if owns_downloader:
+        downloader = make_downloader(max_workers, use_cache)
     
     try:
-        print(f"Fetching page: {url}")
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        
-        print(f"Parsing HTML content...")
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Find all image elements
-        img_tags = soup.find_all('img')
-        print(f"Found {len(img_tags)} img tags")
+        if mode == 'asyncio':
+            image_urls, accept, frontier, deduplicator = _download_filters(
+                url, downloader, limit, max_pages, dedupe
+            )
+            results = asyncio.run(_collect_async(downloader, image_urls, limit, accept,
+                                                 frontier))
+            image_urls.close()
+            _print_crawl_stats(frontier, deduplicator)
+        else:
+            results = iter_flickr_images(url, limit=limit, downloader=downloader, dedupe=dedupe,
+                                         max_pages=max_pages)
         
         count = 0
-        attempted = 0
-        
-        for img in img_tags:
-            if count >= limit:
-                break
-            
-            # Get image source from various possible attributes
-            img_url = (img.get('src') or 
-                      img.get('data-src') or 
-                      img.get('data-defer-src'))
-            
-            if not img_url:
-                continue
-            
-            # FIX: Add https: if URL starts with //
-            if img_url.startswith('//'):
-                img_url = 'https:' + img_url
-            
-            # Filter for Flickr CDN images only
-            if not ('staticflickr' in img_url or 'live.staticflickr' in img_url):
-                continue
-            
-            # Skip very small images (thumbnails, icons)
-            if any(size in img_url for size in ['_t.', '_s.', '_q.']):
-                continue
-            
-            # Try to get larger version if available
-            if '_m.' in img_url:
-                img_url = img_url.replace('_m.', '_b.')
-            elif '_n.' in img_url:
-                img_url = img_url.replace('_n.', '_b.')
-            elif '_w.' in img_url:
-                img_url = img_url.replace('_w.', '_b.')
-            
-            attempted += 1
-            
+        saved = set()
+        for result in results:
             try:
-                print(f"Downloading image {count + 1}/{limit}...")
-                img_response = requests.get(img_url, headers=headers, timeout=10)
-                img_response.raise_for_status()
-                
-                # Check if response is actually an image
-                content_type = img_response.headers.get('content-type', '')
-                if 'image' not in content_type:
-                    print(f"✗ Not an image: {content_type}")
-                    continue
-                
-                # Determine file extension
-                ext = '.jpg'
-                if '.png' in img_url.lower() or 'png' in content_type:
-                    ext = '.png'
-                elif '.jpeg' in img_url.lower():
-                    ext = '.jpeg'
-                
                 # Save image
-                img_path = os.path.join(save_dir, f'car_{count}{ext}')
+                filename = f'car_{count}{image_extension(result)}'
+                img_path = os.path.join(save_dir, filename)
                 with open(img_path, 'wb') as f:
-                    f.write(img_response.content)
+                    f.write(result.content)
                 
-                print(f"✓ Saved: {img_path}")
+                print(f"✓ Saved: {img_path} ({count + 1}/{limit})")
+                saved.add(filename)
                 count += 1
                 
-                # Small delay to be respectful to the server
-                time.sleep(0.5)
-                
-            except requests.exceptions.RequestException as e:
-                print(f"✗ Failed to download image: {e}")
-                continue
             except Exception as e:
                 print(f"✗ Error saving image: {e}")
                 continue
         
+        _prune_stale_images(save_dir, keep=saved)
+        
         print(f"\n{'='*50}")
         print(f"Scraping complete!")
         print(f"Successfully scraped: {count} images")
-        print(f"Attempted downloads: {attempted}")
+        print(f"Attempted downloads: {downloader.attempted}")
+        if downloader.http_cache is not None:
+            print(f"HTTP cache: {downloader.http_cache.stats()}")
         print(f"{'='*50}\n")
         
         return count
@@ -143,37 +430,34 @@ def scrape_flickr_simple(url, save_dir, limit=50):
     except Exception as e:
         print(f"Scraping error: {e}")
         raise Exception(f"Scraping failed: {str(e)}")
+    finally:
+        if owns_downloader:
+            downloader.close()
 
 
-def scrape_from_multiple_sources(save_dir, limit=50):
+def scrape_from_multiple_sources(save_dir, limit=50, sources=None, **kwargs):
     """
     Alternative: Scrape from multiple car image sources
     Can be used as a backup if Flickr scraping fails
-    """
-    sources = [
-        "https://www.flickr.com/groups/carexpressions/pool/",
-        "https://www.flickr.com/groups/carphotography/pool/",
-    ]
     
-    total_scraped = 0
-    per_source = limit // len(sources)
+    All sources are crawled in parallel into one directory, sharing the
+    limit; a source that runs dry leaves its share to the others.
     
-    for source_url in sources:
-        if total_scraped >= limit:
-            break
-        
-        try:
-            scraped = scrape_flickr_simple(
-                url=source_url,
-                save_dir=save_dir,
-                limit=min(per_source, limit - total_scraped)
-            )
-            total_scraped += scraped
-        except Exception as e:
-            print(f"Failed to scrape from {source_url}: {e}")
-            continue
+    Args:
+        save_dir: Directory to save images
+        limit: Maximum number of images across all sources
+        sources: Pool URLs (defaults to FLICKR_SOURCES)
+        **kwargs: Passed through to scrape_flickr_simple()
     
-    return total_scraped
+    Returns:
+        Number of images successfully scraped
+    """
+    return scrape_flickr_simple(
+        url=list(sources or FLICKR_SOURCES),
+        save_dir=save_dir,
+        limit=limit,
+        **kwargs
+    )
 
 
 if __name__ == "__main__":
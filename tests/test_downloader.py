@@ -0,0 +1,190 @@
+"""
+Tests for scripts.downloader against a local HTTP stand-in server
+"""
+
+import asyncio
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from scripts.downloader import ConcurrentDownloader, TokenBucket
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """
+    /img/<name>                    200 with a small body
+    /flaky/<name>?status=N&fails=K N for the first K requests, then 200
+    /slow/<name>?delay=S           200 after S seconds
+    /missing/<name>                404
+    """
+
+    def do_GET(self):
+        server = self.server
+        parsed = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        kind, _, name = parsed.path.strip('/').partition('/')
+
+        with server.lock:
+            server.requests[parsed.path] += 1
+            count = server.requests[parsed.path]
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if kind == 'flaky' and count <= int(query.get('fails', 1)):
+                self._send(int(query.get('status', 503)), b'busy')
+            elif kind == 'slow':
+                time.sleep(float(query.get('delay', 0.1)))
+                self._send(200, name.encode())
+            elif kind == 'missing':
+                self._send(404, b'not found')
+            else:
+                self._send(200, name.encode())
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'image/jpeg' if status == 200 else 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _StandInHandler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.requests = Counter()
+    httpd.in_flight = 0
+    httpd.max_in_flight = 0
+    httpd.base_url = f'http://127.0.0.1:{httpd.server_address[1]}'
+
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_downloader(**kwargs):
+    options = {'rate': None, 'retries': 3, 'backoff': 0.05, 'timeout': 5}
+    options.update(kwargs)
+    return ConcurrentDownloader(**options)
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_retries_with_backoff_then_succeeds(server, status):
+    downloader = make_downloader()
+    start = time.monotonic()
+    result = downloader.fetch(f'{server.base_url}/flaky/a?status={status}&fails=2')
+    elapsed = time.monotonic() - start
+
+    assert result is not None and result.content == b'a'
+    assert server.requests['/flaky/a'] == 3
+    # urllib3 retries the first failure at once, then waits backoff * 2
+    assert elapsed >= 0.1
+    downloader.close()
+
+
+def test_gives_up_after_retries(server):
+    downloader = make_downloader(retries=1)
+    assert downloader.fetch(f'{server.base_url}/flaky/b?status=503&fails=10') is None
+    assert server.requests['/flaky/b'] == 2
+    downloader.close()
+
+
+def test_per_host_cap_limits_concurrency(server):
+    downloader = make_downloader(max_workers=8, per_host=2)
+    urls = [f'{server.base_url}/slow/{idx}?delay=0.1' for idx in range(8)]
+
+    results = list(downloader.iter_downloads(urls))
+
+    assert len(results) == 8
+    assert server.max_in_flight == 2
+    downloader.close()
+
+
+def test_token_bucket_paces_requests():
+    bucket = TokenBucket(rate=20, capacity=1)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # The first token is available at once, each further one after 1/20 s
+    assert time.monotonic() - start >= 5 / 20 * 0.9
+
+
+def test_token_bucket_disabled_does_not_wait():
+    bucket = TokenBucket(rate=None)
+    start = time.monotonic()
+    for _ in range(100):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05
+
+
+def test_downloader_rate_limit(server):
+    downloader = make_downloader(max_workers=4, rate=20, burst=1)
+    urls = [f'{server.base_url}/img/{idx}' for idx in range(6)]
+    start = time.monotonic()
+    assert len(list(downloader.iter_downloads(urls))) == 6
+    assert time.monotonic() - start >= 5 / 20 * 0.9
+    downloader.close()
+
+
+def _candidate_urls(server):
+    # Failures and rejected (odd) images must be replaced by later candidates
+    urls = []
+    for idx in range(20):
+        if idx % 5 == 4:
+            urls.append(f'{server.base_url}/missing/{idx}')
+        else:
+            urls.append(f'{server.base_url}/img/{idx}')
+    return urls
+
+
+def _is_even(result):
+    return int(result.content) % 2 == 0
+
+
+def test_iter_downloads_refills_until_limit(server):
+    downloader = make_downloader(max_workers=3)
+    results = list(downloader.iter_downloads(_candidate_urls(server), limit=5, accept=_is_even))
+
+    assert len(results) == 5
+    assert all(_is_even(result) for result in results)
+    # Only as many requests as needed: never the whole candidate list
+    assert 5 < downloader.attempted < 20
+    downloader.close()
+
+
+def test_iter_downloads_without_limit_drains_candidates(server):
+    downloader = make_downloader(max_workers=3)
+    results = list(downloader.iter_downloads(_candidate_urls(server)))
+    assert len(results) == 16
+    assert downloader.attempted == 20
+    downloader.close()
+
+
+def test_iter_downloads_async(server):
+    downloader = make_downloader(max_workers=3, per_host=2)
+
+    async def collect():
+        return [result async for result in
+                downloader.iter_downloads_async(_candidate_urls(server), limit=5,
+                                                accept=_is_even)]
+
+    results = asyncio.run(collect())
+
+    assert len(results) == 5
+    assert all(_is_even(result) for result in results)
+    assert downloader.attempted < 20
+    assert server.max_in_flight <= 2
+    downloader.close()
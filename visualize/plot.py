@@ -1,65 +1,258 @@
 """
 Visualization module for creating brand distribution charts
+Charts are drawn on pre-built figure templates (no pyplot), rendered into
+memory as PNG, SVG or JSON for client-side rendering, and memoized by
+their brand counts
 """
 
-import matplotlib.pyplot as plt
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend for server deployment
-import os
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from app.metrics import get_metrics
+
+CHART_KINDS = ('bar', 'pie')
+# Formats served over HTTP; render() also takes anything savefig can write
+CHART_FORMATS = ('png', 'svg', 'json')
+CHART_MIMETYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+    'json': 'application/json'
+}
+
+DEFAULT_DPI = 150
+# Rendered charts kept in memory, keyed by (kind, format, brand counts)
+DEFAULT_CACHE_ENTRIES = 128
+
+
+def _sorted_counts(brand_counts):
+    """Brands and counts by count (descending), ties broken by name"""
+    sorted_brands = sorted(brand_counts.items(), key=lambda x: (-x[1], x[0]))
+    brands = [item[0] for item in sorted_brands]
+    counts = [item[1] for item in sorted_brands]
+    return brands, counts
+
+
+class _BarTemplate:
+    """Bar chart figure whose axes, labels and grid are built once"""
+
+    title = 'Car Brand Detection Results'
+
+    def __init__(self):
+        self.figure = Figure(figsize=(12, 6))
+        FigureCanvasAgg(self.figure)
+        # Fixed margins instead of tight_layout/bbox_inches='tight' on every
+        # render; the bottom margin leaves room for rotated brand labels
+        self.figure.subplots_adjust(left=0.07, right=0.98, top=0.88, bottom=0.2)
+
+        self.ax = self.figure.add_subplot()
+        self.ax.set_xlabel('Car Brand', fontsize=14, fontweight='bold')
+        self.ax.set_ylabel('Number of Detections', fontsize=14, fontweight='bold')
+        self.ax.set_title(self.title, fontsize=16, fontweight='bold', pad=20)
+        self.ax.grid(axis='y', alpha=0.3, linestyle='--')
+        self._artists = []
+
+    def draw(self, brands, counts):
+        for artist in self._artists:
+            artist.remove()
+
+        # Numeric positions: string categories would accumulate across renders
+        positions = range(len(brands))
+        bars = self.ax.bar(positions, counts, color='#667eea', edgecolor='#764ba2', linewidth=2)
+        labels = self.ax.bar_label(bars, fmt='%d', fontsize=11, fontweight='bold')
+        self._artists = [bars, *labels]
+
+        # Rotate x-axis labels if many brands
+        if len(brands) > 5:
+            self.ax.set_xticks(positions, brands, rotation=45, ha='right')
+        else:
+            self.ax.set_xticks(positions, brands, rotation=0, ha='center')
+
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+
+class _PieTemplate:
+    """Pie chart figure whose title and aspect are built once"""
+
+    title = 'Car Brand Distribution'
+
+    def __init__(self):
+        self.figure = Figure(figsize=(10, 8))
+        FigureCanvasAgg(self.figure)
+        self.figure.subplots_adjust(left=0.05, right=0.95, top=0.9, bottom=0.05)
+
+        self.ax = self.figure.add_subplot()
+        self.ax.set_title(self.title, fontsize=16, fontweight='bold', pad=20)
+        self._colors = matplotlib.colormaps['Set3']
+        self._artists = []
+
+    def draw(self, brands, counts):
+        for artist in self._artists:
+            artist.remove()
+
+        wedges, texts, autotexts = self.ax.pie(
+            counts, labels=brands, autopct='%1.1f%%', startangle=90,
+            colors=self._colors(range(len(brands))),
+            textprops={'fontsize': 12, 'fontweight': 'bold'}
+        )
+        self._artists = [*wedges, *texts, *autotexts]
+        self.ax.axis('equal')
+
+
+_TEMPLATES = {
+    'bar': _BarTemplate,
+    'pie': _PieTemplate,
+}
+
+
+class ChartRenderer:
+    """
+    Renders brand charts into memory.
+
+    Each chart kind has one figure template that is redrawn in place
+    (rendering is serialized per renderer), and outputs are memoized in an
+    LRU keyed by kind, format and brand counts, so repeated results cost a
+    dictionary lookup.
+    """
+
+    def __init__(self, dpi=DEFAULT_DPI, max_entries=DEFAULT_CACHE_ENTRIES):
+        self.dpi = dpi
+        self.max_entries = max_entries
+
+        self._templates = {}
+        self._render_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(brand_counts, kind, fmt):
+        return kind, fmt, tuple(sorted(brand_counts.items()))
+
+    def render(self, brand_counts, kind='bar', fmt='png'):
+        """
+        Render a chart
+
+        Args:
+            brand_counts: Dictionary mapping brand names to counts
+            kind: One of CHART_KINDS
+            fmt: One of CHART_FORMATS, or any other format matplotlib's
+                savefig supports (e.g. 'jpg', 'pdf'); 'json' returns the
+                chart data for client-side rendering
+
+        Returns:
+            Encoded chart as bytes
+        """
+        if kind not in CHART_KINDS:
+            raise ValueError(f"Unknown chart kind '{kind}', expected one of {CHART_KINDS}")
+        if fmt not in CHART_FORMATS and fmt not in FigureCanvasAgg.get_supported_filetypes():
+            raise ValueError(f"Unknown chart format '{fmt}', expected one of {CHART_FORMATS} "
+                             f"or a format matplotlib can save")
+
+        key = self.make_key(brand_counts, kind, fmt)
+        with self._cache_lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                get_metrics().inc('cache_hits_total', cache='chart')
+                return data
+            self.misses += 1
+        get_metrics().inc('cache_misses_total', cache='chart')
+
+        brands, counts = _sorted_counts(brand_counts)
+        if fmt == 'json':
+            data = json.dumps({
+                'kind': kind,
+                'title': _TEMPLATES[kind].title,
+                'labels': brands,
+                'values': counts,
+                'total': sum(counts)
+            }).encode('utf-8')
+        else:
+            data = self._draw(kind, fmt, brands, counts)
+
+        with self._cache_lock:
+            self._cache[key] = data
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return data
+
+    def _draw(self, kind, fmt, brands, counts):
+        with self._render_lock, get_metrics().timer('chart_render'):
+            template = self._templates.get(kind)
+            if template is None:
+                template = self._templates[kind] = _TEMPLATES[kind]()
+
+            template.draw(brands, counts)
+            buffer = io.BytesIO()
+            template.figure.savefig(buffer, format=fmt, dpi=self.dpi)
+            return buffer.getvalue()
+
+    def stats(self):
+        with self._cache_lock:
+            return {'entries': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_chart_renderer():
+    """Get the process-wide ChartRenderer"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = ChartRenderer()
+        return _renderer
+
+
+def render_chart(brand_counts, kind='bar', fmt='png'):
+    """Render a chart to bytes with the shared renderer (see ChartRenderer.render)"""
+    return get_chart_renderer().render(brand_counts, kind, fmt)
+
+
+def _save_chart(brand_counts, output_path, kind):
+    """Render a chart in the format implied by the file extension and save it"""
+    fmt = os.path.splitext(output_path)[1].lstrip('.').lower() or 'png'
+    data = render_chart(brand_counts, kind, fmt)
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    with open(output_path, 'wb') as f:
+        f.write(data)
+
 
 def create_brand_chart(brand_counts, output_path='static/brand_chart.png'):
     """
     Create a bar chart showing car brand distribution
-    
+
     Args:
         brand_counts: Dictionary mapping brand names to counts
-        output_path: Path where the chart image will be saved
+        output_path: Path where the chart will be saved; the extension
+            picks the format (.json or anything matplotlib can save)
     """
     if not brand_counts:
         print("No brand data to visualize")
         return
-    
-    # Sort brands by count (descending)
-    sorted_brands = sorted(brand_counts.items(), key=lambda x: x[1], reverse=True)
-    brands = [item[0] for item in sorted_brands]
-    counts = [item[1] for item in sorted_brands]
-    
-    # Create figure and axis
-    plt.figure(figsize=(12, 6))
-    
-    # Create bar chart
-    bars = plt.bar(brands, counts, color='#667eea', edgecolor='#764ba2', linewidth=2)
-    
-    # Customize the chart
-    plt.xlabel('Car Brand', fontsize=14, fontweight='bold')
-    plt.ylabel('Number of Detections', fontsize=14, fontweight='bold')
-    plt.title('Car Brand Detection Results', fontsize=16, fontweight='bold', pad=20)
-    
-    # Add value labels on top of bars
-    for bar in bars:
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2., height,
-                f'{int(height)}',
-                ha='center', va='bottom', fontsize=11, fontweight='bold')
-    
-    # Rotate x-axis labels if many brands
-    if len(brands) > 5:
-        plt.xticks(rotation=45, ha='right')
-    
-    # Add grid for better readability
-    plt.grid(axis='y', alpha=0.3, linestyle='--')
-    
-    # Adjust layout to prevent label cutoff
-    plt.tight_layout()
-    
-    # Save the chart
-    output_dir = os.path.dirname(output_path)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    plt.savefig(output_path, dpi=150, bbox_inches='tight')
-    plt.close()
-    
+
+    _save_chart(brand_counts, output_path, 'bar')
     print(f"✓ Chart saved to: {output_path}")
 
 
@@ -69,25 +262,8 @@ def create_pie_chart(brand_counts, output_path='static/brand_pie_chart.png'):
     """
     if not brand_counts:
         return
-    
-    sorted_brands = sorted(brand_counts.items(), key=lambda x: x[1], reverse=True)
-    brands = [item[0] for item in sorted_brands]
-    counts = [item[1] for item in sorted_brands]
-    
-    plt.figure(figsize=(10, 8))
-    
-    colors = plt.cm.Set3(range(len(brands)))
-    
-    plt.pie(counts, labels=brands, autopct='%1.1f%%', startangle=90,
-            colors=colors, textprops={'fontsize': 12, 'fontweight': 'bold'})
-    
-    plt.title('Car Brand Distribution', fontsize=16, fontweight='bold', pad=20)
-    plt.axis('equal')
-    
-    plt.tight_layout()
-    plt.savefig(output_path, dpi=150, bbox_inches='tight')
-    plt.close()
-    
+
+    _save_chart(brand_counts, output_path, 'pie')
     print(f"✓ Pie chart saved to: {output_path}")
 
 
@@ -100,6 +276,6 @@ if __name__ == "__main__":
         'Ford': 8,
         'Mercedes': 5
     }
-    
+
     create_brand_chart(test_data, '../static/test_chart.png')
     print("Test chart created successfully!")